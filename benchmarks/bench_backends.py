@@ -0,0 +1,124 @@
+"""
+Compare images/sec of the Roboflow HTTP backend and the local ONNX backend.
+
+The trained weights are not in the repository (``runs/detect/train`` only
+keeps the training plots), so export the ONNX model first from the
+``best.pt`` of the YOLOv8s training run -- this needs ``pip install
+ultralytics`` -- and place it at the default path::
+
+    yolo export model=detectFloodVictims/runs/detect/train/weights/best.pt format=onnx dynamic=True imgsz=640
+
+Then run from the repository root::
+
+    python -m benchmarks.bench_backends --api-key $ROBOFLOW_API_KEY --batch-size 8 --output backends.json
+
+Without an API key the HTTP path runs against the local mock upstream in
+``benchmarks.mock_roboflow`` with ``--latency-ms`` of injected latency, which
+measures the client side (encode, pooled POST, decode) plus that latency.
+Without the ONNX file the ONNX path is reported as skipped with the reason.
+HTTP is measured one image at a time, as the page sends them, and with
+``--concurrency`` requests in flight, as the pipeline and service do.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_pipeline import current_commit  # noqa: E402
+from benchmarks.mock_roboflow import create_app, run_in_background  # noqa: E402
+from utils.backends import DEFAULT_ONNX_PATH, OnnxBackend, RemoteBackend  # noqa: E402
+from utils.clients import ROBOFLOW_API_URL, InferenceClient, PooledSession  # noqa: E402
+from utils.detector import VICTIM_MODEL_ID  # noqa: E402
+from utils.pipeline import list_directory  # noqa: E402
+
+
+def load_images(directory, limit=None):
+    paths = list_directory(directory)[:limit]
+    return [ImageOps.fit(Image.open(path).convert("RGB"), (640, 640)) for path in paths]
+
+
+def bench(backend, images, batch_size, warmup=1):
+    """Return images/sec and per-batch latencies for ``backend`` over ``images``."""
+    backend.predict_batch(images[:batch_size] * warmup)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        t0 = time.perf_counter()
+        backend.predict_batch(images[i:i + batch_size])
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    return {
+        "images": len(images),
+        "batch_size": batch_size,
+        "seconds": round(elapsed, 3),
+        "images_per_sec": round(len(images) / elapsed, 2),
+        "mean_batch_ms": round(1000 * sum(latencies) / len(latencies), 1),
+    }
+
+
+def bench_concurrent(backend, images, workers):
+    """Images/sec with ``workers`` single-image requests in flight."""
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(backend.predict, images[:workers]))
+        start = time.perf_counter()
+        list(pool.map(backend.predict, images))
+        elapsed = time.perf_counter() - start
+    return {"images": len(images), "concurrency": workers, "seconds": round(elapsed, 3),
+            "images_per_sec": round(len(images) / elapsed, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", default="detectFloodVictims/test_images")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--onnx", default=DEFAULT_ONNX_PATH)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--api-key", default=os.environ.get("ROBOFLOW_API_KEY"))
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="Mock upstream latency without an API key")
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--concurrency", type=int, default=8, help="HTTP requests in flight")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.limit)
+    report = {"commit": current_commit(), "images": len(images)}
+    if os.path.exists(args.onnx):
+        backend = OnnxBackend(args.onnx, num_threads=args.threads)
+        report["onnx_batch1"] = bench(backend, images, 1)
+        report[f"onnx_batch{args.batch_size}"] = bench(backend, images, args.batch_size)
+    else:
+        report["onnx"] = {"skipped": f"{args.onnx} not found; export it as described in this module's docstring"}
+
+    stop = None
+    if args.api_key:
+        api_key, url = args.api_key, ROBOFLOW_API_URL
+        report["http_upstream"] = url
+    else:
+        url, stop = run_in_background(create_app(args.latency_ms, args.jitter_ms))
+        api_key = "mock"
+        report["http_upstream"] = f"mock, {args.latency_ms:g}+-{args.jitter_ms:g} ms"
+    try:
+        client = InferenceClient(api_key, api_url=url, session=PooledSession(pool_size=args.concurrency))
+        backend = RemoteBackend(client, VICTIM_MODEL_ID)
+        report["http"] = bench(backend, images, 1)
+        report[f"http_concurrent{args.concurrency}"] = bench_concurrent(backend, images, args.concurrency)
+    finally:
+        if stop is not None:
+            stop()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Inference calls avoided by the near-duplicate filter.
+
+Runs ``detectFloodVictims/test_images`` through the Save Victims detector
+(both models, detection cache, near-duplicate index) against the local mock
+upstream and counts the calls that actually reached it. ``test_images`` is
+run as it ships, then as a simulated sortie: every image followed by
+near-identical frames -- recompressed, re-exposed and drifted by a few
+pixels -- in shuffled order. Each run is repeated with the index switched
+off, and reused results are checked against the frame's source image to
+count any wrong matches. Pairwise hash distances between the distinct images
+show the margin below which nothing is merged::
+
+    python -m benchmarks.bench_dedupe --variants 4 --output dedupe.json
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_pipeline import current_commit  # noqa: E402
+from benchmarks.mock_roboflow import create_app, run_in_background  # noqa: E402
+from utils.cache import DetectionCache, cache_key  # noqa: E402
+from utils.clients import InferenceClient, PooledSession  # noqa: E402
+from utils.dedupe import DEFAULT_MAX_DISTANCE, NearDuplicateIndex, hamming, phash_batch  # noqa: E402
+from utils.detector import VICTIM_MODEL_ID, remote_detector  # noqa: E402
+from utils.pipeline import list_directory  # noqa: E402
+from utils.preprocess import load_image  # noqa: E402
+
+
+def variant(image, kind, rng):
+    """A near-identical copy of ``image``, as a drone's next frame or a re-shared photo would be."""
+    if kind == "recompressed":
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=rng.randint(50, 80))
+        return Image.open(io.BytesIO(buffer.getvalue())).convert("RGB")
+    if kind == "exposure":
+        return ImageEnhance.Brightness(image).enhance(rng.uniform(0.9, 1.1))
+    dx, dy = rng.randint(0, 12), rng.randint(0, 12)
+    return image.crop((dx, dy, image.width - 12 + dx, image.height - 12 + dy)).resize(image.size)
+
+
+def sortie(images, per_image, seed=0):
+    """``(source index, image)`` pairs: every original plus ``per_image`` variants, shuffled."""
+    rng = random.Random(seed)
+    frames = [(i, image) for i, image in enumerate(images)]
+    kinds = ["recompressed", "exposure", "drift"]
+    frames += [(i, variant(image, kinds[n % len(kinds)], rng)) for i, image in enumerate(images)
+               for n in range(per_image)]
+    rng.shuffle(frames)
+    return frames
+
+
+def replay(url, frames, dedupe_distance):
+    """Cache and index counters for one pass over ``frames``, with any reuse across source images."""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = DetectionCache(os.path.join(tmp, "detections.sqlite3"))
+        index = NearDuplicateIndex(os.path.join(tmp, "dedupe.sqlite3"), dedupe_distance) \
+            if dedupe_distance is not None else None
+        detector = remote_detector(InferenceClient("bench", url, session=PooledSession()), cache, dedupe=index)
+        sources, wrong = {}, 0
+        for source, frame in frames:
+            image = load_image(_as_file(frame))
+            if index is not None and cache.get(cache_key(image.digest, VICTIM_MODEL_ID)) is None:
+                # The nearest match is the one the backend is about to reuse
+                matches = index.matches(image)
+                wrong += bool(matches) and sources.get(matches[0], source) != source
+            detector.detect(image)
+            sources.setdefault(image.digest, source)
+        report = {"frames": len(frames)}
+        if index is not None:
+            report["dedupe"] = index.stats()
+            report["wrong_reuses"] = int(wrong)
+            report["reopened_index_size"] = NearDuplicateIndex(index.path, dedupe_distance).tree.size
+    return report
+
+
+def _as_file(image):
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    buffer.seek(0)
+    return buffer
+
+
+def run(args):
+    paths = list_directory(args.images)
+    images = [load_image(path).image for path in paths]
+    hashes = [int(h) for h in phash_batch(images)]
+    distances = [hamming(a, b) for i, a in enumerate(hashes) for b in hashes[i + 1:]]
+
+    app = create_app(latency_ms=args.latency_ms, jitter_ms=0)
+    url, stop = run_in_background(app)
+    results = {}
+    try:
+        for name, frames in (("test_images", [(i, image) for i, image in enumerate(images)]),
+                             ("sortie", sortie(images, args.variants))):
+            results[name] = {}
+            for label, distance in (("cache_only", None), ("near_duplicate_filter", args.max_distance)):
+                before = app["stats"]["requests"]
+                report = replay(url, frames, distance)
+                report["upstream_calls"] = app["stats"]["requests"] - before
+                results[name][label] = report
+            off = results[name]["cache_only"]["upstream_calls"]
+            on = results[name]["near_duplicate_filter"]["upstream_calls"]
+            results[name]["calls_avoided"] = off - on
+            results[name]["calls_avoided_share"] = round((off - on) / off, 3) if off else 0.0
+    finally:
+        stop()
+    return {
+        "commit": current_commit(),
+        "config": {"images": len(paths), "variants_per_image": args.variants, "max_distance": args.max_distance},
+        "distinct_image_distance": {"min": min(distances), "p5": float(np.percentile(distances, 5)),
+                                    "median": float(np.median(distances))},
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", default="detectFloodVictims/test_images")
+    parser.add_argument("--variants", type=int, default=4, help="Near-identical frames per image in the sortie")
+    parser.add_argument("--max-distance", type=int, default=DEFAULT_MAX_DISTANCE)
+    parser.add_argument("--latency-ms", type=float, default=10.0)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    text = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Query latency of the geotagged detection store at millions of rows.
+
+Fills a temporary ``DetectionStore`` with synthetic detections spread over a
+flood region and a time span, compacts it, then times the page's queries --
+radius around a point for the last hour, a district box for the last day, a
+whole-period count and the map's grid cells -- against a plain NumPy scan of
+the same columns. Also reports append and compaction throughput, the Parquet
+size and the time to reopen the store, and replays the appends once more with
+the default flush thresholds to show per-append latency while runs are
+sorted and merged in the background::
+
+    python -m benchmarks.bench_detection_store --rows 2000000 --output store.json
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_pipeline import current_commit, percentiles  # noqa: E402
+from utils.detection_store import DetectionStore  # noqa: E402
+from utils.routing import haversine  # noqa: E402
+
+LABELS = ["person", "animal", "flood", "level 1", "level 2", "level 3"]
+# Roughly Maharashtra and its neighbours
+REGION = (15.5, 72.5, 21.5, 80.5)
+
+
+def synthetic(rows, hours, seed=0):
+    rng = np.random.default_rng(seed)
+    south, west, north, east = REGION
+    # Detections cluster around a few hundred sites, as sorties over flooded villages do
+    sites = np.column_stack([rng.uniform(south, north, 400), rng.uniform(west, east, 400)])
+    site = rng.integers(0, len(sites), rows)
+    return {
+        "lat": sites[site, 0] + rng.normal(0, 0.02, rows),
+        "lon": sites[site, 1] + rng.normal(0, 0.02, rows),
+        "label": rng.choice(LABELS, rows, p=[0.45, 0.2, 0.2, 0.05, 0.05, 0.05]),
+        "confidence": rng.uniform(0.4, 1.0, rows).astype(np.float32),
+        "age": rng.uniform(0, hours * 3600, rows),
+    }
+
+
+def timed(fn, repeat):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - started)
+    return result, percentiles(latencies)
+
+
+def background_ingest(data, batches, now):
+    """Append every batch to a store with the default flush thresholds, timing each ``add``."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = DetectionStore(tmp)
+        latencies = []
+        started = time.perf_counter()
+        for batch in batches:
+            t0 = time.perf_counter()
+            store.add(data["lat"][batch], data["lon"][batch], data["label"][batch].tolist(),
+                      data["confidence"][batch], now - data["age"][batch[0]])
+            latencies.append(time.perf_counter() - t0)
+        append_s = time.perf_counter() - started
+        store.compact()
+        return {"append_rows_per_sec": round(len(data["lat"]) / append_s), "add": percentiles(latencies),
+                "rows_flushed": store.total(), "drain_s": round(time.perf_counter() - started - append_s, 3)}
+
+
+def scan(data, now, since=None, bbox=None, centre=None, radius_m=None):
+    """The same query as a full NumPy scan, for comparison."""
+    keep = np.ones(len(data["lat"]), dtype=bool)
+    if since is not None:
+        keep &= now - data["age"] >= since
+    if bbox is not None:
+        keep &= (data["lat"] >= bbox[0]) & (data["lat"] <= bbox[2]) & (data["lon"] >= bbox[1]) & \
+                (data["lon"] <= bbox[3])
+    if centre is not None:
+        keep &= haversine(centre[0], centre[1], data["lat"], data["lon"]) <= radius_m
+    names, counts = np.unique(data["label"][keep], return_counts=True)
+    return dict(zip(names.tolist(), counts.tolist()))
+
+
+def run(args):
+    data = synthetic(args.rows, args.hours)
+    now = time.time()
+    # Appends arrive as one record batch per sortie, each with its own timestamp
+    order = np.argsort(-data["age"], kind="stable")
+    data = {name: values[order] for name, values in data.items()}
+    batches = np.array_split(np.arange(args.rows), args.batches)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = DetectionStore(tmp, compact_segments=10 ** 9, compact_rows=10 ** 12)
+        started = time.perf_counter()
+        for batch in batches:
+            timestamp = now - data["age"][batch[0]]
+            data["age"][batch] = data["age"][batch[0]]
+            store.add(data["lat"][batch], data["lon"][batch], data["label"][batch].tolist(),
+                      data["confidence"][batch], timestamp)
+        append_s = time.perf_counter() - started
+        started = time.perf_counter()
+        store.compact()
+        compact_s = time.perf_counter() - started
+        size = sum(os.path.getsize(name) for name in glob.glob(os.path.join(tmp, "runs", "*")))
+        started = time.perf_counter()
+        DetectionStore(tmp)
+        reopen_s = time.perf_counter() - started
+        ingest = background_ingest(data, batches, now)
+
+        centre = (float(data["lat"][-1]), float(data["lon"][-1]))
+        queries = {
+            "radius_2km_last_hour": {"since": now - 3600, "centre": centre, "radius_m": 2000},
+            "radius_2km_last_day": {"since": now - 24 * 3600, "centre": centre, "radius_m": 2000},
+            "district_box_last_day": {"since": now - 24 * 3600,
+                                      "bbox": (centre[0] - 0.25, centre[1] - 0.25, centre[0] + 0.25, centre[1] + 0.25)},
+            "whole_region_last_hour": {"since": now - 3600},
+            "whole_period": {},
+        }
+        results = {}
+        for name, query in queries.items():
+            counts, store_latency = timed(lambda: store.counts(**query), args.repeat)
+            expected, scan_latency = timed(lambda: scan(data, now, **query), max(1, args.repeat // 5))
+            results[name] = {"matches": sum(counts.values()), "correct": counts == expected,
+                             "store": store_latency, "numpy_scan": scan_latency}
+        cells, cell_latency = timed(lambda: store.cells(12, since=now - 24 * 3600), args.repeat)
+        results["map_cells_last_day"] = {"cells": len(cells), "store": cell_latency}
+
+    return {
+        "commit": current_commit(),
+        "config": {"rows": args.rows, "hours": args.hours, "batches": args.batches, "repeat": args.repeat},
+        "append_rows_per_sec": round(args.rows / append_s),
+        "compact_s": round(compact_s, 3),
+        "runs_mb": round(size / 2 ** 20, 1),
+        "reopen_s": round(reopen_s, 3),
+        "ingest_with_background_merges": ingest,
+        "queries": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--hours", type=int, default=7 * 24, help="Time span the detections are spread over")
+    parser.add_argument("--batches", type=int, default=2000, help="Record batches the rows arrive in")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    text = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+End-to-end latency benchmark for the victim pipeline, geocoding and weather.
+
+Replays ``detectFloodVictims/test_images`` through the same path the Save
+Victims page takes -- decode and fit, one shared JPEG payload, the victim and
+water-level models called in parallel, the summary -- against the local mock
+upstream in ``benchmarks.mock_roboflow``, with injected latency and errors.
+The geocoder and the weather cache are driven against the same stubs.
+
+Reports cold (first pass: fresh connections, empty caches) and warm latency
+percentiles, throughput at each concurrency level, per-stage timings and peak
+RSS, as JSON tagged with the current commit. Fully offline::
+
+    python -m benchmarks.bench_pipeline --latency-ms 80 --error-rate 0.01 --output bench.json
+    python -m benchmarks.bench_pipeline --baseline bench.json   # also print changes against an earlier run
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_roboflow import create_app, run_in_background  # noqa: E402
+from utils import metrics  # noqa: E402
+from utils.cache import DetectionCache  # noqa: E402
+from utils.clients import InferenceClient, PooledSession  # noqa: E402
+from utils.detector import remote_detector, summarize  # noqa: E402
+from utils.geocode import Geocoder  # noqa: E402
+from utils.pipeline import list_directory  # noqa: E402
+from utils.preprocess import load_image  # noqa: E402
+from utils.weather import WeatherCache, fetch_weather  # noqa: E402
+
+PLACES = [
+    "Mumbai", "Pune", "Nashik", "Thane", "Kolhapur", "Sangli", "Satara", "Ratnagiri", "Chennai", "Cuddalore",
+    "Guwahati", "Dibrugarh", "Silchar", "Patna", "Darbhanga", "Muzaffarpur", "Kochi", "Alappuzha", "Thrissur",
+    "Wayanad", "Surat", "Vadodara", "Bharuch", "Kolkata", "Howrah", "Bhubaneswar", "Cuttack", "Puri",
+    "Hyderabad", "Vijayawada", "Srinagar", "Jammu", "Shimla", "Kullu", "Dehradun", "Haridwar", "Lucknow",
+    "Gorakhpur", "Prayagraj", "Varanasi",
+]
+
+
+def percentiles(latencies):
+    """Count, mean and p50/p95/p99 in milliseconds."""
+    latencies = np.asarray(latencies, dtype=np.float64)
+    if not len(latencies):
+        return {"n": 0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "n": len(latencies),
+        "mean_ms": round(1000 * float(latencies.mean()), 2),
+        "p50_ms": round(1000 * float(p50), 2),
+        "p95_ms": round(1000 * float(p95), 2),
+        "p99_ms": round(1000 * float(p99), 2),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, or None where it cannot be read."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def replay(fn, items, concurrency):
+    """Call ``fn`` on every item from ``concurrency`` threads; return latencies, errors and wall time."""
+    def call(item):
+        started = time.perf_counter()
+        try:
+            fn(item)
+            return time.perf_counter() - started, None
+        except Exception as e:
+            return time.perf_counter() - started, type(e).__name__
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, items))
+    elapsed = time.perf_counter() - started
+    latencies = [seconds for seconds, error in results if error is None]
+    errors = [error for _, error in results if error is not None]
+    return latencies, errors, elapsed
+
+
+def phase(fn, items, concurrency=1):
+    latencies, errors, elapsed = replay(fn, items, concurrency)
+    return {**percentiles(latencies), "errors": len(errors),
+            "requests_per_sec": round(len(latencies) / elapsed, 1) if elapsed else None}
+
+
+def bench_victims(url, paths, levels, requests):
+    """Cold, warm, cached and concurrent runs of decode + both models + summary."""
+    session = PooledSession(pool_size=2 * max(levels))
+    detector = remote_detector(InferenceClient("bench", url, session=session))
+
+    def process(path):
+        victims, water_level = detector.detect(load_image(path))
+        return summarize(victims, water_level)
+
+    report = {"images": len(paths)}
+    report["cold"] = phase(process, paths)
+    report["warm"] = phase(process, paths)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cached = remote_detector(InferenceClient("bench", url, session=session),
+                                 DetectionCache(os.path.join(tmp, "detections.sqlite3")))
+        phase(lambda path: cached.detect(load_image(path)), paths)
+        report["cache_hits"] = phase(lambda path: cached.detect(load_image(path)), paths)
+
+    workload = [paths[i % len(paths)] for i in range(max(requests, len(paths)))]
+    report["concurrency"] = [{"clients": level, **phase(process, workload, level)} for level in levels]
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def bench_geocode(url, names):
+    """Upstream misses on the first pass, SQLite hits on the second."""
+    with tempfile.TemporaryDirectory() as tmp:
+        geocoder = Geocoder(os.path.join(tmp, "geocode.sqlite3"), rate=1e6, api_url=url)
+        report = {"names": len(names), "cold": phase(geocoder.lookup, names), "warm": phase(geocoder.lookup, names)}
+        report["upstream_calls"] = geocoder.stats["upstream"]
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def bench_weather(url, cities, levels):
+    """Misses on the first pass, in-memory hits afterwards; concurrent readers of one cold city coalesce."""
+    cache = WeatherCache(lambda city: fetch_weather(city, "bench", url))
+    report = {"cities": len(cities), "cold": phase(cache.get, cities), "warm": phase(cache.get, cities)}
+    stampede = WeatherCache(lambda city: fetch_weather(city, "bench", url))
+    report["stampede"] = {"clients": max(levels), **phase(stampede.get, ["Mumbai"] * max(levels), max(levels)),
+                          "upstream_calls": stampede.stats()["upstream"]}
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def flatten(report, prefix=""):
+    for key, value in report.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict) and "clients" in item:
+                    yield from flatten(item, f"{prefix}{key}[{item['clients']}].")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield prefix + key, value
+
+
+def compare(baseline, report):
+    """Relative change of every latency, throughput and memory figure against ``baseline``."""
+    before = dict(flatten(baseline["results"]))
+    changes = {}
+    for key, value in flatten(report["results"]):
+        if key.endswith(("_ms", "requests_per_sec", "peak_rss_mb")) and before.get(key):
+            changes[key] = round((value - before[key]) / before[key], 3)
+    return changes
+
+
+def run(args):
+    metrics.enable()
+    paths = list_directory(args.images)[:args.limit]
+    url, stop = run_in_background(create_app(args.latency_ms, args.jitter_ms, args.error_rate,
+                                             args.max_concurrency))
+    try:
+        results = {
+            "victims": bench_victims(url, paths, args.levels, args.requests),
+            "geocode": bench_geocode(url, PLACES),
+            "weather": bench_weather(url, PLACES, args.levels),
+        }
+    finally:
+        stop()
+    return {
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate,
+                   "max_concurrency": args.max_concurrency, "levels": args.levels, "requests": args.requests},
+        "results": results,
+        "stages": metrics.summary(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", default="detectFloodVictims/test_images")
+    parser.add_argument("--limit", type=int, default=None, help="Use only the first N images")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-concurrency", type=int, default=None, help="Upstream capacity limit")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["baseline"] = {"commit": baseline.get("commit"), "change": compare(baseline, report)}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
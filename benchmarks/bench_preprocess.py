@@ -0,0 +1,123 @@
+"""
+Measure time per image and peak RSS of upload preprocessing, before and after
+the single-decode pipeline in utils/preprocess.py.
+
+    python -m benchmarks.bench_preprocess --synthetic-mp 24
+
+"baseline" replays the original page: full decode, ImageOps.fit in main() and
+again per model, plus one JPEG/base64 encode per model. "prepared" uses
+load_image() with draft-mode decode and a single shared payload. Each variant
+runs in its own process so peak RSS is not polluted by the other.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.cache import image_digest  # noqa: E402
+from utils.preprocess import encode_image, load_image  # noqa: E402
+
+MODELS = 2
+
+
+def baseline(path):
+    image = ImageOps.fit(Image.open(path), (640, 640))
+    for _ in range(MODELS):
+        resized = ImageOps.fit(image, (640, 640))
+        image_digest(resized)
+        encode_image(resized)
+
+
+def prepared(path):
+    image = load_image(path)
+    for _ in range(MODELS):
+        image.digest
+        image.payload
+
+
+VARIANTS = {"baseline": baseline, "prepared": prepared}
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def run_variant(name, paths, repeat):
+    fn = VARIANTS[name]
+    before = _peak_rss_mb()
+    fn(paths[0])
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for path in paths:
+            fn(path)
+    elapsed = time.perf_counter() - start
+    peak = _peak_rss_mb()
+    return {"variant": name, "ms_per_image": round(1000 * elapsed / (repeat * len(paths)), 2),
+            "peak_rss_mb": round(peak, 1), "peak_rss_growth_mb": round(peak - before, 1)}
+
+
+def synthetic_jpeg(directory, megapixels):
+    width = int((megapixels * 1e6 * 3 / 2) ** 0.5)
+    height = int(width * 2 / 3)
+    rng = np.random.default_rng(0)
+    # Smooth noise compresses like a real photo rather than like white noise
+    small = rng.integers(0, 255, (height // 16, width // 16, 3), dtype=np.uint8)
+    path = os.path.join(directory, f"synthetic_{megapixels}mp.jpg")
+    Image.fromarray(small).resize((width, height), Image.BILINEAR).save(path, quality=90)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark upload preprocessing.")
+    parser.add_argument("--images", default="detectFloodVictims/test_images")
+    parser.add_argument("--synthetic-mp", type=float, default=None,
+                        help="benchmark a generated JPEG of this many megapixels instead")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument("--paths", nargs="*", help=argparse.SUPPRESS)
+    parser.add_argument("--synthetic-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, args.paths, args.repeat)))
+        return
+    if args.synthetic_dir:
+        print(synthetic_jpeg(args.synthetic_dir, args.synthetic_mp))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.synthetic_mp:
+            # Generated in a child too: Linux children inherit the parent's peak RSS
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_preprocess", "--synthetic-mp", str(args.synthetic_mp),
+                 "--synthetic-dir", tmp],
+                check=True, capture_output=True, text=True,
+            )
+            paths = [out.stdout.strip().splitlines()[-1]]
+        else:
+            paths = sorted(os.path.join(args.images, n) for n in os.listdir(args.images)
+                           if n.lower().endswith((".jpg", ".jpeg", ".png")))
+        results = []
+        for name in VARIANTS:
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_preprocess", "--variant", name,
+                 "--repeat", str(args.repeat), "--paths", *paths],
+                check=True, capture_output=True, text=True,
+            )
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+How the call policies in ``utils.resilience`` behave when the upstream misbehaves.
+
+Drives ``InferenceClient`` against the local mock in ``benchmarks.mock_roboflow``
+through four fault scenarios, each with and without the relevant mechanism:
+
+- ``flaky``: a share of requests fail with 500 -- success rate with and without retries;
+- ``tail``: a share of requests are slow -- p99 with and without hedging;
+- ``stall``: every request hangs -- latency bounded by the read timeout;
+- ``outage``: the upstream fails outright and then recovers -- the breaker opens,
+  later calls fail fast without touching the upstream, and one trial call closes it.
+
+Fully offline::
+
+    python -m benchmarks.bench_resilience --requests 200 --output resilience.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_pipeline import current_commit, phase  # noqa: E402
+from benchmarks.mock_roboflow import create_app, run_in_background  # noqa: E402
+from utils.clients import InferenceClient, PooledSession  # noqa: E402
+from utils.preprocess import prepare  # noqa: E402
+from utils.resilience import CallPolicy  # noqa: E402
+
+MODEL_ID = "bench-victims/1"
+
+
+def set_faults(app, latency_ms=50.0, jitter_ms=10.0, error_rate=0.0, slow_rate=0.0, slow_ms=0.0):
+    app["faults"].update(latency_ms=latency_ms, jitter_ms=jitter_ms, error_rate=error_rate,
+                         slow_rate=slow_rate, slow_ms=slow_ms)
+
+
+def run_policy(url, image, policy, requests, concurrency):
+    client = InferenceClient("bench", url, session=PooledSession(pool_size=2 * concurrency), policy=policy)
+    result = phase(lambda _: client.infer(image, MODEL_ID), range(requests), concurrency)
+    result["success_rate"] = round(result["n"] / requests, 3)
+    result["policy"] = dict(policy.stats)
+    return result
+
+
+def scenario_flaky(app, url, image, requests, concurrency):
+    set_faults(app, error_rate=0.2)
+    # A high threshold keeps the breaker out of the way; this scenario is about retries alone
+    return {
+        "faults": dict(app["faults"]),
+        "no_retries": run_policy(url, image, CallPolicy("flaky", retries=0, failure_threshold=10 ** 6),
+                                 requests, concurrency),
+        "retries": run_policy(url, image, CallPolicy("flaky", retries=2, backoff=0.05, failure_threshold=10 ** 6),
+                              requests, concurrency),
+    }
+
+
+def scenario_tail(app, url, image, requests, concurrency):
+    set_faults(app, slow_rate=0.05, slow_ms=1500)
+    return {
+        "faults": dict(app["faults"]),
+        "no_hedging": run_policy(url, image, CallPolicy("tail", retries=0), requests, concurrency),
+        "hedging": run_policy(url, image, CallPolicy("tail", retries=0, hedge_after_ms=200), requests, concurrency),
+    }
+
+
+def scenario_stall(app, url, image, requests, concurrency):
+    set_faults(app, slow_rate=1.0, slow_ms=5000)
+    requests = min(requests, 4 * concurrency)
+    policy = CallPolicy("stall", read_timeout=0.5, retries=0, failure_threshold=10 ** 6)
+    client = InferenceClient("bench", url, session=PooledSession(pool_size=2 * concurrency), policy=policy)
+
+    def attempt(_):
+        # Every call times out; what matters is how long the caller is kept waiting
+        try:
+            client.infer(image, MODEL_ID)
+        except OSError:
+            pass
+
+    return {"faults": dict(app["faults"]), "read_timeout_s": 0.5,
+            "time_to_error": phase(attempt, range(requests), concurrency), "policy": dict(policy.stats)}
+
+
+def scenario_outage(app, url, image, reset_seconds=1.0, calls=20):
+    policy = CallPolicy("outage", retries=0, failure_threshold=5, reset_seconds=reset_seconds)
+    client = InferenceClient("bench", url, session=PooledSession(), policy=policy)
+    set_faults(app, error_rate=1.0)
+    upstream_before = app["stats"]["requests"]
+    down = phase(lambda _: client.infer(image, MODEL_ID), range(calls))
+    report = {
+        "calls": calls,
+        "upstream_calls_while_down": app["stats"]["requests"] - upstream_before,
+        "state_after_outage": policy.breaker.state,
+        "short_circuited": policy.stats["short_circuited"],
+    }
+    # Failing fast is the point: time a call against the open breaker
+    started = time.perf_counter()
+    try:
+        client.infer(image, MODEL_ID)
+    except ConnectionError:
+        pass
+    report["open_call_ms"] = round(1000 * (time.perf_counter() - started), 3)
+    report["down"] = down
+
+    set_faults(app)
+    time.sleep(reset_seconds)
+    report["state_before_trial"] = policy.breaker.state
+    report["recovered"] = phase(lambda _: client.infer(image, MODEL_ID), range(calls))
+    report["state_after_recovery"] = policy.breaker.state
+    report["policy"] = dict(policy.stats)
+    return report
+
+
+def run(args):
+    image = prepare(Image.new("RGB", (640, 480), (40, 90, 140)))
+    app = create_app()
+    url, stop = run_in_background(app)
+    try:
+        results = {
+            "flaky": scenario_flaky(app, url, image, args.requests, args.concurrency),
+            "tail": scenario_tail(app, url, image, args.requests, args.concurrency),
+            "stall": scenario_stall(app, url, image, args.requests, args.concurrency),
+            "outage": scenario_outage(app, url, image),
+        }
+    finally:
+        stop()
+    return {"commit": current_commit(), "config": {"requests": args.requests, "concurrency": args.concurrency},
+            "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per run")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    text = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
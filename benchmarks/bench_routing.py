@@ -0,0 +1,161 @@
+"""
+Route query latency on a state-scale road graph, with and without landmarks.
+
+Builds a synthetic road network over the same region as the detection-store
+benchmark: a jittered grid with a fifth of its segments missing, some one-way
+streets, and east-west rivers crossed only at bridges, so that the shortest
+road route often bends well away from the straight line. It then times ALT
+preprocessing and answers random queries with each method -- bidirectional
+A* on the great-circle bound alone, with the landmark bounds, SciPy's
+compiled Dijkstra bounded by ``limit``, and ``auto`` as the app uses it --
+checking every answer against an unbounded SciPy Dijkstra::
+
+    python -m benchmarks.bench_routing --side 1000 --output routing.json
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_pipeline import current_commit, percentiles  # noqa: E402
+from utils.routing import RoadGraph, _distances, haversine  # noqa: E402
+
+# Roughly Maharashtra and its neighbours
+REGION = (15.5, 72.5, 21.5, 80.5)
+
+
+def synthetic(side, rivers, bridge_every, seed=0):
+    rng = np.random.default_rng(seed)
+    south, west, north, east = REGION
+    rows, cols = np.meshgrid(np.arange(side), np.arange(side), indexing="ij")
+    step_lat, step_lon = (north - south) / side, (east - west) / side
+    lat = south + (rows + rng.uniform(-0.3, 0.3, rows.shape)) * step_lat
+    lon = west + (cols + rng.uniform(-0.3, 0.3, cols.shape)) * step_lon
+    ids = np.arange(side * side).reshape(side, side)
+
+    a = np.concatenate([ids[:, :-1].ravel(), ids[:-1, :].ravel()])
+    b = np.concatenate([ids[:, 1:].ravel(), ids[1:, :].ravel()])
+    keep = rng.random(len(a)) > 0.2
+    # Rivers: north-south segments crossing these rows survive only at bridges
+    vertical = np.arange(len(a)) >= side * (side - 1)
+    crossing = np.isin(a // side, rng.choice(np.arange(1, side - 1), rivers, replace=False))
+    bridge = (a % side) % bridge_every == 0
+    keep &= ~(vertical & crossing) | bridge
+    a, b = a[keep], b[keep]
+    oneway = rng.random(len(a)) < 0.1
+    src = np.concatenate([a, b[~oneway]])
+    dst = np.concatenate([b, a[~oneway]])
+    return RoadGraph.from_edges(lat.ravel(), lon.ravel(), src, dst)
+
+
+def random_pairs(graph, count, rng):
+    return list(zip(rng.integers(0, graph.num_nodes, count).tolist(),
+                    rng.integers(0, graph.num_nodes, count).tolist()))
+
+
+def local_pairs(graph, count, radius_m, side, rng):
+    """Pairs whose grid cells are at most about ``radius_m`` apart."""
+    pairs = []
+    south, west, north, east = REGION
+    cell_m = haversine(south, west, south + (north - south) / side, west)
+    reach = max(1, int(radius_m / cell_m / math.sqrt(2)))
+    for s in rng.integers(0, graph.num_nodes, count).tolist():
+        r, c = divmod(s, side)
+        tr = int(np.clip(r + rng.integers(-reach, reach + 1), 0, side - 1))
+        tc = int(np.clip(c + rng.integers(-reach, reach + 1), 0, side - 1))
+        pairs.append((s, tr * side + tc))
+    return pairs
+
+
+def run_queries(graph, pairs, method, reference):
+    latencies, wrong, unreachable = [], 0, 0
+    for (s, t), expected in zip(pairs, reference):
+        started = time.perf_counter()
+        path, metres = graph.shortest_path(s, t, method=method)
+        latencies.append(time.perf_counter() - started)
+        if path is None:
+            unreachable += 1
+            wrong += expected is not None and math.isfinite(expected)
+        elif expected is not None and abs(metres - expected) > 1e-6 * expected + 0.01:
+            wrong += 1
+    return {"latency": percentiles(latencies), "unreachable": unreachable, "wrong": wrong}
+
+
+def run(args):
+    rng = np.random.default_rng(1)
+    started = time.perf_counter()
+    graph = synthetic(args.side, args.rivers, args.bridge_every)
+    build_s = time.perf_counter() - started
+    started = time.perf_counter()
+    graph.build_landmarks(args.landmarks)
+    landmarks_s = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as tmp:
+        graph.save(tmp)
+        landmark_mb = sum(os.path.getsize(os.path.join(tmp, f"{name}.npy"))
+                          for name in ("landmarks", "landmark_from", "landmark_to")) / 2 ** 20
+        graph = RoadGraph.load(tmp)
+        # The compiled search copies the weights into a SciPy matrix once (and again after hazard changes)
+        started = time.perf_counter()
+        graph._csgraph()
+        matrix_s = time.perf_counter() - started
+
+        sets = {
+            "district_25km": local_pairs(graph, args.queries, 25_000, args.side, rng),
+            "cross_region": random_pairs(graph, args.queries, rng),
+        }
+        results = {}
+        for name, pairs in sets.items():
+            if args.check:
+                reference = [float(_distances(graph, [s])[0][t]) for s, t in pairs]
+            else:
+                reference = [None] * len(pairs)
+            straight = haversine(graph.lat[[s for s, _ in pairs]], graph.lon[[s for s, _ in pairs]],
+                                 graph.lat[[t for _, t in pairs]], graph.lon[[t for _, t in pairs]])
+            results[name] = {"median_straight_km": round(float(np.median(straight)) / 1000, 1)}
+            for method in args.methods:
+                results[name][method] = run_queries(graph, pairs, method, reference)
+
+    return {
+        "commit": current_commit(),
+        "config": {"side": args.side, "rivers": args.rivers, "bridge_every": args.bridge_every,
+                   "landmarks": args.landmarks, "queries": args.queries, "methods": args.methods},
+        "nodes": graph.num_nodes,
+        "edges": graph.num_edges,
+        "build_s": round(build_s, 2),
+        "landmarks_s": round(landmarks_s, 2),
+        "landmark_mb": round(landmark_mb, 1),
+        "compiled_matrix_s": round(matrix_s, 3),
+        "queries": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--side", type=int, default=1000, help="Grid side; the graph has side^2 nodes")
+    parser.add_argument("--rivers", type=int, default=12, help="East-west rivers crossing the region")
+    parser.add_argument("--bridge-every", type=int, default=60, help="Grid columns between bridges")
+    parser.add_argument("--landmarks", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--methods", nargs="+", default=["astar", "alt", "compiled", "auto"])
+    parser.add_argument("--no-check", dest="check", action="store_false",
+                        help="Skip the Dijkstra reference distances")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    text = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
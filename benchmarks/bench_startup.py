@@ -0,0 +1,110 @@
+"""
+Cold-start time of every page: imports plus the first script run.
+
+Each page is run in a fresh interpreter under ``python -X importtime`` with
+Streamlit's ``AppTest`` harness, which is already imported when timing starts,
+just as it is in a running server. ``first_run_ms`` is the wall time of the
+first script run, i.e. until the page is first painted, and ``rerun_ms`` that
+of the next run in the same process. The import log is cut at the start of
+the first run, so ``imports`` lists only what the page itself pulled in,
+heaviest first. Run it on two commits to compare::
+
+    python -m benchmarks.bench_startup --repeat 3 --output startup.json
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARKER = "bench_startup: page run starts"
+
+DRIVER = f"""
+import sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+print({MARKER!r}, file=sys.stderr, flush=True)
+started = time.perf_counter()
+at.run()
+first = (time.perf_counter() - started) * 1000
+started = time.perf_counter()
+at.run()
+print(first, (time.perf_counter() - started) * 1000)
+print(len(at.exception))
+"""
+
+
+def page_scripts(root=ROOT):
+    return sorted(glob.glob(os.path.join(root, "*.py"))) + sorted(glob.glob(os.path.join(root, "pages", "*.py")))
+
+
+def parse_importtime(log):
+    """Top-level modules imported after the marker, as ``{module: cumulative ms}``."""
+    imports = {}
+    started = False
+    for line in log.splitlines():
+        if MARKER in line:
+            started = True
+            continue
+        if not started or not line.startswith("import time:"):
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            cumulative = int(cumulative)
+        except ValueError:
+            continue
+        # Nested imports are indented under their parent, which already counts them
+        if not name.startswith("  "):
+            imports[name.strip()] = imports.get(name.strip(), 0) + cumulative / 1000
+    return imports
+
+
+def measure(path):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", DRIVER, path],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    lines = result.stdout.split()
+    if result.returncode or len(lines) < 3:
+        raise RuntimeError(f"{os.path.basename(path)} failed:\n{result.stderr[-2000:]}")
+    return float(lines[-3]), float(lines[-2]), int(lines[-1]), parse_importtime(result.stderr)
+
+
+def bench_page(path, repeat=3, top=8):
+    runs = [measure(path) for _ in range(repeat)]
+    first_run, _, errors, imports = min(runs, key=lambda run: run[0])
+    return {
+        "first_run_ms": round(statistics.median(run[0] for run in runs), 1),
+        "first_run_min_ms": round(first_run, 1),
+        "rerun_ms": round(statistics.median(run[1] for run in runs), 1),
+        "import_ms": round(sum(imports.values()), 1),
+        "imports": {name: round(ms, 1) for name, ms in sorted(imports.items(), key=lambda kv: -kv[1])[:top]},
+        "exceptions": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8, help="Heaviest imports to list per page")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    report = {
+        "commit": commit.stdout.strip() or None,
+        "python": sys.version.split()[0],
+        "pages": {os.path.relpath(path, ROOT): bench_page(path, args.repeat, args.top) for path in page_scripts()},
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
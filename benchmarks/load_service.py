@@ -0,0 +1,174 @@
+"""
+Load-test the headless detection service against the mock Roboflow server.
+
+Starts the mock upstream and the service in-process on free ports, then
+fires requests at several client concurrency levels, once with
+micro-batching and once with batching disabled (``max_batch=1``). Prints
+throughput, latency percentiles, 429 rejections and the mean batch size as
+JSON. A final saturation run drives a single slow batcher with several times
+``--saturate-queue`` clients and checks that the overflow is answered with
+429 while the queue never grows past its bound; the command exits non-zero
+if it does not. Fully offline::
+
+    python -m benchmarks.load_service --levels 1 4 16 64 --requests 400 --latency-ms 80
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_roboflow import create_app as create_mock  # noqa: E402
+from utils.detector import VICTIM_MODEL_ID  # noqa: E402
+from utils.pipeline import list_directory  # noqa: E402
+from utils.preprocess import load_image  # noqa: E402
+from utils.service import DetectionService, create_app  # noqa: E402
+
+
+async def serve(app):
+    """Start ``app`` on a free local port and return ``(runner, base_url)``."""
+    from aiohttp import web
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def load(url, payloads, total, concurrency):
+    """Send ``total`` requests with ``concurrency`` clients; return per-request latencies and statuses."""
+    import aiohttp
+
+    latencies, statuses = [], []
+    counter = iter(range(total))
+
+    async def client(session):
+        for i in counter:
+            started = time.perf_counter()
+            async with session.post(f"{url}/{VICTIM_MODEL_ID}", params={"api_key": "bench"},
+                                    data=payloads[i % len(payloads)]) as response:
+                await response.read()
+                statuses.append(response.status)
+            latencies.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return np.array(latencies), statuses, elapsed
+
+
+async def saturate(args, payloads, mock_url):
+    """
+    Overload one batcher that serves a single image at a time and sample its
+    depth while it runs. Everything beyond ``max_queue`` waiting plus the one
+    request in flight must be refused with 429 rather than queued.
+    """
+    max_queue = args.saturate_queue
+    clients = args.saturate_clients or 4 * max_queue
+    service = DetectionService(api_url=mock_url, max_batch_size=1, max_wait_ms=0,
+                               max_queue=max_queue, concurrency=1)
+    runner, url = await serve(create_app(service))
+    peak = {"queued": 0, "pending": 0}
+    done = asyncio.Event()
+
+    async def sample():
+        while not done.is_set():
+            for batcher in list(service.batchers.values()):
+                peak["queued"] = max(peak["queued"], batcher.queue.qsize())
+                peak["pending"] = max(peak["pending"], batcher.pending)
+            await asyncio.sleep(0.001)
+
+    sampler = asyncio.ensure_future(sample())
+    try:
+        _, statuses, elapsed = await load(url, payloads, args.requests, clients)
+    finally:
+        done.set()
+        await sampler
+        await runner.cleanup()
+    checks = {
+        "overflow_rejected_with_429": statuses.count(429) > 0,
+        "queue_within_max_queue": peak["queued"] <= max_queue,
+        # Waiting requests plus the single batch of one in flight
+        "pending_within_bound": peak["pending"] <= max_queue + 1,
+        "no_other_errors": all(s in (200, 429) for s in statuses),
+    }
+    return {
+        "clients": clients,
+        "max_queue": max_queue,
+        "served": statuses.count(200),
+        "rejected_429": statuses.count(429),
+        "seconds": round(elapsed, 2),
+        "peak_queued": peak["queued"],
+        "peak_pending": peak["pending"],
+        "checks": checks,
+        "passed": all(checks.values()),
+    }
+
+
+async def run(args):
+    payloads = [load_image(path).payload for path in list_directory(args.images)[:32]]
+    mock_runner, mock_url = await serve(create_mock(args.latency_ms, args.jitter_ms, args.error_rate))
+    report = {"upstream_latency_ms": args.latency_ms, "requests": args.requests, "runs": []}
+    try:
+        for label, max_batch in (("micro-batching", args.max_batch), ("no batching", 1)):
+            for level in args.levels:
+                service = DetectionService(api_url=mock_url, max_batch_size=max_batch,
+                                           max_wait_ms=args.max_wait_ms, max_queue=args.max_queue,
+                                           concurrency=args.concurrency)
+                runner, url = await serve(create_app(service))
+                try:
+                    latencies, statuses, elapsed = await load(url, payloads, args.requests, level)
+                    ok = latencies[np.array(statuses) == 200]
+                    stats = service.health()["models"].get(VICTIM_MODEL_ID, {})
+                finally:
+                    await runner.cleanup()
+                report["runs"].append({
+                    "mode": label,
+                    "clients": level,
+                    "requests_per_sec": round(len(ok) / elapsed, 1),
+                    "p50_ms": round(1000 * float(np.percentile(ok, 50)), 1) if len(ok) else None,
+                    "p95_ms": round(1000 * float(np.percentile(ok, 95)), 1) if len(ok) else None,
+                    "rejected_429": statuses.count(429),
+                    "errors": sum(1 for s in statuses if s not in (200, 429)),
+                    "mean_batch_size": round(stats.get("mean_batch_size", 0.0), 2),
+                })
+        report["saturation"] = await saturate(args, payloads, mock_url)
+    finally:
+        await mock_runner.cleanup()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", default="detectFloodVictims/test_images")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--max-queue", type=int, default=128)
+    parser.add_argument("--concurrency", type=int, default=4, help="Batches in flight per model")
+    parser.add_argument("--saturate-queue", type=int, default=8, help="max_queue of the saturation run")
+    parser.add_argument("--saturate-clients", type=int, default=None,
+                        help="Clients in the saturation run (default: 4x --saturate-queue)")
+    args = parser.parse_args()
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if not report["saturation"]["passed"]:
+        sys.exit("Saturation run failed: " + ", ".join(
+            name for name, ok in report["saturation"]["checks"].items() if not ok))
+
+
+if __name__ == "__main__":
+    main()
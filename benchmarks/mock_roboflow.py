@@ -0,0 +1,178 @@
+"""
+A local stand-in for the Roboflow hosted inference API and the other upstreams.
+
+Answers ``POST /{project}/{version}?api_key=...`` with plausible predictions
+after an injected delay, so the detection service and benchmarks run offline
+without spending API credits. The same server stubs OpenWeatherMap
+(``GET /data/2.5/weather``) and Nominatim (``GET /search``) with the same
+latency and error injection. ``slow_rate`` of requests take ``slow_ms``
+instead, to model a latency tail or a stalled upstream. Faults live in
+``app["faults"]`` and can be changed while the server runs. Run standalone with::
+
+    python -m benchmarks.mock_roboflow --port 9001 --latency-ms 80 --jitter-ms 20 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import sys
+import threading
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.detector import VICTIM_MODEL_ID  # noqa: E402
+
+
+def fake_predictions(model_id, body):
+    """Deterministic predictions for a request body, in the Roboflow schema."""
+    rng = random.Random(hashlib.blake2b(body, digest_size=8).digest())
+    if model_id == VICTIM_MODEL_ID:
+        classes = [("person", 1), ("animal", 0)]
+        return [
+            {"x": rng.uniform(50, 590), "y": rng.uniform(50, 590), "width": rng.uniform(20, 120),
+             "height": rng.uniform(20, 120), "confidence": rng.uniform(0.4, 0.95),
+             "class": name, "class_id": class_id}
+            for name, class_id in (rng.choice(classes) for _ in range(rng.randint(0, 6)))
+        ]
+    level = rng.randint(1, 12)
+    return [{"x": 320, "y": 320, "width": 640, "height": 640, "confidence": rng.uniform(0.5, 0.9),
+             "class": f"level {level}", "class_id": level}]
+
+
+def fake_weather(city):
+    """Deterministic OpenWeatherMap-style reading for a city."""
+    rng = random.Random(zlib.crc32(city.encode()))
+    return {
+        "name": city.title(),
+        "main": {"temp": round(rng.uniform(18, 38), 1), "humidity": rng.randint(40, 100)},
+        "weather": [{"description": rng.choice(["heavy rain", "light rain", "overcast clouds", "clear sky"])}],
+        "wind": {"speed": round(rng.uniform(0, 20), 1)},
+    }
+
+
+def fake_place(name):
+    """Deterministic Nominatim-style search result somewhere in India."""
+    rng = random.Random(zlib.crc32(name.encode()))
+    return [{"lat": str(round(rng.uniform(8, 30), 5)), "lon": str(round(rng.uniform(70, 88), 5)),
+             "display_name": name.title()}]
+
+
+def create_app(latency_ms=80.0, jitter_ms=20.0, error_rate=0.0, max_concurrency=None, slow_rate=0.0, slow_ms=0.0):
+    """The mock as an aiohttp application; ``max_concurrency`` models an upstream capacity limit."""
+    from aiohttp import web
+
+    limit = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+    stats = {"requests": 0, "errors": 0, "in_flight": 0, "peak_in_flight": 0}
+    faults = {"latency_ms": latency_ms, "jitter_ms": jitter_ms, "error_rate": error_rate,
+              "slow_rate": slow_rate, "slow_ms": slow_ms}
+
+    async def delay():
+        """Wait the injected latency; returns False when this request should fail."""
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+        try:
+            if limit is not None:
+                await limit.acquire()
+            try:
+                if random.random() < faults["slow_rate"]:
+                    delay_ms = faults["slow_ms"]
+                else:
+                    delay_ms = max(0.0, random.gauss(faults["latency_ms"], faults["jitter_ms"]))
+                await asyncio.sleep(delay_ms / 1000)
+            finally:
+                if limit is not None:
+                    limit.release()
+        finally:
+            stats["in_flight"] -= 1
+        if random.random() < faults["error_rate"]:
+            stats["errors"] += 1
+            return False
+        return True
+
+    def injected_error():
+        return web.json_response({"message": "Injected upstream error"}, status=500)
+
+    async def infer(request):
+        if not request.query.get("api_key"):
+            return web.json_response({"message": "Forbidden"}, status=403)
+        body = await request.read()
+        if not await delay():
+            return injected_error()
+        model_id = f"{request.match_info['project']}/{request.match_info['version']}"
+        return web.json_response({"predictions": fake_predictions(model_id, body)})
+
+    async def weather(request):
+        if not request.query.get("appid"):
+            return web.json_response({"cod": 401, "message": "Invalid API key"}, status=401)
+        if not await delay():
+            return injected_error()
+        return web.json_response(fake_weather(request.query.get("q", "")))
+
+    async def search(request):
+        if not await delay():
+            return injected_error()
+        return web.json_response(fake_place(request.query.get("q", "")))
+
+    async def health(request):
+        return web.json_response(stats)
+
+    app = web.Application(client_max_size=32 * 1024 * 1024)
+    app["stats"] = stats
+    app["faults"] = faults
+    app.add_routes([
+        web.get("/health", health),
+        web.get("/data/2.5/weather", weather),
+        web.get("/search", search),
+        web.post("/{project}/{version}", infer),
+    ])
+    return app
+
+
+def run_in_background(app):
+    """
+    Serve ``app`` on a free local port from a daemon thread, for synchronous
+    callers. Returns ``(base_url, stop)``.
+    """
+    from aiohttp import web
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+
+    async def start():
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        return site._server.sockets[0].getsockname()[1]
+
+    threading.Thread(target=loop.run_forever, name="mock-upstream", daemon=True).start()
+    port = asyncio.run_coroutine_threadsafe(start(), loop).result()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    return f"http://127.0.0.1:{port}", stop
+
+
+def main():
+    from aiohttp import web
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-concurrency", type=int, default=None)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of requests that take --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    web.run_app(create_app(args.latency_ms, args.jitter_ms, args.error_rate, args.max_concurrency,
+                           args.slow_rate, args.slow_ms),
+                host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
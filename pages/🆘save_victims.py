@@ -1,108 +1,415 @@
 import streamlit as st
 import base64
-import supervision as sv
-from inference_sdk import InferenceHTTPClient
-from PIL import Image, ImageDraw, ImageOps
+import csv
+import io
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from utils.backends import DEFAULT_ONNX_PATH, LazyBackend, OnnxBackend, RemoteBackend
+from utils.cache import get_detection_cache
+from utils.clients import describe_error, get_inference_client, upstream_status
+from utils.dedupe import get_near_duplicate_index
+from utils.assets import MAX_IMAGE_WIDTH
+from utils.detections import annotate, class_names, count_classes, filter_detections, to_detections
+from utils import metrics
+from utils.geocode import parse_coordinates
+from utils.memo import secret_digest, session_memo
+from utils.detection_store import get_detection_store
+from utils.detector import HIGH_FLOOD_LEVELS, VICTIM_MODEL_ID, WATER_LEVEL_MODEL_ID, remote_detector
+from utils.pipeline import RESULT_FIELDS, count_images, iter_images, list_directory, run_batch
+from utils.preprocess import encode_jpeg, exif_location, load_image, open_full_resolution, prepare
+from utils.resilience import get_policy
+from utils.tiling import DEFAULT_OVERLAP, DEFAULT_TILE_SIZE, SlicedBackend
+from utils.video import VIDEO_EXTENSIONS, track_victims
+from utils.settings import secrets_section
 
-def detectVictim(api_key, image):
-    size = (640,640)    
-    image = ImageOps.fit(image, size)
+SAMPLE_IMAGES_DIR = "detectFloodVictims/test_images"
+
+def detectionApiUrl():
+    """URL of the headless detection service (``[api] url`` in secrets), or None to call Roboflow directly."""
+    return secrets_section("api").get("url")
+
+def inferenceClient(api_key):
+    """The shared client for the detection service when one is configured, else for Roboflow."""
+    url = detectionApiUrl()
+    return get_inference_client(api_key, api_url=url) if url else get_inference_client(api_key)
+
+def _missingApiKey(api_key):
+    """The service can hold its own Roboflow key, so only a direct connection needs one here."""
+    if not api_key and not detectionApiUrl():
+        st.error("Add Valid Roboflow API Key")
+        return True
+    return False
+
+def _infer(client, image, model_id, cache=None, fallback=None, dedupe=None):
+    """Run a single model and return its predictions, raising on failure."""
+    cache = cache if cache is not None else get_detection_cache()
+    return RemoteBackend(client, model_id, cache, fallback, dedupe).predict(image)
+
+@st.cache_resource(show_spinner="Loading local victim model...")
+def load_onnx_backend(model_path):
+    return OnnxBackend(model_path)
+
+def onnxModelPath():
+    return secrets_section("models").get("victim_onnx", DEFAULT_ONNX_PATH)
+
+@st.cache_resource(show_spinner=False)
+def _lazy_onnx_backend(model_path):
+    return LazyBackend(lambda: OnnxBackend(model_path))
+
+def victimFallback():
+    """The local victim model, loaded only if Roboflow becomes unreachable; None if it is not installed."""
+    model_path = onnxModelPath()
+    return _lazy_onnx_backend(model_path) if os.path.exists(model_path) else None
+
+def victimBackend():
+    """
+    Return the local backend selected in the sidebar, or None to use Roboflow.
+    Falls back to Roboflow with an error if the local model cannot be loaded.
+    """
+    choice = st.sidebar.radio("Victim model backend", ["Roboflow (remote)", "Local ONNX (CPU)"])
+    if choice == "Roboflow (remote)":
+        return None
     try:
-        CLIENT = InferenceHTTPClient(
-            api_url="https://detect.roboflow.com",
-            api_key=api_key
-        )
-        result = CLIENT.infer(image, model_id="yolo-floods-relief/4")
-        if 'predictions' in result:
-            return result['predictions']
-        else:
-            st.error("Failed to get predictions from the model.")
-            return None
+        return load_onnx_backend(onnxModelPath())
     except Exception as e:
-        if "403 Client Error: Forbidden" in str(e):
-            st.error("Invalid API Key. Please check your API key and try again.")
-        else:
-            st.error(f"An error occurred: {e}")
+        st.sidebar.error(f"Local model unavailable, using Roboflow: {e}")
         return None
-    
-def detectWaterLevel(api_key,image):
-    size = (640,640)    
-    image = ImageOps.fit(image, size)
+
+def _report_error(e):
+    if upstream_status(e) == 403:
+        st.error("Invalid API Key. Please check your API key and try again.")
+    else:
+        st.error(f"An error occurred: {describe_error(e)}")
+
+def _detect(api_key, image, model_id):
+    image = prepare(image)
     try:
-        CLIENT = InferenceHTTPClient(
-            api_url="https://detect.roboflow.com",
-            api_key=api_key
-        )
-        result = CLIENT.infer(image, model_id="water-level-sindh/6")
-        if 'predictions' in result:
-            return result['predictions']
-        else:
-            st.error("Failed to get predictions from the model.")
-            return None
+        fallback = victimFallback() if model_id == VICTIM_MODEL_ID else None
+        return _infer(inferenceClient(api_key), image, model_id, fallback=fallback,
+                      dedupe=get_near_duplicate_index())
     except Exception as e:
-        if "403 Client Error: Forbidden" in str(e):
-            st.error("Invalid API Key. Please check your API key and try again.")
+        _report_error(e)
+        return None
+
+def detectVictim(api_key, image):
+    return _detect(api_key, image, VICTIM_MODEL_ID)
+
+def detectWaterLevel(api_key,image):
+    return _detect(api_key, image, WATER_LEVEL_MODEL_ID)
+
+def detectAll(api_key, image, victim_backend=None, victim_image=None):
+    """
+    Run victim and water-level detection in parallel over one shared client.
+    A failure in one model is reported without discarding the other's result.
+    ``victim_image`` lets the victim model see a different (e.g. full-size) image.
+    """
+    CLIENT = inferenceClient(api_key)
+    cache = get_detection_cache()
+    dedupe = get_near_duplicate_index()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        if victim_backend is not None:
+            victims = pool.submit(victim_backend.predict, victim_image or image)
         else:
-            st.error(f"An error occurred: {e}")
+            victims = pool.submit(_infer, CLIENT, image, VICTIM_MODEL_ID, cache, victimFallback(), dedupe)
+        futures = [victims, pool.submit(_infer, CLIENT, image, WATER_LEVEL_MODEL_ID, cache, None, dedupe)]
+
+    # st.* calls have to happen on the script thread, so errors are surfaced here
+    results = []
+    reported = set()
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            if str(e) not in reported:
+                reported.add(str(e))
+                _report_error(e)
+            results.append(None)
+    return tuple(results)
+
+def batchDetector(api_key, victim_backend=None):
+    """
+    Return a detect(image) callable for the batch pipeline. The client and cache
+    are resolved here, on the script thread, and shared by every worker.
+    """
+    return remote_detector(inferenceClient(api_key), get_detection_cache(), victim_backend, victimFallback(),
+                           get_near_duplicate_index()).detect
+
+def slicing_options():
+    """Controls for sliced inference; returns None when it is switched off."""
+    if not st.checkbox("Sliced inference for large aerial images"):
         return None
+    with st.expander("Slicing options"):
+        return {
+            "tile_size": st.select_slider("Tile size", [320, 480, 640, 800, 1024], value=DEFAULT_TILE_SIZE),
+            "overlap": st.slider("Tile overlap", 0.0, 0.5, DEFAULT_OVERLAP, 0.05),
+            "workers": st.slider("Parallel workers", 1, 16, 4),
+            "skip_empty": st.checkbox("Skip plainly empty tiles (open water, sky)", value=True),
+        }
 
-def draw_bounding_box(image, predictions):
-    draw = ImageDraw.Draw(image)
-    for prediction in predictions:
-        x = prediction['x']-40
-        y = prediction['y']-120
-        width = prediction['width']
-        height = prediction['height']
-        draw.rectangle([x, y, x+width, y+height], outline="red", width=3)
-        draw.text((x, y), prediction['class'], fill="yellow")
+def locationInput():
+    """Coordinates typed by the operator for photos without GPS tags, or None."""
+    text = st.text_input("Location (lat, lon)", placeholder="19.07, 72.88",
+                         help="Used when a photo has no GPS tags. Located detections are added to the "
+                              "situation map on the Weather & Route page.")
+    if not text:
+        return None
+    coords = parse_coordinates(text)
+    if coords is None:
+        st.warning("Enter the location as 'lat, lon', e.g. 19.07, 72.88.")
+    return coords
 
-def main():
-  st.set_page_config(page_title="Save Victims", page_icon="🆘",initial_sidebar_state='expanded')
-
-  st.title("Save Flood Victims 🆘")
-  st.subheader("Let's Test the Victim Detection Model")
-
-  higherClass=['level 5','level 6', 'level 7', 'level 8', 'level 9', 'level 10', 'level 11', 'level 12']
-
-  api_key = st.text_input("Enter API Key", type='password')
-  uploaded_file = st.file_uploader("Choose an image...", type=["jpg", "png", "jpeg"])
-  
-  if uploaded_file is not None:
-     if api_key is not None:
-         image = Image.open(uploaded_file)
-         size = (640,640)
-         image = ImageOps.fit(image, size)
-         victim_predictions=detectVictim(api_key,image)
-         level_predictions=detectWaterLevel(api_key,image)
-
-         if victim_predictions:
-          person = 0
-          animal=0
-          
-          for detection in victim_predictions:
-                if detection['class'] == 'person':
-                    person += 1
-                elif detection['class'] == 'animal':
-                    animal+=1
-          draw_bounding_box(image, victim_predictions)
-          st.image(image, caption='Processed Image', use_column_width=True)
-          st.divider()
-          st.write(f"**Persons detected: {person}**")
-          st.write(f"**Animals detected: {animal}**")
-          st.divider()
-         if level_predictions:
-          for entity in level_predictions:
-            # st.write(entity['class'])
+def recordDetections(store, location, victims, levels, digest=None):
+    """
+    Add one image's predictions at ``location`` to the detection store; returns
+    the rows added. An image (by ``digest``) already recorded there adds none.
+    """
+    if location is None:
+        return 0
+    return store.add_predictions(location[0], location[1], (victims or []) + (levels or []), digest=digest)
+
+def single_image_mode(api_key, victim_backend=None):
+    uploaded_file = st.file_uploader("Choose an image...", type=["jpg", "png", "jpeg"])
+    slicing = slicing_options()
+    location = locationInput()
+    if uploaded_file is None:
+        return
+    if _missingApiKey(api_key):
+        return
+    with metrics.span("victims.total"):
+        _single_image(api_key, uploaded_file, slicing, victim_backend, location)
+
+def _resultKey(api_key, uploaded_file, slicing, victim_backend):
+    """What a single-image result depends on: the upload, the key, the backend and the slicing options."""
+    file_id = getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+    backend = type(victim_backend).__name__ if victim_backend is not None else detectionApiUrl() or "roboflow"
+    return (file_id, secret_digest(api_key), backend, tuple(sorted((slicing or {}).items())))
+
+def _single_image(api_key, uploaded_file, slicing, victim_backend, location=None):
+    # Reruns caused by widgets below find the finished result here and skip decoding and inference
+    memo = session_memo()
+    key = _resultKey(api_key, uploaded_file, slicing, victim_backend)
+    result = memo.get(key)
+    if result is None:
+        result = _detectSingleImage(api_key, uploaded_file, slicing, victim_backend)
+        # Failed models are not remembered, so the next rerun tries them again
+        if result["victims"] is not None and result["levels"] is not None:
+            memo.put(key, result)
+
+    # Recorded once per result and place, however often the page reruns
+    location = result["gps"] or location
+    if key in memo and location is not None and result["recorded"] != location:
+        recordDetections(get_detection_store(), location, result["victims"], result["levels"], result.get("digest"))
+        result = {**result, "recorded": location}
+        memo.put(key, result)
+    _showSingleImage(memo, key, result)
+
+def _detectSingleImage(api_key, uploaded_file, slicing, victim_backend):
+    gps = exif_location(uploaded_file)
+    uploaded_file.seek(0)
+    # Decoded, oriented and resized once; both models share the one JPEG payload
+    image = load_image(uploaded_file)
+    display, full, sliced = image.image, None, None
+    if slicing is not None:
+        uploaded_file.seek(0)
+        full = open_full_resolution(uploaded_file)
+        inner = victim_backend or RemoteBackend(inferenceClient(api_key), VICTIM_MODEL_ID, get_detection_cache(),
+                                                victimFallback())
+        sliced = SlicedBackend(inner, **slicing)
+        display = full.copy()
+        # Streamlit would scale anything wider down again on every run
+        display.thumbnail((MAX_IMAGE_WIDTH, MAX_IMAGE_WIDTH))
+    with metrics.span("victims.detect"):
+        victim_predictions, level_predictions = detectAll(api_key, image, sliced or victim_backend, full)
+
+    caption = None
+    if sliced is not None and sliced.last_stats:
+        stats = sliced.last_stats
+        caption = f"{stats['inferred']} of {stats['tiles']} tiles inferred, {stats['skipped']} skipped as empty"
+    return {
+        "display": display,
+        "scale": display.width / full.width if full is not None else 1.0,
+        "victims": victim_predictions,
+        "levels": level_predictions,
+        "caption": caption,
+        "gps": gps,
+        "digest": image.digest,
+        "recorded": None,
+        "render": None,
+    }
+
+def _showSingleImage(memo, key, result):
+    """Filter and draw a stored result; changing the filters never calls a model."""
+    if result["caption"]:
+        st.caption(result["caption"])
+    if result["recorded"]:
+        source = "GPS tags" if result["gps"] else "entered location"
+        st.caption(f"Detections added to the situation map at {result['recorded'][0]:.5f}, "
+                   f"{result['recorded'][1]:.5f} ({source}).")
+    if result["victims"]:
+        detections = to_detections(result["victims"], scale=result["scale"])
+        names = sorted(set(class_names(detections).tolist()))
+        col1, col2 = st.columns(2)
+        min_confidence = col1.slider("Minimum confidence", 0.0, 1.0, 0.0, 0.05)
+        classes = col2.multiselect("Classes", names, default=names)
+        detections = filter_detections(detections, min_confidence, classes)
+        counts = count_classes(detections)
+
+        # The annotated frame is kept as JPEG bytes, which st.image sends without re-encoding
+        params = (min_confidence, tuple(classes))
+        if result["render"] is not None and result["render"][0] == params:
+            annotated = result["render"][1]
+        else:
+            with metrics.span("victims.annotate"):
+                annotated = encode_jpeg(annotate(result["display"], detections))
+            if key in memo:
+                memo.put(key, {**result, "render": (params, annotated)})
+        with metrics.span("victims.st_image"):
+            st.image(annotated, caption='Processed Image', use_column_width=True)
+        st.divider()
+        st.write(f"**Persons detected: {counts['person']}**")
+        st.write(f"**Animals detected: {counts['animal']}**")
+        st.divider()
+    if result["levels"]:
+        for entity in result["levels"]:
             if entity['class'] == 'flood':
-               st.subheader("**Flood is detected**")
-            elif entity['class'] in higherClass:
-               st.subheader(f"High level of Flood Detected: :red[{entity['class']}]")
+                st.subheader("**Flood is detected**")
+            elif entity['class'] in HIGH_FLOOD_LEVELS:
+                st.subheader(f"High level of Flood Detected: :red[{entity['class']}]")
             else:
-               st.subheader(f"Low Flood levels detected: :green[{entity['class']}]")
-            
-     else:
-        st.error("Add Valid Roboflow API Key")
+                st.subheader(f"Low Flood levels detected: :green[{entity['class']}]")
+
+def batch_mode(api_key, victim_backend=None):
+    uploaded_files = st.file_uploader(
+        "Choose images or a zip archive...", type=["jpg", "png", "jpeg", "zip"], accept_multiple_files=True
+    )
+    use_samples = st.checkbox(f"Use the bundled test images ({SAMPLE_IMAGES_DIR})")
+    concurrency = st.slider("Images in flight", min_value=1, max_value=16, value=4)
+    location = locationInput()
+    sources = list_directory(SAMPLE_IMAGES_DIR) if use_samples else list(uploaded_files or [])
+
+    if not sources or not st.button("Run batch"):
+        return
+    if _missingApiKey(api_key):
+        return
+
+    total = count_images(sources)
+    progress = st.progress(0.0, text=f"0 / {total} images")
+    preview = st.empty()
+    rows = []
+    store = get_detection_store()
+
+    def record(data, victims, levels, digest):
+        # Each photo's own GPS tags win over the location entered for the whole batch
+        recordDetections(store, exif_location(io.BytesIO(data)) or location, victims, levels, digest)
+
+    for done, result in enumerate(run_batch(iter_images(sources), batchDetector(api_key, victim_backend),
+                                            annotate=annotate, concurrency=concurrency, record=record), start=1):
+        # Only the latest annotated frame is kept, so memory does not grow with the batch
+        annotated = result.pop("annotated", None)
+        if annotated is not None:
+            preview.image(annotated, caption=result["image"], use_column_width=True)
+        rows.append(result)
+        progress.progress(done / max(total, 1), text=f"{done} / {total} images")
+
+    st.dataframe(rows, use_container_width=True)
+    st.write(f"**Persons detected: {sum(r['persons'] for r in rows)}**")
+    st.write(f"**Animals detected: {sum(r['animals'] for r in rows)}**")
+    failed = sum(1 for r in rows if r["error"])
+    if failed:
+        st.warning(f"{failed} image(s) failed, see the error column.")
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=RESULT_FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+    col1, col2 = st.columns(2)
+    col1.download_button("Download CSV", buffer.getvalue(), file_name="victim_counts.csv", mime="text/csv")
+    col2.download_button("Download JSON", json.dumps(rows, indent=2), file_name="victim_counts.json",
+                         mime="application/json")
+
+def video_mode(api_key, victim_backend=None):
+    uploaded_video = st.file_uploader("Choose a video...", type=VIDEO_EXTENSIONS)
+    stream_url = st.text_input("...or a stream URL", placeholder="rtsp://drone.local:8554/live")
+    target_fps = st.slider("Detections per second", min_value=1, max_value=15, value=5)
+    if victim_backend is None:
+        st.caption("Every sampled frame is a paid Roboflow call; the local ONNX backend is recommended for video.")
+
+    if not (uploaded_video or stream_url) or not st.button("Start counting"):
+        return
+    if victim_backend is None and _missingApiKey(api_key):
+        return
+
+    predict = victim_backend.predict if victim_backend is not None else \
+        RemoteBackend(inferenceClient(api_key), VICTIM_MODEL_ID, get_detection_cache()).predict
+
+    path = None
+    if uploaded_video is not None:
+        # OpenCV can only open videos from a path, not from an in-memory upload
+        suffix = os.path.splitext(uploaded_video.name)[1]
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+            f.write(uploaded_video.getbuffer())
+            path = f.name
+    source = path or stream_url
+
+    frame_view = st.empty()
+    col1, col2, col3 = st.columns(3)
+    persons, animals, speed = col1.empty(), col2.empty(), col3.empty()
+    progress = st.progress(0.0) if path else None
+    try:
+        for update in track_victims(source, predict, target_fps=target_fps):
+            frame_view.image(update["image"], caption=f"Frame {update['frame']} ({update['timestamp']:.1f}s)",
+                             use_column_width=True)
+            persons.metric("Unique persons", update["counts"]["person"])
+            animals.metric("Unique animals", update["counts"]["animal"])
+            speed.metric("Frames analysed / s", f"{update['processed_fps']:.1f}", f"every {update['stride']} frames",
+                         delta_color="off")
+            if progress is not None and update["frame_count"]:
+                progress.progress(min(1.0, (update["frame"] + 1) / update["frame_count"]))
+    except ValueError as e:
+        st.error(str(e))
+    except Exception as e:
+        _report_error(e)
+    finally:
+        if path:
+            os.unlink(path)
+
+def main():
+    st.set_page_config(page_title="Save Victims", page_icon="🆘",initial_sidebar_state='expanded')
+    metrics.configure()
+
+    st.title("Save Flood Victims 🆘")
+    st.subheader("Let's Test the Victim Detection Model")
+
+    api_key = st.text_input("Enter API Key", type='password')
+    mode = st.radio("Mode", ["Single image", "Batch", "Video"], horizontal=True)
+    victim_backend = victimBackend()
+
+    if mode == "Batch":
+        batch_mode(api_key, victim_backend)
+    elif mode == "Video":
+        video_mode(api_key, victim_backend)
+    else:
+        single_image_mode(api_key, victim_backend)
+
+    stats = get_detection_cache().stats()
+    st.sidebar.caption(
+        f"Detection cache: {stats['calls_saved']} API calls saved "
+        f"({stats['hit_rate']:.0%} hit rate, {stats['misses']} misses)"
+    )
+    dedupe = get_near_duplicate_index()
+    if dedupe is not None:
+        dedupe_stats = dedupe.stats()
+        st.sidebar.caption(f"Near-duplicate filter: {dedupe_stats['calls_avoided']} API calls avoided "
+                           f"({dedupe_stats['indexed']} images indexed, within {dedupe_stats['max_distance']} bits)")
+    memo = session_memo().stats()
+    st.sidebar.caption(f"Session results: {memo['entries']} kept, {memo['bytes'] / 2**20:.1f} of "
+                       f"{memo['max_bytes'] / 2**20:.0f} MB, {memo['hits']} reruns served without inference")
+    if get_policy("roboflow").breaker.state != "closed":
+        st.sidebar.warning("Roboflow is failing; requests are paused briefly"
+                           + (" and the local model answers instead." if victimFallback() else "."))
+    metrics.sidebar_panel()
 
 if __name__ == "__main__":
     main()
-
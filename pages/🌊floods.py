@@ -1,5 +1,18 @@
+import json
+import os
+import tempfile
+
+import numpy as np
 import streamlit as st
 
+from utils.assets import web_image
+from utils.hazards import polygons_from_mask
+from utils.segmentation import (DEFAULT_OVERLAP, DEFAULT_UNET_PATH, RASTER_EXTENSIONS, UNetSegmenter, mask_png,
+                                open_raster, segment_raster)
+from utils.settings import secrets_section
+
+SCENE_DIR = os.path.join(".cache", "scenes")
+
 st.set_page_config(page_title='Flood Segmentation', page_icon='🌊', initial_sidebar_state='expanded')
 
 # Title and Introduction
@@ -11,6 +24,95 @@ enabling faster and more precise emergency response planning.
 """)
 st.divider()
 
+@st.cache_resource(show_spinner="Loading flood segmentation model...")
+def load_unet(model_path):
+    return UNetSegmenter(model_path)
+
+def flood_geojson(preview, bounds):
+    """Flood extent as GeoJSON polygons the route planner's hazard upload accepts."""
+    features = [
+        {"type": "Feature", "properties": {"kind": "flood"},
+         "geometry": {"type": "Polygon", "coordinates": [[[lon, lat] for lat, lon in ring + ring[:1]]]}}
+        for ring in polygons_from_mask(preview, bounds)
+    ]
+    return json.dumps({"type": "FeatureCollection", "features": features})
+
+def scene_path(uploaded, server_path):
+    """Spill an upload to disk so it can be memory-mapped; server paths are used as-is."""
+    if server_path:
+        return server_path
+    os.makedirs(SCENE_DIR, exist_ok=True)
+    suffix = os.path.splitext(uploaded.name)[1]
+    with tempfile.NamedTemporaryFile(dir=SCENE_DIR, suffix=suffix, delete=False) as f:
+        for chunk in iter(lambda: uploaded.read(1 << 20), b""):
+            f.write(chunk)
+    return f.name
+
+def segmentation_section():
+    st.subheader("Segment a Satellite Scene")
+    uploaded = st.file_uploader("Satellite scene (GeoTIFF, .npy or image)", type=RASTER_EXTENSIONS)
+    server_path = st.text_input("...or a scene path on the server", placeholder="/data/scenes/sentinel_tile.tif")
+    col1, col2, col3, col4 = st.columns(4)
+    overlap = col1.slider("Tile overlap", 0.0, 0.5, DEFAULT_OVERLAP, 0.05)
+    batch_size = col2.number_input("Tiles per batch", min_value=1, max_value=64, value=8)
+    threshold = col3.slider("Flood threshold", 0.1, 0.9, 0.5, 0.05)
+    gsd = col4.number_input("Metres per pixel", min_value=0.0, value=0.0,
+                            help="Only used when the scene carries no georeference; 0 leaves the area unknown.")
+    if not st.button("Segment Scene"):
+        return
+    if uploaded is None and not server_path:
+        st.error("Upload a scene or enter a path first.")
+        return
+    model_path = secrets_section("models").get("flood_unet", DEFAULT_UNET_PATH)
+    try:
+        model = load_unet(model_path)
+    except Exception as e:
+        st.error(f"Could not load the flood segmentation model: {e}")
+        return
+
+    path = scene_path(uploaded, server_path)
+    os.makedirs(SCENE_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=SCENE_DIR, suffix=".npy", delete=False) as f:
+        mask_path = f.name
+    progress = st.progress(0.0)
+    live = st.empty()
+
+    def report(done, total, stats):
+        progress.progress(done / total, text=f"{done}/{total} tiles")
+        area = f" · {stats['flooded_km2']:.2f} km²" if stats["flooded_km2"] is not None else ""
+        live.caption(f"Flooded so far: {stats['coverage']:.1%}{area}")
+
+    try:
+        raster = open_raster(path)
+        try:
+            result = segment_raster(raster, model, mask_path, overlap=overlap, batch_size=batch_size,
+                                    threshold=threshold, pixel_area_m2=gsd * gsd or None, progress=report)
+        finally:
+            raster.close()
+    except Exception as e:
+        st.error(f"Segmentation failed: {e}")
+        return
+    finally:
+        if uploaded is not None and not server_path:
+            os.remove(path)
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Flooded area", f"{result['flooded_km2']:.2f} km²" if result["flooded_km2"] is not None else "n/a")
+    col2.metric("Coverage", f"{result['coverage']:.1%}")
+    col3.metric("Tiles/sec", f"{result['tiles'] / result['seconds']:.1f}")
+    st.caption(f"{result['width']}×{result['height']} px scene in {result['seconds']:.1f} s")
+    st.image(result["preview"].astype(np.uint8) * 255, caption="Flood mask (preview)", clamp=True)
+    png = mask_png(mask_path, result["width"])
+    os.remove(mask_path)
+    st.download_button("Download mask (PNG)", png, file_name="flood_mask.png", mime="image/png")
+    if result["bounds"] is not None:
+        st.download_button("Download flood extent (GeoJSON)", flood_geojson(result["preview"], result["bounds"]),
+                           file_name="flood_extent.geojson", mime="application/geo+json",
+                           help="Upload on the route planner to route around the flooded area.")
+
+segmentation_section()
+st.divider()
+
 # How It Works Section
 st.subheader("How Does It Work?")
 st.markdown("""
@@ -26,7 +128,7 @@ st.markdown("""
 - **Architecture Highlights:** Designed for semantic segmentation tasks with skip connections to capture spatial details.  
 - **Accuracy:** Achieved an impressive **91.76%** segmentation accuracy.
 """)
-st.image('./assets/floods/model_plot.png', caption="U-NET Model Architecture")
+st.image(web_image('./assets/floods/model_plot.png'), caption="U-NET Model Architecture")
 st.divider()
 
 # Results Section
@@ -35,4 +137,4 @@ st.markdown("""
 The model demonstrates exceptional performance in identifying flood-affected areas from satellite images. 
 Below is an example of segmented outputs produced by the model:
 """)
-st.image('./assets/floods/output_flood_segmentation.png', caption="Flood Segmentation Results")
+st.image(web_image('./assets/floods/output_flood_segmentation.png'), caption="Flood Segmentation Results")
@@ -1,5 +1,16 @@
+import csv
+import io
+import math
+
 import streamlit as st
 
+from utils.assets import web_image
+from utils.hotspots import DEFAULT_HOTSPOT_DIR, LEVELS, HotspotGrid, level_for_span
+from utils.pipeline import list_directory
+from utils.settings import secrets_section
+from utils.wildfire import (DEFAULT_KERAS_PATH, DEFAULT_TFLITE_PATH, KerasScorer, compare_scorers, labelled_tiles,
+                            load_scorer, score_tiles)
+
 st.set_page_config(page_title='Wildfire Detection', page_icon='🔥', initial_sidebar_state='expanded')
 
 # Title and Introduction
@@ -11,6 +22,144 @@ to detect wildfires at their earliest stages, enabling faster and more effective
 """)
 st.divider()
 
+@st.cache_resource(show_spinner="Loading wildfire model...")
+def load_wildfire_scorer(keras_path, tflite_path, quantized):
+    return load_scorer(keras_path, tflite_path, quantized)
+
+@st.cache_resource(show_spinner=False)
+def get_hotspot_grid(path):
+    return HotspotGrid(path)
+
+def add_hotspots(grid, rows):
+    """Feed scored tiles that carry coordinates into the hotspot grid."""
+    located = [row for row in rows if row["lat"] is not None and row["lon"] is not None]
+    if located:
+        grid.add([row["lat"] for row in located], [row["lon"] for row in located],
+                 [float(row["wildfire_probability"]) for row in located])
+    return len(located)
+
+def tiles_in(path):
+    """Tiles in a folder, including class subfolders of a held-out set."""
+    return labelled_tiles(path) or list_directory(path)
+
+def scoring_section():
+    st.subheader("Score Satellite Tiles")
+    settings = secrets_section("wildfire")
+    grid = get_hotspot_grid(settings.get("hotspot_dir", DEFAULT_HOTSPOT_DIR))
+    keras_path = settings.get("keras_model", DEFAULT_KERAS_PATH)
+    tflite_path = settings.get("tflite_model", DEFAULT_TFLITE_PATH)
+    variant = st.radio("Model", ["Quantized (int8 weights)", "FP32"], horizontal=True)
+    try:
+        scorer = load_wildfire_scorer(keras_path, tflite_path, variant != "FP32")
+    except Exception as e:
+        st.info(f"Wildfire model not available on this server: {e}")
+        return
+    if variant != "FP32" and isinstance(scorer, KerasScorer):
+        st.caption("Quantized model not found; using the FP32 model.")
+
+    uploads = st.file_uploader("Upload tiles or zip archives", type=["jpg", "jpeg", "png", "zip"],
+                               accept_multiple_files=True)
+    folder = st.text_input("...or a folder of tiles on the server", placeholder="/data/viirs/tiles")
+    batch_size = st.number_input("Batch size", min_value=1, max_value=256, value=32)
+    if st.button("Score Tiles"):
+        try:
+            items = tiles_in(folder) if folder else list(uploads or [])
+        except OSError as e:
+            st.error(f"Could not read {folder}: {e}")
+            return
+        if not items:
+            st.error("Upload tiles or enter a folder first.")
+            return
+        status = st.empty()
+        rows, stats = score_tiles(items, scorer, batch_size=batch_size,
+                                  progress=lambda done: status.caption(f"Scored {done} tiles..."))
+        status.empty()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Tiles/sec", f"{stats['tiles_per_second']:.1f}")
+        col2.metric("Wildfire tiles", sum(row["prediction"] == "wildfire" for row in rows))
+        col3.metric("Accuracy", f"{stats['accuracy']:.1%}" if stats["accuracy"] is not None else "n/a",
+                    help="Over tiles inside wildfire/ or nowildfire/ folders.")
+        located = add_hotspots(grid, rows)
+        if located:
+            st.caption(f"{located} located tile(s) added to the hotspot map.")
+        rows.sort(key=lambda row: row["wildfire_probability"], reverse=True)
+        st.dataframe(rows, use_container_width=True)
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+        st.download_button("Download scores (CSV)", buffer.getvalue(), file_name="wildfire_scores.csv",
+                           mime="text/csv")
+
+    with st.expander("Compare FP32 and quantized models"):
+        holdout = st.text_input("Held-out set (folder with wildfire/ and nowildfire/)",
+                                value=settings.get("holdout_dir", ""))
+        if st.button("Run Comparison") and holdout:
+            try:
+                fp32 = load_wildfire_scorer(keras_path, tflite_path, False)
+                quantized = load_wildfire_scorer(keras_path, tflite_path, True)
+                if isinstance(quantized, KerasScorer):
+                    st.warning("No quantized model to compare against.")
+                    return
+                report = compare_scorers(labelled_tiles(holdout), fp32, quantized, batch_size)
+            except Exception as e:
+                st.error(f"Comparison failed: {e}")
+                return
+            if report["accuracy_delta"] is None:
+                st.error("No labelled tiles found in that folder.")
+                return
+            base, cand = report["baseline"], report["candidate"]
+            col1, col2, col3 = st.columns(3)
+            col1.metric("FP32 accuracy", f"{base['accuracy']:.2%}", f"{base['tiles_per_second']:.1f} tiles/s",
+                        delta_color="off")
+            col2.metric("Quantized accuracy", f"{cand['accuracy']:.2%}", f"{report['accuracy_delta']:+.2%}")
+            col3.metric("Speed-up", f"{cand['tiles_per_second'] / base['tiles_per_second']:.1f}x",
+                        f"{report['agreement']:.1%} agreement", delta_color="off")
+
+def hotspot_section():
+    st.subheader("Wildfire Hotspots")
+    grid = get_hotspot_grid(secrets_section("wildfire").get("hotspot_dir", DEFAULT_HOTSPOT_DIR))
+    with st.expander("Import scores"):
+        uploaded = st.file_uploader("Scores CSV (lat, lon, wildfire_probability)", type=["csv"])
+        if uploaded is not None and st.button("Import"):
+            try:
+                scores = list(csv.DictReader(io.StringIO(uploaded.getvalue().decode("utf-8-sig"))))
+                added = grid.add([float(r["lat"] or "nan") for r in scores], [float(r["lon"] or "nan") for r in scores],
+                                 [float(r["wildfire_probability"]) for r in scores])
+            except (KeyError, ValueError) as e:
+                st.error(f"Could not read scores: {e}")
+            else:
+                st.success(f"Merged {added} located score(s).")
+    if not grid.total():
+        st.caption("Score located tiles above to build the hotspot map.")
+        return
+
+    # pydeck is only needed once there is something to draw
+    import pydeck as pdk
+
+    south, west, north, east = grid.extent()
+    span = max(east - west, north - south)
+    suggested = level_for_span(span)
+    level = st.select_slider("Grid detail", options=list(LEVELS), value=suggested)
+    cells = grid.cells(level)
+    for cell in cells:
+        cell["color"] = [255, int(220 * (1 - cell["mean"])), 0, 60 + int(180 * cell["mean"])]
+    layer = pdk.Layer("PolygonLayer", data=cells, get_polygon="polygon", get_fill_color="color",
+                      stroked=False, pickable=True)
+    view_state = pdk.ViewState(latitude=(south + north) / 2, longitude=(west + east) / 2,
+                               zoom=min(12, max(1, math.log2(360 / span))))
+    st.pydeck_chart(pdk.Deck(
+        layers=[layer],
+        initial_view_state=view_state,
+        map_style="light",
+        tooltip={"text": "{count} tiles · {fires} wildfire\nmean p={mean} · max p={max}"},
+    ))
+    st.caption(f"{grid.total()} tiles aggregated into {len(cells)} cells at level {level}.")
+
+scoring_section()
+hotspot_section()
+st.divider()
+
 # How It Works Section
 st.subheader("How Does It Work?")
 st.markdown("""
@@ -28,7 +177,7 @@ st.markdown("""
 - **Area Under Curve (AUC):** Scored an impressive **94.23%**, showcasing the model's robustness.  
 - **Confusion Matrix:** A detailed visualization of classification performance:
 """)
-st.image('./assets/wildfire/confusion_mat.png', caption="Confusion Matrix for Wildfire Detection")
+st.image(web_image('./assets/wildfire/confusion_mat.png'), caption="Confusion Matrix for Wildfire Detection")
 st.divider()
 
 # Results Section
@@ -37,4 +186,4 @@ st.markdown("""
 The results highlight the model's ability to accurately identify wildfire zones 
 from satellite imagery. Below is an example of predictions made by the system:
 """)
-st.image('./assets/wildfire/results.png', caption="Wildfire Detection Results")
+st.image(web_image('./assets/wildfire/results.png'), caption="Wildfire Detection Results")
@@ -1,6 +1,21 @@
+import csv
+import io
+import json
+import math
+import os
+import time
 import streamlit as st
-import requests
-import pydeck as pdk
+from utils import metrics
+from utils.assets import stylesheet
+from utils.clients import describe_error
+from utils.detection_store import get_detection_store
+from utils.dispatch import plan_dispatch
+from utils.geocode import get_geocoder, parse_coordinates
+from utils.hazards import HazardLayer, polygons_from_geojson
+from utils.hotspots import level_for_span
+from utils.routing import RoadGraph
+from utils.weather import get_weather_cache
+from utils.settings import secrets_section
 
 # Page Configuration
 st.set_page_config(
@@ -10,77 +25,96 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# CSS Styling
-st.markdown("""
-    <style>
-    body {
-        background-color: #121212;
-        color: #ffffff;
-    }
-    .footer {
-        background: #1e2127;
-        padding: 2rem;
-        border-radius: 15px;
-        margin-top: 2rem;
-        color: #ffffff;
-    }
-    .footer-container {
-        display: grid;
-        grid-template-columns: repeat(auto-fit, minmax(250px, 1fr));
-        gap: 1.5rem;
-    }
-    .footer-card {
-        background: #2a2d35;
-        padding: 2rem;
-        border-radius: 15px;
-        text-align: center;
-        box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1), 0 2px 4px -1px rgba(0, 0, 0, 0.06);
-        transition: transform 0.3s ease, box-shadow 0.3s ease;
-    }
-    .footer-card:hover {
-        transform: translateY(-10px);
-        box-shadow: 0 10px 15px -3px rgba(0, 0, 0, 0.1), 0 4px 6px -2px rgba(0, 0, 0, 0.05);
-    }
-    .footer-icon {
-        font-size: 3rem;
-        margin-bottom: 1rem;
-        color: #00B4DB;
-    }
-    .footer-title {
-        font-size: 1.3rem;
-        font-weight: 600;
-        margin-bottom: 0.5rem;
-    }
-    .footer-text {
-        font-size: 1rem;
-        line-height: 1.5;
-        color: #b3b3b3;
-    }
-    </style>
-""", unsafe_allow_html=True)
+# CSS Styling (static/weather.css), minified once per process
+st.markdown(stylesheet("weather.css"), unsafe_allow_html=True)
 
 # Helper Functions
+def weather_cache():
+    """Return the shared weather cache; TTL defaults to the 30 minutes shown in the footer."""
+    settings = secrets_section("weather")
+    return get_weather_cache(settings["api_key"], float(settings.get("ttl_seconds", 30 * 60)))
+
+@metrics.timed("weather")
 def get_weather(city_name):
-    """Fetch weather data for a given city."""
-    api_key = st.secrets["weather"]["api_key"]
-    base_url = f"https://api.openweathermap.org/data/2.5/weather?q={city_name}&appid={api_key}&units=metric"
-    response = requests.get(base_url)
-    return response.json() if response.status_code == 200 else None
+    """Fetch weather data for a given city, or None if the service cannot be reached."""
+    try:
+        return weather_cache().get(city_name)
+    except (OSError, ValueError, KeyError) as e:
+        # Network failures, and 200 responses whose body is not the JSON we expect
+        st.warning(f"Weather service unavailable: {describe_error(e)}")
+        return None
 
+@metrics.timed("geocode")
 def get_coordinates(city_name):
     """Get coordinates for a given city."""
-    base_url = f"https://nominatim.openstreetmap.org/search?q={city_name}&format=json&limit=1"
-    headers = {'User-Agent': 'SahaytaApp/1.0'}
-    response = requests.get(base_url, headers=headers)
-    if response.status_code == 200:
-        data = response.json()
-        if data:
-            return float(data[0]['lat']), float(data[0]['lon'])
-    return None, None
-
-def generate_map(start_coords, end_coords=None):
+    try:
+        return get_geocoder().lookup(city_name)
+    except Exception:
+        return None, None
+
+@st.cache_resource(show_spinner="Loading road network...")
+def load_road_graph(graph_dir, version):
+    # ``version`` only keys the cache, so a rebuilt graph is mapped afresh.
+    # Graphs and landmarks are built offline by ``python -m utils.routing``; the page only maps them.
+    return RoadGraph.load(graph_dir)
+
+def get_road_graph():
+    """Return the prebuilt road graph from the [routing] secrets, or None if none has been built."""
+    settings = secrets_section("routing")
+    network_path = settings.get("network_path")
+    graph_dir = settings.get("graph_dir", os.path.join(".cache", "road_graph"))
+    marker = os.path.join(graph_dir, "weight.npy")
+    build = f"`python -m utils.routing {network_path} {graph_dir}`"
+    if not os.path.exists(marker):
+        if network_path:
+            st.info(f"The road graph has not been built yet; run {build} once.")
+        return None
+    if network_path and os.path.exists(network_path) and os.path.getmtime(network_path) > os.path.getmtime(marker):
+        st.warning(f"The road graph is older than {network_path}; rebuild it with {build}.")
+    return load_road_graph(graph_dir, os.path.getmtime(marker))
+
+@st.cache_resource(show_spinner=False)
+def _hazard_layer(graph_key, _graph):
+    return HazardLayer(_graph)
+
+def get_hazard_layer(graph):
+    """Process-wide hazard layer, so every operator routes around the same closures; one per loaded graph."""
+    return _hazard_layer(graph.key, graph)
+
+HAZARD_COLORS = {"flood": [52, 152, 219, 90], "wildfire": [231, 76, 60, 90], "closure": [241, 196, 15, 90]}
+DETECTION_WINDOWS = {"Last hour": 3600, "Last 6 hours": 6 * 3600, "Last 24 hours": 24 * 3600,
+                     "Last 7 days": 7 * 24 * 3600, "All time": None}
+
+def detection_layer(cells):
+    """Grid cells of recorded detections, shaded by the number of people found in them."""
+    import pydeck as pdk
+    peak = max((cell.get("person", 0) for cell in cells), default=0) or 1
+    for cell in cells:
+        cell.setdefault("person", 0)
+        cell.setdefault("animal", 0)
+        share = cell["person"] / peak
+        cell["color"] = [142, 68, 173, 50 + int(170 * share)]
+    return pdk.Layer("PolygonLayer", data=cells, get_polygon="polygon", get_fill_color="color",
+                     stroked=False, pickable=True)
+
+@metrics.timed("map.build")
+def generate_map(start_coords, end_coords=None, route=None, hazards=None, detections=None):
     """Generate a map with route and location markers."""
+    import pydeck as pdk
     layers = []
+    if detections:
+        layers.append(detection_layer(detections))
+    if hazards:
+        layers.append(
+            pdk.Layer(
+                "PolygonLayer",
+                data=[{"polygon": [[lon, lat] for lat, lon in h["polygon"]],
+                       "color": HAZARD_COLORS.get(h["kind"], HAZARD_COLORS["closure"])} for h in hazards],
+                get_polygon="polygon",
+                get_fill_color="color",
+                stroked=False,
+            )
+        )
     layers.append(
         pdk.Layer(
             "ScatterplotLayer",
@@ -91,7 +125,18 @@ def generate_map(start_coords, end_coords=None):
             pickable=True,
         )
     )
-    if end_coords:
+    if route:
+        layers.append(
+            pdk.Layer(
+                "PathLayer",
+                data=[{"path": route["path"]}],
+                get_path="path",
+                get_color=[52, 152, 219],
+                width_scale=2,
+                width_min_pixels=4,
+            )
+        )
+    elif end_coords:
         layers.append(
             pdk.Layer(
                 "LineLayer",
@@ -108,6 +153,7 @@ def generate_map(start_coords, end_coords=None):
                 width_min_pixels=3,
             )
         )
+    if end_coords:
         layers.append(
             pdk.Layer(
                 "ScatterplotLayer",
@@ -145,21 +191,228 @@ def weather_section():
                 st.write(f"Conditions: {weather_data['weather'][0]['description'].capitalize()}")
             else:
                 st.error("Unable to fetch weather data. Please check the city name.")
+            cache = weather_cache()
+            age, stats = cache.age(city_name), cache.stats()
+            if age is not None:
+                st.caption(f"Updated {age / 60:.0f} min ago · cache hit rate {stats['hit_rate']:.0%}")
+
+def hazards_section(layer):
+    with st.expander(f"⚠️ Hazards & road closures ({len(layer.hazards)} active)"):
+        effect = st.radio("Effect on routes", ["Avoid completely", "Penalise (5x cost)"], horizontal=True)
+        factor = math.inf if effect == "Avoid completely" else 5.0
+
+        uploaded = st.file_uploader("Flood extents or closures (GeoJSON polygons)", type=["geojson", "json"])
+        if uploaded is not None and st.button("Add polygons"):
+            try:
+                rings = list(polygons_from_geojson(json.load(uploaded)))
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                # Not JSON, or JSON that is not a GeoJSON feature collection or geometry
+                st.error(f"Could not read {uploaded.name} as GeoJSON polygons: {e}")
+            else:
+                added = [layer.add_polygon(ring, kind="flood", factor=factor, label=uploaded.name)
+                         for ring in rings]
+                st.success(f"Added {len(added)} hazard polygon(s).")
+
+        col1, col2, col3 = st.columns(3)
+        centre = col1.text_input("Centre (lat, lon)", placeholder="19.07, 72.88")
+        radius_km = col2.number_input("Radius (km)", min_value=0.1, value=1.0, step=0.5)
+        kind = col3.selectbox("Type", ["closure", "flood", "wildfire"])
+        if st.button("Add area"):
+            coords = parse_coordinates(centre) or get_coordinates(centre)
+            if None in coords:
+                st.error("Could not locate the hazard centre.")
+            else:
+                layer.add_circle(coords[0], coords[1], radius_km * 1000, kind=kind, factor=factor,
+                                 label=f"{kind} {radius_km:g} km around {centre}")
+
+        for hazard in list(layer.hazards.values()):
+            col1, col2 = st.columns([4, 1])
+            effect = "closed" if math.isinf(hazard["factor"]) else f"x{hazard['factor']:g} cost"
+            col1.write(f"{hazard['label']} · {len(hazard['edges'])} road segments {effect}")
+            if col2.button("Remove", key=f"remove-hazard-{hazard['id']}"):
+                layer.remove(hazard["id"])
+                st.rerun()
 
 def route_section():
     st.subheader("🗺️ Emergency Route Planner")
+    graph = get_road_graph()
+    hazards = get_hazard_layer(graph) if graph is not None else None
+    if hazards is not None:
+        hazards_section(hazards)
     start_location = st.text_input("Start Location:", placeholder="e.g., Mumbai")
     destination_location = st.text_input("Destination:", placeholder="e.g., Pune")
     if st.button("Plan Emergency Route"):
         if start_location and destination_location:
             start_coords = get_coordinates(start_location)
             end_coords = get_coordinates(destination_location)
-            if start_coords and end_coords:
+            if None not in start_coords and None not in end_coords:
+                route = None
+                if graph is not None:
+                    started = time.perf_counter()
+                    with metrics.span("route"):
+                        route = graph.route(start_coords, end_coords)
+                    elapsed_ms = 1000 * (time.perf_counter() - started)
                 st.success(f"Emergency Route: {start_location} → {destination_location}")
-                st.pydeck_chart(generate_map(start_coords, end_coords))
+                if route:
+                    st.write(f"Road distance: **{route['distance_m'] / 1000:.1f} km** (computed in {elapsed_ms:.0f} ms)")
+                elif graph is None:
+                    st.info("No road network configured; showing the straight-line direction only.")
+                else:
+                    st.warning("No road connection found in the loaded network; showing the straight line.")
+                active = list(hazards.hazards.values()) if hazards is not None else None
+                st.pydeck_chart(generate_map(start_coords, end_coords, route, active,
+                                             route_detections(start_coords, end_coords)))
             else:
                 st.error("Could not locate one or both locations. Please check the names.")
 
+    with st.expander("Pre-warm location cache"):
+        names = st.text_area("District / city names, one per line", placeholder="Mumbai\nPune\nNashik")
+        if st.button("Pre-warm cache") and names.strip():
+            progress = st.progress(0.0)
+            fetched = get_geocoder().prewarm(
+                names.splitlines(), progress=lambda done, total: progress.progress(done / total)
+            )
+            st.success(f"Cache ready; {fetched} new location(s) looked up.")
+
+def route_detections(start_coords, end_coords, margin=0.2):
+    """Detection cells of the last 24 hours around a route, for the route map."""
+    store = get_detection_store()
+    if not store.total():
+        return None
+    south, north = sorted((start_coords[0], end_coords[0]))
+    west, east = sorted((start_coords[1], end_coords[1]))
+    bbox = (south - margin, west - margin, north + margin, east + margin)
+    level = level_for_span(max(bbox[2] - bbox[0], bbox[3] - bbox[1]))
+    return store.cells(level, since=time.time() - 24 * 3600, bbox=bbox)
+
+def situation_section():
+    st.subheader("👥 Detected Victims")
+    store = get_detection_store()
+    if not store.total():
+        st.caption("Detections from geotagged photos on the Save Victims page appear here.")
+        return
+    col1, col2, col3 = st.columns(3)
+    window = DETECTION_WINDOWS[col1.selectbox("Time window", list(DETECTION_WINDOWS), index=2)]
+    centre = col2.text_input("Around (place or lat, lon)", placeholder="Whole area")
+    radius_km = col3.number_input("Within (km)", min_value=0.1, value=2.0, step=0.5)
+
+    query = {"since": time.time() - window if window else None}
+    if centre:
+        coords = parse_coordinates(centre) or get_coordinates(centre)
+        if None in coords:
+            st.error("Could not locate that place.")
+            return
+        query.update(centre=coords, radius_m=radius_km * 1000)
+    started = time.perf_counter()
+    with metrics.span("detections.query"):
+        counts = store.counts(**query)
+        extent = store.extent(**query)
+    elapsed_ms = 1000 * (time.perf_counter() - started)
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Persons", counts.get("person", 0))
+    col2.metric("Animals", counts.get("animal", 0))
+    col3.metric("Flood sightings", sum(n for label, n in counts.items() if label not in ("person", "animal")))
+    st.caption(f"{sum(counts.values())} of {store.total()} recorded detections match ({elapsed_ms:.1f} ms).")
+    if extent is None:
+        return
+
+    import pydeck as pdk
+    south, west, north, east = extent
+    span = max(east - west, north - south, 0.01)
+    cells = store.cells(level_for_span(span), **query)
+    view_state = pdk.ViewState(latitude=(south + north) / 2, longitude=(west + east) / 2,
+                               zoom=min(14, max(1, math.log2(360 / span))))
+    st.pydeck_chart(pdk.Deck(
+        layers=[detection_layer(cells)],
+        initial_view_state=view_state,
+        map_style="light",
+        tooltip={"text": "{person} persons · {animal} animals\n{count} detections"},
+    ))
+
+TEAM_COLORS = [[231, 76, 60], [52, 152, 219], [46, 204, 113], [155, 89, 182], [241, 196, 15], [230, 126, 34]]
+
+def read_stops(uploaded):
+    """Parse a CSV of victim locations with lat, lon and an optional people column."""
+    stops = []
+    for row in csv.DictReader(io.StringIO(uploaded.getvalue().decode("utf-8-sig"))):
+        row = {key.strip().lower(): value for key, value in row.items() if key}
+        stop = {"lat": float(row["lat"]), "lon": float(row["lon"]), "people": int(float(row.get("people") or 1))}
+        if not (math.isfinite(stop["lat"]) and math.isfinite(stop["lon"])):
+            raise ValueError(f"Row {len(stops) + 1} has no valid position")
+        stops.append(stop)
+    return stops
+
+def valid_team(team):
+    """Whether an edited team row has a name, a position and a positive boat capacity."""
+    try:
+        values = [float(team[key]) for key in ("lat", "lon", "capacity")]
+    except (KeyError, TypeError, ValueError):
+        return False
+    return bool(team.get("name")) and all(math.isfinite(v) for v in values) and values[2] > 0
+
+@metrics.timed("dispatch.map")
+def dispatch_map(teams, stops, plan):
+    """Map every team's trips in its own colour, with bases and victim locations."""
+    import pydeck as pdk
+    paths = [
+        {"path": trip["path"], "color": TEAM_COLORS[t % len(TEAM_COLORS)],
+         "name": f"{team['team']} · trip {n + 1} · {trip['load']:.0f} people"}
+        for t, team in enumerate(plan["teams"]) for n, trip in enumerate(team["trips"])
+    ]
+    points = [{"position": [s["lon"], s["lat"]], "color": [52, 73, 94], "radius": 60,
+               "name": f"{s['people']} people"} for s in stops]
+    points += [{"position": [t["lon"], t["lat"]], "color": TEAM_COLORS[i % len(TEAM_COLORS)], "radius": 250,
+                "name": t["name"]} for i, t in enumerate(teams)]
+    layers = [
+        pdk.Layer("PathLayer", data=paths, get_path="path", get_color="color",
+                  width_min_pixels=2, pickable=True),
+        pdk.Layer("ScatterplotLayer", data=points, get_position="position", get_color="color",
+                  get_radius="radius", pickable=True),
+    ]
+    view_state = pdk.ViewState(latitude=teams[0]["lat"], longitude=teams[0]["lon"], zoom=11)
+    return pdk.Deck(layers=layers, initial_view_state=view_state, map_style="light",
+                    tooltip={"text": "{name}"})
+
+def dispatch_section():
+    st.subheader("🚤 Rescue Dispatch")
+    st.caption("Assign victim locations to rescue teams and plan capacity-limited boat trips from each base.")
+    teams = st.data_editor(
+        [{"name": "Team A", "lat": 19.07, "lon": 72.88, "capacity": 10}],
+        num_rows="dynamic",
+        use_container_width=True,
+    )
+    uploaded = st.file_uploader("Victim locations (CSV with lat, lon, people)", type=["csv"])
+    budget = st.slider("Optimisation time budget (seconds)", 0.5, 10.0, 2.0, 0.5)
+    if st.button("Plan Dispatch"):
+        # Empty data_editor cells come back as None or NaN, and a NaN capacity would disable every limit
+        skipped = [t.get("name") or "(unnamed)" for t in teams if not valid_team(t)]
+        teams = [t for t in teams if valid_team(t)]
+        if skipped:
+            st.warning(f"Skipped {', '.join(skipped)}: every team needs a name, lat, lon and a capacity above 0.")
+        if not teams or uploaded is None:
+            st.error("Add at least one team and upload victim locations.")
+            return
+        try:
+            stops = read_stops(uploaded)
+        except (KeyError, ValueError) as e:
+            st.error(f"Could not read victim locations: {e}")
+            return
+        started = time.perf_counter()
+        with metrics.span("dispatch.plan"):
+            plan = plan_dispatch(teams, stops, time_budget=budget)
+        elapsed = time.perf_counter() - started
+        st.success(f"Planned {sum(len(t['trips']) for t in plan['teams'])} trips for {len(stops)} locations "
+                   f"in {elapsed:.1f} s.")
+        st.dataframe(
+            [{"Team": t["team"], "Trips": len(t["trips"]), "Stops": t["stops"], "People": int(t["people"]),
+              "Distance (km)": round(t["distance_m"] / 1000, 1)} for t in plan["teams"]],
+            use_container_width=True,
+        )
+        if plan["unassigned"]:
+            st.warning(f"{len(plan['unassigned'])} location(s) have more people than any boat can carry.")
+        st.pydeck_chart(dispatch_map(teams, stops, plan))
+
 # Footer
 def footer_section():
     st.markdown("""
@@ -187,12 +440,17 @@ def footer_section():
 
 # Main App
 def main():
-    tab1, tab2 = st.tabs(["🌦️ Weather Monitor", "🗺️ Route Planner"])
+    metrics.configure()
+    tab1, tab2, tab3 = st.tabs(["🌦️ Weather Monitor", "🗺️ Route Planner", "🚤 Rescue Dispatch"])
     with tab1:
         weather_section()
     with tab2:
         route_section()
+        situation_section()
+    with tab3:
+        dispatch_section()
     footer_section()
+    metrics.sidebar_panel()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1 @@
+"""Shared helpers used by the Sahayta.ai Streamlit pages."""
@@ -0,0 +1,81 @@
+"""
+Static page assets, prepared once per process instead of on every rerun.
+
+``st.image`` decodes any picture wider than the content column and re-encodes
+it as PNG on every script run -- over a second for the diagrams on the flood
+and wildfire pages. ``web_image`` does that work once, keeps the result under
+``.cache/web_assets`` for later processes and hands Streamlit bytes it can
+pass through untouched. Stylesheets are minified once into a
+ready ``<style>`` block, and files under ``static/`` are linked by URL
+(``[server] enableStaticServing``) so the browser fetches and caches them
+instead of receiving them with every rerun.
+"""
+import io
+import os
+import re
+
+import streamlit as st
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(ROOT, "static")
+WEB_ASSET_DIR = os.path.join(".cache", "web_assets")
+# Streamlit's own limit (twice the content width); anything wider is resized on every run
+MAX_IMAGE_WIDTH = 1460
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@st.cache_resource(show_spinner=False)
+def web_image(path, max_width=MAX_IMAGE_WIDTH):
+    """PNG bytes of the image at ``path``, scaled down to ``max_width``."""
+    from PIL import Image
+
+    stat = os.stat(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    cached = os.path.join(WEB_ASSET_DIR, f"{name}-{stat.st_size}-{int(stat.st_mtime)}-{max_width}.png")
+    if os.path.exists(cached):
+        return _read(cached)
+    with Image.open(path) as image:
+        if image.width <= max_width and image.format == "PNG":
+            return _read(path)
+        if image.width > max_width:
+            image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+    os.makedirs(WEB_ASSET_DIR, exist_ok=True)
+    # Written under a temporary name so a concurrent reader never sees half a file
+    partial = f"{cached}.{os.getpid()}.tmp"
+    with open(partial, "wb") as f:
+        f.write(buffer.getvalue())
+    os.replace(partial, cached)
+    return buffer.getvalue()
+
+
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r":\s+", ":", css)
+    return re.sub(r"\s*([{};,>])\s*", r"\1", css).replace(";}", "}").strip()
+
+
+@st.cache_resource(show_spinner=False)
+def stylesheet(name):
+    """``static/<name>`` minified into a ``<style>`` block for ``st.markdown``."""
+    with open(os.path.join(STATIC_DIR, name), encoding="utf-8") as f:
+        return f"<style>{minify_css(f.read())}</style>"
+
+
+def static_url(name):
+    """URL of ``static/<name>``, or None when static file serving is switched off."""
+    if not st.get_option("server.enableStaticServing"):
+        return None
+    return f"app/static/{name}"
+
+
+@st.cache_resource(show_spinner=False)
+def static_text(name):
+    with open(os.path.join(STATIC_DIR, name), encoding="utf-8") as f:
+        return f.read()
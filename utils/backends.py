@@ -0,0 +1,247 @@
+"""
+Inference backends for the victim detection model.
+
+``RemoteBackend`` calls the Roboflow hosted model; ``OnnxBackend`` runs an
+exported copy of the locally trained YOLOv8 model on CPU with ONNX Runtime
+(optionally through its OpenVINO execution provider). Both return the
+Roboflow prediction schema -- centre ``x``/``y``, ``width``, ``height``,
+``confidence``, ``class`` and ``class_id`` in input-image pixels -- so the
+rest of the app does not care which one produced a result. A ``RemoteBackend``
+can be given a fallback -- typically a ``LazyBackend`` around the local model --
+that answers while the hosted API is unreachable, and a ``NearDuplicateIndex``
+(``utils.dedupe``) that answers near-identical frames from the cache.
+
+Export the trained weights once with::
+
+    yolo export model=detectFloodVictims/runs/detect/train/weights/best.pt format=onnx dynamic=True imgsz=640
+"""
+import ast
+import threading
+
+import numpy as np
+from PIL import Image
+
+from utils.cache import cache_key
+from utils.metrics import span
+from utils.preprocess import as_pil, prepare
+from utils.resilience import CircuitOpenError, is_retryable
+
+DEFAULT_ONNX_PATH = "detectFloodVictims/runs/detect/train/weights/best.onnx"
+# Roboflow exports classes alphabetically; used when the ONNX file carries no names
+DEFAULT_CLASS_NAMES = ["animal", "person"]
+
+
+class RemoteBackend:
+    """Roboflow hosted inference, optionally fronted by a DetectionCache and a near-duplicate index."""
+
+    def __init__(self, client, model_id, cache=None, fallback=None, dedupe=None):
+        self.client = client
+        self.model_id = model_id
+        self.cache = cache
+        self.fallback = fallback
+        self.dedupe = dedupe if cache is not None else None
+
+    def predict(self, image):
+        """Return the predictions for one image, raising on failure."""
+        image = prepare(image, size=None)
+        key = None
+        if self.cache is not None:
+            key = cache_key(image.digest, self.model_id)
+            predictions = self.cache.get(key)
+            if predictions is None and self.dedupe is not None:
+                with span("dedupe.lookup"):
+                    predictions = self.dedupe.reuse(image, self.model_id, self.cache)
+            if predictions is not None:
+                return predictions
+        try:
+            with span(f"infer.{self.model_id}"):
+                result = self.client.infer(image, model_id=self.model_id)
+        except OSError as e:
+            if self.fallback is None or not (isinstance(e, CircuitOpenError) or is_retryable(e)):
+                raise
+            # Not cached: the fallback's answer should not outlive the outage
+            return self.fallback.predict(image)
+        if 'predictions' not in result:
+            raise ValueError("Failed to get predictions from the model.")
+        if key is not None:
+            self.cache.put(key, result['predictions'])
+            if self.dedupe is not None:
+                self.dedupe.add(image)
+        return result['predictions']
+
+    def predict_batch(self, images):
+        # The hosted API takes one image per request
+        return [self.predict(image) for image in images]
+
+
+class LazyBackend:
+    """Builds a backend on first use, e.g. a local model kept only as a fallback."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        with self._lock:
+            if self._backend is None:
+                self._backend = self.factory()
+        return self._backend
+
+    def predict(self, image):
+        return self.backend.predict(image)
+
+    def predict_batch(self, images):
+        return self.backend.predict_batch(images)
+
+
+def letterbox(image, size=640, fill=114):
+    """
+    Resize a PIL image to fit in ``size`` x ``size`` keeping its aspect ratio and
+    pad the remainder. Returns the HWC uint8 array, the scale and the (x, y) pad.
+    """
+    width, height = image.size
+    scale = min(size / width, size / height)
+    new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    pad = ((size - new_size[0]) // 2, (size - new_size[1]) // 2)
+    canvas = Image.new("RGB", (size, size), (fill, fill, fill))
+    canvas.paste(image.convert("RGB").resize(new_size, Image.BILINEAR), pad)
+    return np.asarray(canvas), scale, pad
+
+
+def nms(boxes, scores, iou_threshold, metric="iou"):
+    """
+    Greedy non-maximum suppression over xyxy boxes; returns kept indices.
+    ``metric="ios"`` measures overlap against the smaller box instead, which
+    also merges a partial box cut off at a tile edge into its full twin.
+    """
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        if metric == "ios":
+            overlap = inter / (np.minimum(areas[i], areas[rest]) + 1e-9)
+        else:
+            overlap = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[overlap <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def batched_nms(boxes, scores, class_ids, iou_threshold, metric="iou"):
+    """Class-aware NMS: boxes of different classes never suppress each other."""
+    if not len(boxes):
+        return np.empty(0, dtype=np.int64)
+    # Shift each class into its own coordinate range so one NMS pass suffices
+    offsets = class_ids[:, None].astype(boxes.dtype) * (boxes.max() + 1)
+    return nms(boxes + offsets, scores, iou_threshold, metric)
+
+
+def decode_yolov8(output, conf_threshold=0.25, iou_threshold=0.45, max_detections=300):
+    """
+    Decode one raw YOLOv8 head output of shape ``(4 + num_classes, anchors)``
+    into xyxy boxes, scores and class ids after thresholding and NMS.
+    """
+    predictions = output.T
+    class_scores = predictions[:, 4:]
+    class_ids = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(class_scores)), class_ids]
+    mask = scores >= conf_threshold
+    predictions, scores, class_ids = predictions[mask], scores[mask], class_ids[mask]
+
+    cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    keep = batched_nms(boxes, scores, class_ids, iou_threshold)[:max_detections]
+    return boxes[keep], scores[keep], class_ids[keep]
+
+
+def to_predictions(boxes, scores, class_ids, class_names):
+    """Convert xyxy arrays into Roboflow-style prediction dicts."""
+    return [
+        {
+            "x": float((x1 + x2) / 2),
+            "y": float((y1 + y2) / 2),
+            "width": float(x2 - x1),
+            "height": float(y2 - y1),
+            "confidence": float(score),
+            "class": class_names[class_id] if class_id < len(class_names) else str(class_id),
+            "class_id": int(class_id),
+        }
+        for (x1, y1, x2, y2), score, class_id in zip(boxes.tolist(), scores.tolist(), class_ids.tolist())
+    ]
+
+
+class OnnxBackend:
+    """Local CPU inference of an exported YOLOv8 detector with ONNX Runtime."""
+
+    def __init__(self, model_path=DEFAULT_ONNX_PATH, class_names=None, conf_threshold=0.25,
+                 iou_threshold=0.45, providers=None, num_threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The local ONNX backend needs onnxruntime: pip install onnxruntime") from e
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            model_path, options, providers=providers or ["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_size = model_input.shape[2] if isinstance(model_input.shape[2], int) else 640
+        # Models exported without dynamic=True only accept a batch of one
+        self.fixed_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+        self.class_names = class_names or self._metadata_names() or DEFAULT_CLASS_NAMES
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+
+    def _metadata_names(self):
+        # Ultralytics stores the class map as "{0: 'animal', 1: 'person'}"
+        names = self.session.get_modelmeta().custom_metadata_map.get("names")
+        if not names:
+            return None
+        try:
+            mapping = ast.literal_eval(names)
+        except (ValueError, SyntaxError):
+            return None
+        return [mapping[i] for i in sorted(mapping)]
+
+    def predict(self, image):
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images):
+        """Run one forward pass over a list of PIL images and decode each result."""
+        if not images:
+            return []
+        images = [as_pil(image) for image in images]
+        prepared = [letterbox(image, self.input_size) for image in images]
+        batch = np.stack([array for array, _, _ in prepared]).transpose(0, 3, 1, 2)
+        batch = np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+        with span("infer.onnx"):
+            if self.fixed_batch:
+                outputs = np.concatenate([
+                    self.session.run(None, {self.input_name: batch[i:i + self.fixed_batch]})[0]
+                    for i in range(0, len(batch), self.fixed_batch)
+                ])
+            else:
+                outputs = self.session.run(None, {self.input_name: batch})[0]
+
+        results = []
+        for output, (_, scale, (pad_x, pad_y)), image in zip(outputs, prepared, images):
+            boxes, scores, class_ids = decode_yolov8(output, self.conf_threshold, self.iou_threshold)
+            # Undo the letterbox so boxes are in the caller's image coordinates
+            boxes = (boxes - [pad_x, pad_y, pad_x, pad_y]) / scale
+            boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, image.size[0])
+            boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, image.size[1])
+            results.append(to_predictions(boxes, scores, class_ids, self.class_names))
+        return results
@@ -0,0 +1,151 @@
+"""
+Content-addressed cache for model predictions.
+
+Results are keyed by a hash of the normalized image pixels plus the model id,
+so re-uploading the same image never pays for a second inference. Lookups go
+through a bounded in-memory LRU first and a persistent SQLite tier second;
+both tiers honour a TTL and the disk tier is trimmed to a maximum row count.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+from utils.settings import secrets_section
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "detections.sqlite3")
+DEFAULT_MEMORY_ITEMS = 256
+DEFAULT_DISK_ITEMS = 20000
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+def image_digest(image):
+    """Return a hex digest of a PIL image's size, mode and raw pixels."""
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def cache_key(digest, model_id):
+    return f"{model_id}:{digest}"
+
+
+class DetectionCache:
+    """Two-tier (memory LRU + SQLite) cache of prediction lists."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_memory_items=DEFAULT_MEMORY_ITEMS,
+                 max_disk_items=DEFAULT_DISK_ITEMS, ttl=DEFAULT_TTL):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = {"memory": 0, "disk": 0}
+        self._misses = 0
+        self._puts = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS detections ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS detections_accessed ON detections (accessed)")
+        self._db.commit()
+
+    def get(self, key):
+        """Return cached predictions for ``key`` or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._hits["memory"] += 1
+                    return value
+                del self._memory[key]
+
+            row = self._db.execute(
+                "SELECT value, created FROM detections WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] < self.ttl:
+                self._db.execute("UPDATE detections SET accessed = ? WHERE key = ?", (now, key))
+                self._db.commit()
+                value = json.loads(row[0])
+                self._remember(key, row[1], value)
+                self._hits["disk"] += 1
+                return value
+
+            self._misses += 1
+            return None
+
+    def put(self, key, value):
+        """Store ``value`` in both tiers, evicting expired and least recently used rows."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            self._db.execute(
+                "INSERT OR REPLACE INTO detections (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._puts += 1
+            # Trimming is cheap but not free, so only do it every so often
+            if self._puts % 64 == 1:
+                self._evict(now)
+            self._db.commit()
+
+    def _remember(self, key, created, value):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM detections WHERE created < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM detections WHERE key IN ("
+            "SELECT key FROM detections ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_items,),
+        )
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM detections")
+            self._db.commit()
+
+    def stats(self):
+        """Return hit/miss counters; every hit is one inference call saved."""
+        with self._lock:
+            hits = self._hits["memory"] + self._hits["disk"]
+            lookups = hits + self._misses
+            return {
+                "memory_hits": self._hits["memory"],
+                "disk_hits": self._hits["disk"],
+                "misses": self._misses,
+                "calls_saved": hits,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def get_detection_cache():
+    """Return the process-wide detection cache configured under ``[cache]`` in secrets."""
+    settings = secrets_section("cache")
+    return DetectionCache(
+        path=settings.get("path", DEFAULT_CACHE_PATH),
+        max_memory_items=int(settings.get("memory_items", DEFAULT_MEMORY_ITEMS)),
+        max_disk_items=int(settings.get("disk_items", DEFAULT_DISK_ITEMS)),
+        ttl=float(settings.get("ttl_seconds", DEFAULT_TTL)),
+    )
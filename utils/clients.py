@@ -0,0 +1,130 @@
+"""
+Process-wide HTTP clients shared by every page, session and rerun.
+
+Each upstream endpoint gets one keep-alive ``requests.Session`` with a sized
+connection pool and default timeouts, so reruns reuse warm TCP/TLS connections
+instead of handshaking on every call. Pool size and timeouts can be tuned in
+``.streamlit/secrets.toml``::
+
+    [http]
+    pool_size = 20
+    connect_timeout = 3.05
+    read_timeout = 30
+
+Per-endpoint timeouts, retries and circuit breaking come from
+``utils.resilience`` and take precedence over these session defaults.
+
+``requests`` is imported when the first session is created, not at page load.
+"""
+import re
+
+import streamlit as st
+
+from utils.preprocess import PreparedImage, encode_image
+from utils.resilience import get_policy
+from utils.settings import secrets_section
+
+ROBOFLOW_API_URL = "https://detect.roboflow.com"
+OPENWEATHER_API_URL = "https://api.openweathermap.org"
+NOMINATIM_API_URL = "https://nominatim.openstreetmap.org"
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 30
+# Query parameters the upstream APIs take their keys in
+_SECRET_PARAMS = re.compile(r"((?:api_key|appid|key)=)[^&\s'\"]+")
+
+
+class PooledSession:
+    """A ``requests.Session`` with a sized keep-alive pool and a default timeout."""
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=(DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT), headers=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def upstream_status(e):
+    """HTTP status of the response behind a failed request, or None if there was no response."""
+    return getattr(getattr(e, "response", None), "status_code", None)
+
+
+def describe_error(e):
+    """
+    A message for ``e`` that is safe to show to users. ``requests`` puts the
+    full URL, including the ``api_key`` query parameter, into its error text,
+    so HTTP errors are reduced to their status and anything else is masked.
+    """
+    status = upstream_status(e)
+    if status is not None:
+        return f"upstream returned HTTP {status} {e.response.reason or ''}".strip()
+    return _SECRET_PARAMS.sub(r"\1***", str(e))
+
+
+@st.cache_resource(show_spinner=False)
+def get_session(endpoint, headers=None):
+    """Return the shared keep-alive session for ``endpoint``."""
+    settings = secrets_section("http")
+    timeout = (
+        float(settings.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT)),
+        float(settings.get("read_timeout", DEFAULT_READ_TIMEOUT)),
+    )
+    return PooledSession(
+        pool_size=int(settings.get("pool_size", DEFAULT_POOL_SIZE)),
+        timeout=timeout,
+        headers=dict(headers) if headers else None,
+    )
+
+
+class InferenceClient:
+    """Minimal Roboflow hosted-inference client running over a pooled session."""
+
+    def __init__(self, api_key, api_url=ROBOFLOW_API_URL, session=None, policy=None):
+        self.api_key = api_key
+        self.api_url = api_url.rstrip("/")
+        self.session = session if session is not None else get_session(self.api_url)
+        self.policy = policy if policy is not None else get_policy("roboflow")
+
+    def infer(self, image, model_id):
+        """Run ``model_id`` on a PIL or prepared image and return the decoded JSON response."""
+        payload = image.payload if isinstance(image, PreparedImage) else encode_image(image)
+
+        def post():
+            response = self.session.post(
+                f"{self.api_url}/{model_id}",
+                params={"api_key": self.api_key},
+                data=payload,
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+                timeout=self.policy.timeout,
+            )
+            response.raise_for_status()
+            return response.json()
+
+        # Inference has no side effects, so the POST is safe to retry and hedge
+        return self.policy.call(post, hedge=True)
+
+
+@st.cache_resource(show_spinner=False)
+def get_inference_client(api_key, api_url=ROBOFLOW_API_URL):
+    """Return the shared inference client for an API key and endpoint."""
+    return InferenceClient(api_key, api_url=api_url)
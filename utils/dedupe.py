@@ -0,0 +1,271 @@
+"""
+Near-duplicate filter ahead of inference.
+
+Drone sorties and phone uploads are full of frames that differ only by JPEG
+noise, exposure or a few pixels of drift, and the exact-pixel detection cache
+misses every one of them. Each normalized 640x640 input gets a 64-bit
+perceptual hash: the sign of its low-frequency DCT coefficients against their
+median (pHash), computed in NumPy with two matrix products. Hashes of images
+that were really inferred go into a BK-tree keyed by Hamming distance. A new
+image within ``max_distance`` bits of one of them reuses that image's cached
+predictions instead of paying for another call.
+
+The tree is rebuilt at start-up from a small SQLite table of
+``(hash, image digest)`` rows, so it survives restarts alongside the detection
+cache it points into. It follows that cache's ``[cache]`` TTL and row limit:
+older hashes are dropped as new ones arrive, so the index never outgrows the
+predictions it can reuse. Tune it in ``.streamlit/secrets.toml``::
+
+    [dedupe]
+    enabled = true
+    max_distance = 6
+"""
+import functools
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import streamlit as st
+from PIL import Image
+
+from utils.cache import DEFAULT_DISK_ITEMS, DEFAULT_TTL, cache_key
+from utils.settings import secrets_section
+
+DEFAULT_DEDUPE_PATH = os.path.join(".cache", "near_duplicates.sqlite3")
+# Out of 64 bits. Recompressed, re-exposed or slightly shifted copies of the
+# bundled test images land within 8, while distinct images are 16 or more apart
+DEFAULT_MAX_DISTANCE = 6
+HASH_SIZE = 8
+HASH_RESOLUTION = 32
+
+
+@functools.lru_cache(maxsize=None)
+def _dct_matrix(n):
+    """Orthonormal DCT-II matrix, so ``C @ X @ C.T`` is the 2-D DCT of ``X``."""
+    k, i = np.meshgrid(np.arange(n), np.arange(n), indexing="ij")
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+def _grayscale(images, size):
+    return np.stack([
+        np.asarray(image.convert("L").resize(size, Image.LANCZOS), dtype=np.float64) for image in images
+    ])
+
+
+def _pack(bits):
+    """Rows of 64 booleans as unsigned 64-bit integers."""
+    return np.packbits(bits.reshape(len(bits), -1), axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def phash_batch(images):
+    """pHash of each PIL image: low 8x8 DCT coefficients above their median, as uint64."""
+    pixels = _grayscale(images, (HASH_RESOLUTION, HASH_RESOLUTION))
+    dct = _dct_matrix(HASH_RESOLUTION)
+    low = (dct @ pixels @ dct.T)[:, :HASH_SIZE, :HASH_SIZE].reshape(len(images), -1)
+    # The DC term is the mean brightness and would swamp the median
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    return _pack(low > median)
+
+
+def dhash_batch(images):
+    """dHash of each PIL image: whether each pixel is brighter than its right neighbour, as uint64."""
+    pixels = _grayscale(images, (HASH_SIZE + 1, HASH_SIZE))
+    return _pack(pixels[:, :, 1:] > pixels[:, :, :-1])
+
+
+def phash(image):
+    return int(phash_batch([image])[0])
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes for Hamming-radius search.
+
+    Removal leaves a tombstone (a node whose value is None) that still routes
+    searches; ``dead`` counts them so the owner can rebuild when they pile up.
+    """
+
+    def __init__(self):
+        # A node is [hash, value, {distance: child}]
+        self.root = None
+        self.size = 0
+        self.dead = 0
+
+    def add(self, item, value):
+        self.size += 1
+        if self.root is None:
+            self.root = [item, value, {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(item, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [item, value, {}]
+                return
+            node = child
+
+    def remove(self, item, value):
+        """Tombstone the entry ``(item, value)``; returns whether it was found."""
+        node = self.root
+        while node is not None:
+            if node[0] == item and node[1] == value:
+                node[1] = None
+                self.size -= 1
+                self.dead += 1
+                return True
+            node = node[2].get(hamming(item, node[0]))
+        return False
+
+    def search(self, item, radius):
+        """``(distance, hash, value)`` for every entry within ``radius``, nearest first."""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(item, node[0])
+            if distance <= radius and node[1] is not None:
+                found.append((distance, node[0], node[1]))
+            # By the triangle inequality only children in this band can hold matches
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return sorted(found, key=lambda match: match[0])
+
+
+class NearDuplicateIndex:
+    """
+    Perceptual hashes of inferred images, persisted in SQLite and searched
+    through a BK-tree. Hashes older than ``ttl`` seconds, and the oldest beyond
+    ``max_items``, are dropped, matching the detection cache they point into.
+    """
+
+    def __init__(self, path=DEFAULT_DEDUPE_PATH, max_distance=DEFAULT_MAX_DISTANCE,
+                 max_items=DEFAULT_DISK_ITEMS, ttl=DEFAULT_TTL):
+        self.path = path
+        self.max_distance = max_distance
+        self.max_items = max_items
+        self.ttl = ttl
+        self.tree = BKTree()
+        # digest -> (hash, created), oldest first
+        self._known = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "reused": 0, "added": 0, "expired": 0}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS hashes ("
+                         "digest TEXT PRIMARY KEY, hash INTEGER NOT NULL, created REAL NOT NULL DEFAULT 0)")
+        if "created" not in [row[1] for row in self._db.execute("PRAGMA table_info(hashes)")]:
+            # Indexes written before hashes expired; start their clock now
+            self._db.execute("ALTER TABLE hashes ADD COLUMN created REAL NOT NULL DEFAULT 0")
+            self._db.execute("UPDATE hashes SET created = ?", (time.time(),))
+        self._db.commit()
+        for digest, value, created in self._db.execute("SELECT digest, hash, created FROM hashes ORDER BY created"):
+            # SQLite integers are signed; hashes are stored as their two's complement
+            self._known[digest] = (value & 0xFFFFFFFFFFFFFFFF, created)
+        with self._lock:
+            self._prune(time.time())
+            self._rebuild()
+
+    def add(self, image):
+        """Remember a ``PreparedImage`` whose predictions were just cached."""
+        now = time.time()
+        with self._lock:
+            if image.digest in self._known:
+                return
+            self.tree.add(image.phash, image.digest)
+            self._known[image.digest] = (image.phash, now)
+            signed = image.phash - (1 << 64) if image.phash >= 1 << 63 else image.phash
+            self._db.execute("INSERT OR IGNORE INTO hashes (digest, hash, created) VALUES (?, ?, ?)",
+                             (image.digest, signed, now))
+            self._prune(now)
+            self._db.commit()
+            self._stats["added"] += 1
+
+    def _prune(self, now):
+        """Drop expired and surplus hashes, oldest first; the caller commits."""
+        dropped = []
+        while self._known:
+            digest, (value, created) = next(iter(self._known.items()))
+            if now - created < self.ttl and len(self._known) <= self.max_items:
+                break
+            del self._known[digest]
+            self.tree.remove(value, digest)
+            dropped.append((digest,))
+        if dropped:
+            self._db.executemany("DELETE FROM hashes WHERE digest = ?", dropped)
+            self._stats["expired"] += len(dropped)
+        # Tombstones still cost a distance check per search; rebuild once they dominate
+        if self.tree.dead > max(self.tree.size, 64):
+            self._rebuild()
+
+    def _rebuild(self):
+        self.tree = BKTree()
+        for digest, (value, _) in self._known.items():
+            self.tree.add(value, digest)
+
+    def matches(self, image):
+        """Digests of indexed, unexpired images within ``max_distance`` of ``image``, nearest first."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            return [digest for _, _, digest in self.tree.search(image.phash, self.max_distance)
+                    if digest != image.digest and self._known[digest][1] > cutoff]
+
+    def reuse(self, image, model_id, cache):
+        """Cached predictions of ``model_id`` for the nearest near-duplicate of ``image``, or None."""
+        self._count("lookups")
+        for digest in self.matches(image):
+            predictions = cache.get(cache_key(digest, model_id))
+            if predictions is not None:
+                self._count("reused")
+                return predictions
+        return None
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def clear(self):
+        with self._lock:
+            self.tree = BKTree()
+            self._known.clear()
+            self._db.execute("DELETE FROM hashes")
+            self._db.commit()
+
+    def stats(self):
+        """Counters; every reuse is one inference call avoided."""
+        with self._lock:
+            return {**self._stats, "calls_avoided": self._stats["reused"], "indexed": len(self._known),
+                    "max_distance": self.max_distance}
+
+
+@st.cache_resource(show_spinner=False)
+def _open_index(path, max_distance, max_items, ttl):
+    return NearDuplicateIndex(path, max_distance, max_items, ttl)
+
+
+def get_near_duplicate_index():
+    """
+    The process-wide index from the ``[dedupe]`` secrets, or None when it is
+    switched off. Its size and TTL follow the ``[cache]`` section.
+    """
+    settings = secrets_section("dedupe")
+    if not settings.get("enabled", True):
+        return None
+    cache = secrets_section("cache")
+    return _open_index(settings.get("path", DEFAULT_DEDUPE_PATH),
+                       int(settings.get("max_distance", DEFAULT_MAX_DISTANCE)),
+                       int(cache.get("disk_items", DEFAULT_DISK_ITEMS)),
+                       float(cache.get("ttl_seconds", DEFAULT_TTL)))
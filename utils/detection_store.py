@@ -0,0 +1,461 @@
+"""
+Geotagged detection store for area and time-window queries.
+
+Every detection that comes with a location -- EXIF GPS or coordinates typed by
+the operator -- is kept as one row of a few NumPy columns: time, lat, lon,
+label, confidence and an index key. The key packs the hour bucket into its
+high 20 bits and the Z-order (Morton) code of the level-22 grid cell (about
+5 m) into its low 44, the integer form of a geohash used by
+``utils.hotspots``. Sorting by it groups rows by hour and, within an hour, by
+geohash prefix, so any ``time window x bounding box`` query becomes a handful
+of ``searchsorted`` ranges: one per hour and covering cell. Only those rows
+are checked against the exact box, radius and time.
+
+Writes are append-only: each batch is saved at once as a small ``.npz``
+record batch under ``segments/``, kept unsorted in memory and scanned
+directly. Once enough have piled up they are sealed, and a background thread
+sorts them into a new immutable run under ``runs/`` (Parquet, or ``.npz``
+without pyarrow) and drops the folded segments. Runs are merged size-tiered,
+``MERGE_FANIN`` of similar size at a time, also in the background, so every
+row is rewritten only a logarithmic number of times and the writer never waits
+on a rewrite. ``manifest.json``, replaced atomically, names the live runs, so
+a crash mid-flush or mid-merge never loses or duplicates rows.
+
+Rows can be tagged with a source -- an image digest plus its location -- kept
+in the append-only ``sources.txt``; a source that was already recorded adds
+nothing, so re-running a batch or re-uploading a photo elsewhere does not
+count the same victims twice.
+"""
+import glob
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+import streamlit as st
+
+from utils.hotspots import cell_bounds, cell_codes
+from utils.routing import EARTH_RADIUS_M, haversine
+from utils.settings import secrets_section
+
+DEFAULT_STORE_DIR = os.path.join(".cache", "detection_store")
+CELL_LEVEL = 22
+CELL_BITS = 2 * CELL_LEVEL
+CELL_MASK = np.uint64((1 << CELL_BITS) - 1)
+BUCKET_SECONDS = 3600
+COLUMNS = {"key": np.uint64, "time": np.float64, "lat": np.float64, "lon": np.float64,
+           "label": np.uint16, "confidence": np.float32}
+COMPACT_SEGMENTS = 64
+COMPACT_ROWS = 100_000
+# Runs of about the same size merged at once; bounds both rewrites per row and runs per query
+MERGE_FANIN = 4
+# Covering cells per side of a query box; more ranges scan fewer rows but cost more searches
+COVER_CELLS = 8
+# Decimal places of the location in a source key (about 1 m)
+SOURCE_PRECISION = 5
+
+
+def index_keys(times, lat, lon):
+    """Sort keys: hour bucket in the high bits, level-22 Morton cell in the low bits."""
+    buckets = (np.asarray(times, dtype=np.float64) // BUCKET_SECONDS).astype(np.uint64)
+    return (buckets << np.uint64(CELL_BITS)) | cell_codes(lat, lon, CELL_LEVEL)
+
+
+def cover(south, west, north, east):
+    """Sorted, merged ``[start, end)`` ranges of level-22 cell codes covering a box."""
+    span = max(north - south, (east - west) / 2, 1e-9)
+    level = int(np.clip(math.floor(math.log2(180 * COVER_CELLS / span)), 0, CELL_LEVEL))
+    n = 1 << level
+    rows = np.arange(int((south + 90) / 180 * n), min(int((north + 90) / 180 * n), n - 1) + 1)
+    cols = np.arange(int((west + 180) / 360 * n), min(int((east + 180) / 360 * n), n - 1) + 1)
+    # Cell centres, so rounding at the edges cannot pick a neighbour
+    lat = (np.repeat(rows, len(cols)) + 0.5) / n * 180 - 90
+    lon = (np.tile(cols, len(rows)) + 0.5) / n * 360 - 180
+    shift = np.uint64(2 * (CELL_LEVEL - level))
+    starts = np.unique(cell_codes(lat, lon, level)) << shift
+    ends = starts + (np.uint64(1) << shift)
+    # Neighbouring Morton cells often form one contiguous run
+    breaks = np.flatnonzero(starts[1:] != ends[:-1]) + 1
+    return starts[np.r_[0, breaks]], ends[np.r_[breaks - 1, len(ends) - 1]]
+
+
+def _empty():
+    return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+
+def _concat(parts):
+    parts = [part for part in parts if len(part["key"])]
+    if not parts:
+        return _empty()
+    if len(parts) == 1:
+        return parts[0]
+    return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+
+def _take(columns, index):
+    return {name: values[index] for name, values in columns.items()}
+
+
+def _ranges(starts, ends):
+    """Concatenated ``arange(s, e)`` for every pair, without a Python loop."""
+    lengths = ends - starts
+    keep = lengths > 0
+    starts, lengths = starts[keep], lengths[keep]
+    if not len(lengths):
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + np.arange(lengths.sum()) - offsets
+
+
+class DetectionStore:
+    """Append-only columnar store of located detections with an hour x geohash index."""
+
+    def __init__(self, path=DEFAULT_STORE_DIR, compact_segments=COMPACT_SEGMENTS, compact_rows=COMPACT_ROWS):
+        self.path = path
+        self.compact_segments = compact_segments
+        self.compact_rows = compact_rows
+        # Guards the in-memory state; never held across a sort or a file rewrite
+        self._lock = threading.Lock()
+        # Serializes flushes and merges, which run on the background thread or in compact()
+        self._merge_lock = threading.Lock()
+        self._worker = None
+        os.makedirs(os.path.join(path, "segments"), exist_ok=True)
+        os.makedirs(os.path.join(path, "runs"), exist_ok=True)
+        self.labels = self._read_labels()
+        self._sources = self._read_sources()
+        self._runs = self._open_runs()
+        # Partial ``.tmp.npz`` files are left over from interrupted writes and ignored
+        self._segments = sorted(name for name in glob.glob(os.path.join(path, "segments", "*.npz"))
+                                if not name.endswith(".tmp.npz"))
+        self._tail = _concat([self._read_segment(name) for name in self._segments])
+        # Batches handed to the background thread: (segment names, columns), still scanned by queries
+        self._sealed = []
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_labels(self):
+        try:
+            with open(self._file("labels.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _read_sources(self):
+        try:
+            with open(self._file("sources.txt")) as f:
+                return {line.strip() for line in f if line.strip()}
+        except OSError:
+            return set()
+
+    def _label_ids(self, names):
+        """Ids of ``names`` in the label vocabulary, extending and saving it for new ones."""
+        names = [str(name) for name in names]
+        added = [name for name in dict.fromkeys(names) if name not in self.labels]
+        if added:
+            self.labels.extend(added)
+            partial = self._file(f"labels.json.{os.getpid()}.tmp")
+            with open(partial, "w") as f:
+                json.dump(self.labels, f)
+            os.replace(partial, self._file("labels.json"))
+        ids = {name: i for i, name in enumerate(self.labels)}
+        return np.array([ids[name] for name in names], dtype=np.uint16)
+
+    def _open_runs(self):
+        """Load the runs named by the manifest and clean up after any interrupted flush or merge."""
+        try:
+            with open(self._file("manifest.json")) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            # Stores written before runs existed keep one compacted base file
+            manifest = {"runs": [name for name in ("detections.parquet", "detections.npz")
+                                 if os.path.exists(self._file(name))][:1], "folded": []}
+        for name in manifest["folded"]:
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+        for name in glob.glob(os.path.join(self.path, "runs", "*")):
+            if os.path.relpath(name, self.path) not in manifest["runs"]:
+                os.remove(name)
+        self._seq = 1 + max([int(os.path.basename(name).split(".")[0]) for name in manifest["runs"]
+                             if name.startswith("runs")] or [0])
+        return [self._run(name, self._read_run(name)) for name in manifest["runs"]]
+
+    def _save_manifest(self, runs, folded=()):
+        partial = self._file(f"manifest.json.{os.getpid()}.tmp")
+        with open(partial, "w") as f:
+            json.dump({"runs": [run["file"] for run in runs], "folded": list(folded)}, f)
+        os.replace(partial, self._file("manifest.json"))
+
+    @staticmethod
+    def _run(name, columns):
+        return {"file": name, "columns": columns, "buckets": np.unique(columns["key"] >> np.uint64(CELL_BITS))}
+
+    def _read_run(self, name):
+        if name.endswith(".parquet"):
+            import pyarrow.parquet as pq
+
+            table = pq.read_table(self._file(name))
+            return {name: table.column(name).to_numpy().astype(dtype, copy=False) for name, dtype in COLUMNS.items()}
+        with np.load(self._file(name)) as data:
+            return {column: data[column] for column in COLUMNS}
+
+    def _write_run(self, columns):
+        """Save sorted ``columns`` as a new run file and return it as a run."""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            pa = None
+        name = os.path.join("runs", f"{self._seq:08d}.{'parquet' if pa is not None else 'npz'}")
+        self._seq += 1
+        partial = self._file(name[:-len(".npz")] + ".tmp.npz" if pa is None else name + ".tmp")
+        if pa is not None:
+            pq.write_table(pa.table(columns), partial, compression="zstd")
+        else:
+            np.savez(partial, **columns)
+        os.replace(partial, self._file(name))
+        return self._run(name, columns)
+
+    @staticmethod
+    def _read_segment(name):
+        with np.load(name) as data:
+            return {column: data[column] for column in COLUMNS}
+
+    def add(self, lat, lon, labels, confidences=None, timestamp=None, source=None):
+        """
+        Append detections at ``lat``/``lon`` (scalars or one value per label),
+        stamped with ``timestamp`` (default: now). Returns the rows added, which
+        is 0 when ``source`` has been recorded before.
+        """
+        count = len(labels)
+        now = time.time() if timestamp is None else timestamp
+        times = np.broadcast_to(np.asarray(now, dtype=np.float64), count)
+        lat = np.broadcast_to(np.asarray(lat, dtype=np.float64), count)
+        lon = np.broadcast_to(np.asarray(lon, dtype=np.float64), count)
+        confidences = np.ones(count, dtype=np.float32) if confidences is None else \
+            np.asarray(confidences, dtype=np.float32)
+        keep = np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+        if not keep.any():
+            return 0
+        labels = [label for label, kept in zip(labels, keep) if kept]
+        times, lat, lon, confidences = times[keep], lat[keep], lon[keep], confidences[keep]
+        with self._lock:
+            if source is not None and source in self._sources:
+                return 0
+            batch = {"key": index_keys(times, lat, lon), "time": times, "lat": lat, "lon": lon,
+                     "label": self._label_ids(labels), "confidence": confidences}
+            # Written first under a temporary name, so a crash never leaves half a segment behind
+            name = os.path.join(self.path, "segments", f"{time.time_ns()}-{os.getpid()}-{threading.get_ident()}.npz")
+            np.savez(name[:-4] + ".tmp.npz", **batch)
+            os.replace(name[:-4] + ".tmp.npz", name)
+            self._segments.append(name)
+            self._tail = _concat([self._tail, batch])
+            if source is not None:
+                self._sources.add(source)
+                with open(self._file("sources.txt"), "a") as f:
+                    f.write(source + "\n")
+            if len(self._segments) >= self.compact_segments or len(self._tail["key"]) >= self.compact_rows:
+                self._seal()
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._background, name="detection-store", daemon=True)
+                    self._worker.start()
+        return len(labels)
+
+    def add_predictions(self, lat, lon, predictions, timestamp=None, digest=None):
+        """
+        Append one image's prediction dicts, all located at the image's position.
+        With the image's ``digest``, an image already recorded at that place is skipped.
+        """
+        source = None if digest is None else \
+            f"{digest}@{float(lat):.{SOURCE_PRECISION}f},{float(lon):.{SOURCE_PRECISION}f}"
+        return self.add(lat, lon, [p["class"] for p in predictions],
+                        [p.get("confidence", 1.0) for p in predictions], timestamp, source)
+
+    def compact(self):
+        """Fold every pending segment and run into a single sorted run, waiting for it."""
+        with self._merge_lock:
+            with self._lock:
+                self._seal()
+            self._flush()
+            if len(self._runs) > 1:
+                self._merge(self._runs)
+
+    def _seal(self):
+        """Hand the unsorted tail to the next flush; the caller holds ``_lock``."""
+        if self._segments:
+            self._sealed.append((self._segments, self._tail))
+            self._segments, self._tail = [], _empty()
+
+    def _background(self):
+        try:
+            while True:
+                with self._merge_lock:
+                    self._flush()
+                    runs = self._merge_candidates()
+                    while runs:
+                        self._merge(runs)
+                        runs = self._merge_candidates()
+                with self._lock:
+                    if not self._sealed:
+                        self._worker = None
+                        return
+        except BaseException:
+            # Sealed batches stay queryable and on disk; the next seal retries
+            with self._lock:
+                self._worker = None
+            raise
+
+    def _flush(self):
+        """Sort the sealed batches into one new run; the caller holds ``_merge_lock``."""
+        with self._lock:
+            sealed = list(self._sealed)
+        if not sealed:
+            return
+        columns = _concat([columns for _, columns in sealed])
+        folded = [name for names, _ in sealed for name in names]
+        runs = list(self._runs)
+        if len(columns["key"]):
+            runs.append(self._write_run(_take(columns, np.argsort(columns["key"], kind="stable"))))
+        self._save_manifest(runs, [os.path.relpath(name, self.path) for name in folded])
+        with self._lock:
+            self._runs = runs
+            del self._sealed[:len(sealed)]
+        for name in folded:
+            os.remove(name)
+
+    def _tier(self, run):
+        """Size class of a run: runs within a factor of ``MERGE_FANIN`` of each other share one."""
+        return int(math.log(max(len(run["columns"]["key"]) / self.compact_rows, 1), MERGE_FANIN))
+
+    def _merge_candidates(self):
+        """The runs of the smallest size class holding ``MERGE_FANIN`` of them, or None."""
+        tiers = {}
+        for run in self._runs:
+            tiers.setdefault(self._tier(run), []).append(run)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= MERGE_FANIN:
+                return tiers[tier][:MERGE_FANIN]
+        return None
+
+    def _merge(self, runs):
+        """Replace ``runs`` by one merged run; the caller holds ``_merge_lock``."""
+        columns = _concat([run["columns"] for run in runs])
+        # Stable sort of concatenated sorted runs is a timsort merge of those runs
+        merged = self._write_run(_take(columns, np.argsort(columns["key"], kind="stable")))
+        remaining = [run for run in self._runs if all(run is not other for other in runs)] + [merged]
+        self._save_manifest(remaining)
+        with self._lock:
+            self._runs = remaining
+        for run in runs:
+            os.remove(self._file(run["file"]))
+
+    def clear(self):
+        with self._merge_lock, self._lock:
+            pending = self._segments + [name for names, _ in self._sealed for name in names]
+            for name in pending + [self._file(run["file"]) for run in self._runs]:
+                if os.path.exists(name):
+                    os.remove(name)
+            self._runs, self._tail, self._segments, self._sealed = [], _empty(), [], []
+            self._sources = set()
+            if os.path.exists(self._file("sources.txt")):
+                os.remove(self._file("sources.txt"))
+            self._save_manifest([])
+
+    def select(self, since=None, until=None, bbox=None, centre=None, radius_m=None, labels=None):
+        """
+        Column arrays of the rows detected in ``[since, until)`` inside ``bbox``
+        ``(south, west, north, east)`` and/or within ``radius_m`` of
+        ``centre`` ``(lat, lon)``, optionally only for ``labels``.
+        """
+        if centre is not None and radius_m is not None:
+            dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+            dlon = dlat / max(math.cos(math.radians(centre[0])), 1e-6)
+            circle = (centre[0] - dlat, centre[1] - dlon, centre[0] + dlat, centre[1] + dlon)
+            bbox = circle if bbox is None else (max(bbox[0], circle[0]), max(bbox[1], circle[1]),
+                                                min(bbox[2], circle[2]), min(bbox[3], circle[3]))
+        with self._lock:
+            runs, tail, sealed = self._runs, self._tail, [columns for _, columns in self._sealed]
+        rows = _concat([_take(run["columns"], self._candidates(run["columns"], run["buckets"], since, until, bbox))
+                        for run in runs] + sealed + [tail])
+
+        keep = np.ones(len(rows["key"]), dtype=bool)
+        if since is not None:
+            keep &= rows["time"] >= since
+        if until is not None:
+            keep &= rows["time"] < until
+        if bbox is not None:
+            south, west, north, east = bbox
+            keep &= (rows["lat"] >= south) & (rows["lat"] <= north) & (rows["lon"] >= west) & (rows["lon"] <= east)
+        if labels is not None:
+            keep &= np.isin(rows["label"], [self.labels.index(name) for name in labels if name in self.labels])
+        if centre is not None and radius_m is not None:
+            near = haversine(centre[0], centre[1], rows["lat"][keep], rows["lon"][keep]) <= radius_m
+            keep[np.flatnonzero(keep)[~near]] = False
+        return rows if keep.all() else _take(rows, keep)
+
+    @staticmethod
+    def _candidates(main, buckets, since, until, bbox):
+        """Rows of ``main`` (indices or a slice) whose hour and cell can match; exact checks come after."""
+        keys = main["key"]
+        first = 0 if since is None else int(max(since, 0) // BUCKET_SECONDS)
+        last = None if until is None else int(max(until, 0) // BUCKET_SECONDS)
+        lo = 0 if since is None else np.searchsorted(keys, np.uint64(first) << np.uint64(CELL_BITS))
+        hi = len(keys) if last is None else np.searchsorted(keys, np.uint64(last + 1) << np.uint64(CELL_BITS))
+        hours = buckets[np.searchsorted(buckets, first):len(buckets) if last is None else
+                        np.searchsorted(buckets, last, side="right")]
+        # A slice keeps the gathered columns views of the index instead of copies
+        if bbox is None or not len(hours):
+            return slice(lo, hi)
+        starts, ends = cover(*bbox)
+        if len(hours) * len(starts) > max(hi - lo, 1024):
+            # A long window with a small box: scanning the window is cheaper than searching it
+            return slice(lo, hi)
+        high = hours[:, None] << np.uint64(CELL_BITS)
+        return _ranges(np.searchsorted(keys, (high | starts[None, :]).ravel()),
+                       np.searchsorted(keys, (high | ends[None, :]).ravel()))
+
+    def counts(self, **query):
+        """``{label: detections}`` for the rows matching ``select(**query)``."""
+        counts = np.bincount(self.select(**query)["label"], minlength=len(self.labels))
+        return {label: int(count) for label, count in zip(self.labels, counts.tolist()) if count}
+
+    def cells(self, level, **query):
+        """Per-cell rows for a map layer at grid ``level``: polygon, total and per-label counts."""
+        rows = self.select(**query)
+        if not len(rows["key"]):
+            return []
+        codes = (rows["key"] & CELL_MASK) >> np.uint64(2 * (CELL_LEVEL - level))
+        cells, inverse = np.unique(codes, return_inverse=True)
+        width = len(self.labels)
+        per_label = np.bincount(inverse.ravel() * width + rows["label"], minlength=len(cells) * width)
+        per_label = per_label.reshape(len(cells), width)
+        bounds = [edge.tolist() for edge in cell_bounds(cells, level)]
+        return [
+            {"polygon": [[w, s], [e, s], [e, n], [w, n]], "count": int(row.sum()),
+             **dict(zip(self.labels, row.tolist()))}
+            for s, w, n, e, row in zip(*bounds, per_label)
+        ]
+
+    def extent(self, **query):
+        """``(south, west, north, east)`` of the matching rows, or None."""
+        rows = self.select(**query)
+        if not len(rows["lat"]):
+            return None
+        return float(rows["lat"].min()), float(rows["lon"].min()), float(rows["lat"].max()), float(rows["lon"].max())
+
+    def total(self):
+        with self._lock:
+            parts = [run["columns"] for run in self._runs] + [columns for _, columns in self._sealed] + [self._tail]
+            return sum(len(part["key"]) for part in parts)
+
+
+@st.cache_resource(show_spinner=False)
+def _open_store(path):
+    return DetectionStore(path)
+
+
+def get_detection_store():
+    """The process-wide store under ``[detection_store] path`` (default ``.cache/detection_store``)."""
+    return _open_store(secrets_section("detection_store").get("path", DEFAULT_STORE_DIR))
@@ -0,0 +1,87 @@
+"""
+Array-backed detections shared by the single-image, batch and video paths.
+
+Prediction dicts are converted into one ``sv.Detections`` up front; drawing
+goes through supervision's annotators and counting through NumPy, so neither
+loops over boxes in Python no matter how dense the scene is.
+
+supervision takes the better part of a second to import, so it is loaded on
+first use rather than when a page starts.
+"""
+import functools
+
+import numpy as np
+from PIL import Image
+
+
+@functools.lru_cache(maxsize=None)
+def annotators():
+    """The shared box and label annotators, created on first use."""
+    import supervision as sv
+
+    return (
+        sv.BoxAnnotator(color=sv.Color.RED, thickness=3),
+        sv.LabelAnnotator(color=sv.Color.RED, text_color=sv.Color.YELLOW, text_padding=4),
+    )
+
+
+def to_detections(predictions, scale=1.0):
+    """
+    Build one array-backed ``sv.Detections`` from a list of prediction dicts.
+    Centre/size boxes become xyxy, multiplied by ``scale`` to map them back to
+    the resolution of the frame being annotated.
+    """
+    import supervision as sv
+
+    if not predictions:
+        return sv.Detections.empty()
+    boxes = np.array([[p["x"], p["y"], p["width"], p["height"]] for p in predictions], dtype=np.float32)
+    cx, cy, w, h = boxes.T
+    xyxy = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1) * scale
+    names = np.array([p["class"] for p in predictions])
+    return sv.Detections(
+        xyxy=xyxy,
+        confidence=np.array([p.get("confidence", 1.0) for p in predictions], dtype=np.float32),
+        class_id=np.array([p.get("class_id", -1) for p in predictions], dtype=int),
+        data={"class_name": names},
+    )
+
+
+def class_names(detections):
+    if len(detections) == 0:
+        return np.empty(0, dtype=str)
+    return detections.data["class_name"]
+
+
+def count_classes(detections, classes=("person", "animal")):
+    """Return ``{class: count}`` for ``classes``, counted with one ``np.unique``."""
+    names, counts = np.unique(class_names(detections), return_counts=True)
+    found = dict(zip(names.tolist(), counts.tolist()))
+    return {name: found.get(name, 0) for name in classes}
+
+
+def filter_detections(detections, min_confidence=0.0, classes=None):
+    """Detections at or above ``min_confidence``, restricted to ``classes`` if given."""
+    if len(detections) == 0:
+        return detections
+    keep = detections.confidence >= min_confidence
+    if classes is not None:
+        keep &= np.isin(class_names(detections), list(classes))
+    return detections[keep]
+
+
+def annotate(scene, detections, labels=None):
+    """
+    Draw boxes and labels for ``detections`` on a copy of ``scene``.
+    Accepts and returns either a PIL image or a BGR ndarray (an OpenCV frame).
+    """
+    # PIL images go in as-is: supervision draws in BGR and converts PIL input
+    # itself, whereas an RGB array would come out with red and blue swapped
+    frame = scene.convert("RGB") if isinstance(scene, Image.Image) else scene.copy()
+    if len(detections):
+        if labels is None:
+            labels = class_names(detections).tolist()
+        box_annotator, label_annotator = annotators()
+        frame = box_annotator.annotate(frame, detections)
+        frame = label_annotator.annotate(frame, detections, labels=labels)
+    return frame
@@ -0,0 +1,67 @@
+"""
+Victim and water-level detection without Streamlit.
+
+The Save Victims page, the headless detection service (``utils.service``) and
+any script share this: two backends -- victims and water level -- run in
+parallel on one image, and the raw predictions are summarised into counts and
+a flood severity. Backends are anything with ``predict`` / ``predict_batch``
+(see ``utils.backends``).
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.backends import RemoteBackend
+from utils.pipeline import flood_level
+
+VICTIM_MODEL_ID = "yolo-floods-relief/4"
+WATER_LEVEL_MODEL_ID = "water-level-sindh/6"
+HIGH_FLOOD_LEVELS = ['level 5', 'level 6', 'level 7', 'level 8', 'level 9', 'level 10', 'level 11', 'level 12']
+
+
+def summarize(victims, water_level):
+    """Counts and flood severity for one image's predictions; either list may be None."""
+    classes = [p["class"] for p in victims or []]
+    level = flood_level(water_level or [])
+    return {
+        "persons": classes.count("person"),
+        "animals": classes.count("animal"),
+        "flood_level": level,
+        "high_flood": level in HIGH_FLOOD_LEVELS,
+    }
+
+
+class Detector:
+    """
+    Runs the victim and water-level backends side by side. The victim model
+    runs on the calling thread, so concurrent callers are not queued behind a
+    fixed number of workers; ``max_workers`` bounds the water-level calls in
+    flight.
+    """
+
+    def __init__(self, victims, water_level, max_workers=16):
+        self.victims = victims
+        self.water_level = water_level
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def detect(self, image):
+        """Return ``(victim predictions, water-level predictions)``, raising the first failure."""
+        levels = self._pool.submit(self.water_level.predict, image)
+        victims = self.victims.predict(image)
+        return victims, levels.result()
+
+    def detect_batch(self, images):
+        """Both models over a list of images, each as one backend batch."""
+        victims = self._pool.submit(self.victims.predict_batch, images)
+        levels = self._pool.submit(self.water_level.predict_batch, images)
+        return list(zip(victims.result(), levels.result()))
+
+
+def remote_detector(client, cache=None, victim_backend=None, fallback=None, dedupe=None):
+    """
+    A Detector over the hosted models, optionally with a local victim backend,
+    or a ``fallback`` victim backend used only while Roboflow is unreachable.
+    ``dedupe`` lets near-duplicate images reuse cached predictions.
+    """
+    return Detector(
+        victim_backend or RemoteBackend(client, VICTIM_MODEL_ID, cache, fallback, dedupe),
+        RemoteBackend(client, WATER_LEVEL_MODEL_ID, cache, dedupe=dedupe),
+    )
@@ -0,0 +1,231 @@
+"""
+Multi-team rescue dispatch.
+
+Given N rescue teams (a base position and a boat capacity each) and M victim
+locations with head counts, stops are assigned to bases from one broadcast
+haversine matrix: nearest base first, but each team only takes about its
+capacity's share of all the people, and stops beyond that spill to the next
+nearest base with room. Each team's stops are then split into
+capacity-feasible trips with the Clarke-Wright savings heuristic; only each
+stop's nearest neighbours are considered as merge partners, which keeps it
+fast for thousands of stops. Finally every trip is polished with 2-opt and
+or-opt moves until the time budget runs out. Each improvement pass evaluates
+all candidate moves for one position in a single NumPy expression.
+"""
+import time
+
+import numpy as np
+
+from utils.routing import haversine
+
+SAVINGS_NEIGHBOURS = 40
+# How far past its capacity share of all people a team may be loaded before stops spill over
+BALANCE_SLACK = 0.1
+# Minimum improvement (metres) for a move; guards against cycling on rounding noise
+EPSILON = 1e-3
+
+
+def distance_matrix(lat_a, lon_a, lat_b=None, lon_b=None):
+    """Pairwise great-circle distances (metres) between two point sets via broadcasting."""
+    if lat_b is None:
+        lat_b, lon_b = lat_a, lon_a
+    return haversine(np.asarray(lat_a)[:, None], np.asarray(lon_a)[:, None],
+                     np.asarray(lat_b)[None, :], np.asarray(lon_b)[None, :])
+
+
+def savings_routes(dist, demand, capacity, neighbours=SAVINGS_NEIGHBOURS):
+    """
+    Clarke-Wright savings on a local matrix where index 0 is the depot and
+    1..k are stops. Returns routes as lists of stop indices (1-based).
+    """
+    k = len(dist) - 1
+    if k == 0:
+        return []
+    depot = dist[0, 1:]
+    stop_dist = dist[1:, 1:]
+    m = min(neighbours, k - 1)
+    if m > 0:
+        ranked = stop_dist.copy()
+        np.fill_diagonal(ranked, np.inf)
+        near = np.argpartition(ranked, m - 1, axis=1)[:, :m]
+        i = np.repeat(np.arange(k), m)
+        j = near.ravel()
+        pairs = np.unique(np.sort(np.stack([i, j], axis=1), axis=1), axis=0)
+        i, j = pairs[:, 0], pairs[:, 1]
+        saving = depot[i] + depot[j] - stop_dist[i, j]
+        order = np.argsort(-saving, kind="stable")
+        candidates = zip(i[order].tolist(), j[order].tolist(), saving[order].tolist())
+    else:
+        candidates = []
+
+    routes = {r: [r] for r in range(k)}
+    route_of = list(range(k))
+    load = {r: float(demand[r]) for r in range(k)}
+    for a, b, s in candidates:
+        if s <= 0:
+            break
+        ra, rb = route_of[a], route_of[b]
+        if ra == rb or load[ra] + load[rb] > capacity:
+            continue
+        A, B = routes[ra], routes[rb]
+        # a and b must both sit at an end of their routes to be joined
+        if A[-1] == a and B[0] == b:
+            merged = A + B
+        elif A[0] == a and B[-1] == b:
+            merged = B + A
+        elif A[-1] == a and B[-1] == b:
+            merged = A + B[::-1]
+        elif A[0] == a and B[0] == b:
+            merged = A[::-1] + B
+        else:
+            continue
+        routes[ra] = merged
+        load[ra] += load.pop(rb)
+        del routes[rb]
+        for stop in B:
+            route_of[stop] = ra
+    return [[stop + 1 for stop in route] for route in routes.values()]
+
+
+def assign_stops(to_bases, people, capacity, slack=BALANCE_SLACK):
+    """
+    Owning team of every stop, or -1 where no boat can carry it. ``to_bases``
+    is the stop x team distance matrix with ``inf`` where a boat is too small.
+
+    Each team's quota is its share of total capacity times all the people,
+    plus ``slack``. Stops go to the nearest team with room left, in order of
+    regret (how much farther their second choice is), so the stops that would
+    lose most by moving keep their nearest base. When every team that can
+    carry a stop is full, it goes to its nearest one anyway.
+    """
+    owner = np.full(len(people), -1, dtype=np.int64)
+    if not len(people):
+        return owner
+    ranked = np.argsort(to_bases, axis=1, kind="stable")
+    ordered = np.take_along_axis(to_bases, ranked, axis=1)
+    reachable = np.isfinite(ordered[:, 0])
+    regret = np.full(len(people), np.inf)
+    if ordered.shape[1] > 1:
+        # Stops only one boat can carry have nowhere else to go and are placed first
+        choice = np.isfinite(ordered[:, 1])
+        regret[choice] = ordered[choice, 1] - ordered[choice, 0]
+    quota = people[reachable].sum() * capacity / capacity.sum() * (1 + slack)
+    load = np.zeros(len(capacity))
+    candidates = np.flatnonzero(reachable)
+    for stop in candidates[np.argsort(-regret[candidates], kind="stable")]:
+        choices = ranked[stop][np.isfinite(ordered[stop])]
+        room = choices[load[choices] + people[stop] <= quota[choices]]
+        team = room[0] if len(room) else choices[0]
+        owner[stop] = team
+        load[team] += people[stop]
+    return owner
+
+
+def tour_length(dist, tour):
+    return float(dist[tour[:-1], tour[1:]].sum())
+
+
+def two_opt(dist, tour, deadline):
+    """Improve a closed tour (depot at both ends) with vectorized 2-opt until no gain or deadline."""
+    tour = np.asarray(tour)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, len(tour) - 2):
+            j = np.arange(i + 1, len(tour) - 1)
+            delta = (dist[tour[i - 1], tour[j]] + dist[tour[i], tour[j + 1]]
+                     - dist[tour[i - 1], tour[i]] - dist[tour[j], tour[j + 1]])
+            best = int(np.argmin(delta))
+            if delta[best] < -EPSILON:
+                tour[i:j[best] + 1] = tour[i:j[best] + 1][::-1]
+                improved = True
+            if time.perf_counter() >= deadline:
+                break
+    return tour
+
+
+def or_opt(dist, tour, deadline, max_segment=3):
+    """Relocate segments of 1..max_segment stops to their cheapest other position."""
+    tour = np.asarray(tour)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for length in range(1, max_segment + 1):
+            i = 1
+            while i + length < len(tour):
+                first, last = tour[i], tour[i + length - 1]
+                prev, nxt = tour[i - 1], tour[i + length]
+                gain = dist[prev, first] + dist[last, nxt] - dist[prev, nxt]
+                rest = np.concatenate([tour[:i], tour[i + length:]])
+                a, b = rest[:-1], rest[1:]
+                forward = dist[a, first] + dist[last, b] - dist[a, b]
+                backward = dist[a, last] + dist[first, b] - dist[a, b]
+                cost = np.minimum(forward, backward)
+                pos = int(np.argmin(cost))
+                if cost[pos] < gain - EPSILON:
+                    segment = tour[i:i + length]
+                    if backward[pos] < forward[pos]:
+                        segment = segment[::-1]
+                    tour = np.concatenate([rest[:pos + 1], segment, rest[pos + 1:]])
+                    improved = True
+                i += 1
+                if time.perf_counter() >= deadline:
+                    return tour
+    return tour
+
+
+def plan_dispatch(teams, stops, time_budget=3.0):
+    """
+    Plan rescue trips.
+
+    ``teams`` is a list of dicts with ``name``, ``lat``, ``lon`` and ``capacity``;
+    ``stops`` a list of dicts with ``lat``, ``lon`` and ``people``. Returns one
+    dict per team with its trips (each a list of stop indices into ``stops``,
+    plus load and length), and the stops no boat can carry in one trip.
+    """
+    deadline = time.perf_counter() + time_budget
+    for team in teams:
+        values = np.array([team.get("lat"), team.get("lon"), team.get("capacity")], dtype=np.float64)
+        if not np.isfinite(values).all() or values[2] <= 0:
+            raise ValueError(f"Team {team['name']} needs a position and a positive capacity")
+    team_lat = np.array([t["lat"] for t in teams], dtype=np.float64)
+    team_lon = np.array([t["lon"] for t in teams], dtype=np.float64)
+    capacity = np.array([t["capacity"] for t in teams], dtype=np.float64)
+    lat = np.array([s["lat"] for s in stops], dtype=np.float64)
+    lon = np.array([s["lon"] for s in stops], dtype=np.float64)
+    people = np.array([max(1, s.get("people", 1)) for s in stops], dtype=np.float64)
+
+    # Only bases whose boat can carry the stop's people in one trip
+    to_bases = distance_matrix(lat, lon, team_lat, team_lon)
+    to_bases[people[:, None] > capacity[None, :]] = np.inf
+    owner = assign_stops(to_bases, people, capacity)
+    reachable = owner >= 0
+
+    plans = []
+    for t, team in enumerate(teams):
+        members = np.nonzero(owner == t)[0]
+        node_lat = np.concatenate([[team_lat[t]], lat[members]])
+        node_lon = np.concatenate([[team_lon[t]], lon[members]])
+        dist = distance_matrix(node_lat, node_lon)
+        trips = []
+        for route in savings_routes(dist, people[members], capacity[t]):
+            tour = np.array([0] + route + [0])
+            # Split what is left of the budget evenly over the remaining work
+            slot = max(0.0, deadline - time.perf_counter()) / max(1, len(teams) - t)
+            tour = two_opt(dist, tour, time.perf_counter() + slot / 2)
+            tour = or_opt(dist, tour, time.perf_counter() + slot / 2)
+            trips.append({
+                "stops": members[tour[1:-1] - 1].tolist(),
+                "load": float(people[members[tour[1:-1] - 1]].sum()),
+                "distance_m": tour_length(dist, tour),
+                "path": [[float(node_lon[n]), float(node_lat[n])] for n in tour],
+            })
+        plans.append({
+            "team": team["name"],
+            "trips": trips,
+            "stops": int(len(members)),
+            "people": float(people[members].sum()),
+            "distance_m": float(sum(trip["distance_m"] for trip in trips)),
+        })
+    unassigned = np.nonzero(~reachable)[0].tolist()
+    return {"teams": plans, "unassigned": unassigned}
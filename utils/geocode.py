@@ -0,0 +1,180 @@
+"""
+Persistent, rate-limited geocoding for the route planner.
+
+Place names are normalized and resolved through a SQLite cache first. Misses
+go to Nominatim through a process-wide token bucket, which keeps every
+Streamlit session together under the 1 request/second usage policy.
+Concurrent lookups of the same name are coalesced into one upstream call.
+``prewarm`` fills the cache ahead of an event from a list of district or city
+names.
+"""
+import itertools
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+from utils.clients import NOMINATIM_API_URL, get_session
+from utils.resilience import get_policy
+from utils.settings import secrets_section
+from utils.singleflight import SingleFlight
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "geocode.sqlite3")
+DEFAULT_RATE = 1.0
+USER_AGENT = "SahaytaApp/1.0"
+# Names Nominatim could not resolve are retried after a day rather than never
+NOT_FOUND_TTL = 24 * 3600
+COORDINATES = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+
+
+def parse_coordinates(text):
+    """Return ``(lat, lon)`` if ``text`` is a literal "lat, lon" pair, else None."""
+    match = COORDINATES.match(text)
+    if match is None:
+        return None
+    lat, lon = float(match.group(1)), float(match.group(2))
+    return (lat, lon) if -90 <= lat <= 90 and -180 <= lon <= 180 else None
+
+
+def normalize(name):
+    """Case-fold a place name and collapse whitespace and stray punctuation."""
+    name = re.sub(r"\s+", " ", name.casefold()).strip(" ,.;")
+    return re.sub(r"\s*,\s*", ", ", name)
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``acquire`` blocks until a token is available."""
+
+    def __init__(self, rate=DEFAULT_RATE, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class Geocoder:
+    """Nominatim lookups behind a SQLite cache, a token bucket and single-flight."""
+
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH, rate=DEFAULT_RATE, timeout=10.0, api_url=NOMINATIM_API_URL,
+                 policy=None):
+        if os.path.dirname(cache_path):
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        self._db = sqlite3.connect(cache_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS places ("
+            "name TEXT PRIMARY KEY, lat REAL, lon REAL, updated REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._db_lock = threading.Lock()
+        self.limiter = TokenBucket(rate)
+        self.timeout = timeout
+        self.api_url = api_url.rstrip("/")
+        self.policy = policy if policy is not None else get_policy("nominatim")
+        self._flight = SingleFlight()
+        self.stats = {"hits": 0, "misses": 0, "upstream": 0}
+
+    def _cached(self, key):
+        with self._db_lock:
+            row = self._db.execute("SELECT lat, lon, updated FROM places WHERE name = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        lat, lon, updated = row
+        if lat is None and time.time() - updated > NOT_FOUND_TTL:
+            return None
+        return lat, lon
+
+    def _store(self, key, coords):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO places (name, lat, lon, updated) VALUES (?, ?, ?, ?)",
+                (key, coords[0], coords[1], time.time()),
+            )
+            self._db.commit()
+
+    def _fetch(self, key):
+        # Another caller may have filled the cache while we queued for a token
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        if not self.limiter.acquire(timeout=self.timeout):
+            raise TimeoutError("Geocoding is rate limited, please try again shortly.")
+        session = get_session(self.api_url, headers=(("User-Agent", USER_AGENT),))
+        attempts = itertools.count()
+
+        def search():
+            # Retries wait for a token like any other request
+            if next(attempts):
+                self.limiter.acquire()
+            self.stats["upstream"] += 1
+            response = session.get(f"{self.api_url}/search", params={"q": key, "format": "json", "limit": 1},
+                                   timeout=self.policy.timeout)
+            response.raise_for_status()
+            return response.json()
+
+        data = self.policy.call(search)
+        coords = (float(data[0]["lat"]), float(data[0]["lon"])) if data else (None, None)
+        self._store(key, coords)
+        return coords
+
+    def lookup(self, name):
+        """
+        Return ``(lat, lon)`` for a place name, or ``(None, None)`` if it is unknown.
+        A literal "lat, lon" pair is returned as is, so planning works offline.
+        """
+        coords = parse_coordinates(name)
+        if coords is not None:
+            return coords
+        key = normalize(name)
+        if not key:
+            return None, None
+        cached = self._cached(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+        self.stats["misses"] += 1
+        return self._flight.do(key, lambda: self._fetch(key))
+
+    def prewarm(self, names, progress=None):
+        """
+        Resolve every name not already cached, respecting the rate limit.
+        ``progress(done, total)`` is called after each name. Returns the number
+        of names that needed an upstream lookup.
+        """
+        keys = list(dict.fromkeys(normalize(n) for n in names if normalize(n)))
+        fetched = 0
+        for done, key in enumerate(keys, start=1):
+            if self._cached(key) is None:
+                self._flight.do(key, lambda: self._fetch(key))
+                fetched += 1
+            if progress is not None:
+                progress(done, len(keys))
+        return fetched
+
+
+@st.cache_resource(show_spinner=False)
+def get_geocoder():
+    """Return the process-wide geocoder configured under ``[geocoding]`` in secrets."""
+    settings = secrets_section("geocoding")
+    return Geocoder(
+        cache_path=settings.get("cache_path", DEFAULT_CACHE_PATH),
+        rate=float(settings.get("rate_per_sec", DEFAULT_RATE)),
+    )
@@ -0,0 +1,228 @@
+"""
+Hazard-aware routing: flood extents, wildfire hotspots and manual closures.
+
+Road edges are indexed once in a packed STR R-tree over their bounding boxes.
+Adding a hazard polygon queries that index for candidate edges and confirms
+them with a vectorized segment test: an edge is affected when either end lies
+inside the polygon or it crosses one of the polygon's sides, so a long edge
+cutting through a small hazard is caught too. Only those entries of the
+graph's active weight array are then rewritten. An
+edge inside a blocking hazard gets an infinite weight; a penalising hazard
+multiplies it. Removing a hazard recomputes just the edges it touched, so
+keeping up with hazards that change every few minutes never rebuilds the graph.
+"""
+import itertools
+import math
+import threading
+
+import numpy as np
+
+NODE_CAPACITY = 16
+# Candidate edges tested against a polygon's sides per block, to bound the pairwise arrays
+SEGMENT_BLOCK = 4096
+
+
+class EdgeIndex:
+    """Sort-Tile-Recursive packed R-tree over axis-aligned boxes, queried level by level."""
+
+    def __init__(self, boxes, capacity=NODE_CAPACITY):
+        self.capacity = capacity
+        order = self._str_order(boxes)
+        self.ids = order
+        # levels[0] holds the items; each level above holds parents of groups of
+        # ``capacity`` consecutive entries of the level below
+        self.levels = [{"boxes": boxes[order], "groups": None}]
+        while len(self.levels[-1]["boxes"]) > capacity:
+            child = self.levels[-1]["boxes"]
+            starts = np.arange(0, len(child), capacity)
+            parents = np.stack([
+                np.minimum.reduceat(child[:, 0], starts), np.minimum.reduceat(child[:, 1], starts),
+                np.maximum.reduceat(child[:, 2], starts), np.maximum.reduceat(child[:, 3], starts),
+            ], axis=1)
+            order = self._str_order(parents)
+            self.levels.append({"boxes": parents[order], "groups": order})
+
+    def _str_order(self, boxes):
+        n = len(boxes)
+        cx = (boxes[:, 0] + boxes[:, 2]) / 2
+        cy = (boxes[:, 1] + boxes[:, 3]) / 2
+        slices = max(1, math.ceil(math.sqrt(n / self.capacity)))
+        by_x = np.argsort(cx, kind="stable")
+        slice_of = np.empty(n, dtype=np.int64)
+        slice_of[by_x] = np.arange(n) * slices // max(n, 1)
+        return np.lexsort((cy, slice_of))
+
+    def query(self, bbox):
+        """Return the ids of every box intersecting ``(minx, miny, maxx, maxy)``."""
+        minx, miny, maxx, maxy = bbox
+        top = self.levels[-1]["boxes"]
+        candidates = np.arange(len(top))
+        for depth in range(len(self.levels) - 1, -1, -1):
+            boxes = self.levels[depth]["boxes"][candidates]
+            hit = (boxes[:, 0] <= maxx) & (boxes[:, 2] >= minx) & (boxes[:, 1] <= maxy) & (boxes[:, 3] >= miny)
+            candidates = candidates[hit]
+            if depth == 0 or not len(candidates):
+                break
+            groups = self.levels[depth]["groups"][candidates]
+            below = len(self.levels[depth - 1]["boxes"])
+            children = (groups[:, None] * self.capacity + np.arange(self.capacity)).ravel()
+            candidates = children[children < below]
+        if not len(candidates) or depth != 0:
+            return np.empty(0, dtype=np.int64)
+        return self.ids[candidates]
+
+
+def points_in_polygon(x, y, polygon):
+    """Vectorized even-odd ray casting of points ``(x, y)`` against a ring of ``(x, y)`` vertices."""
+    px, py = polygon[:, 0], polygon[:, 1]
+    qx, qy = np.roll(px, -1), np.roll(py, -1)
+    x, y = x[:, None], y[:, None]
+    crosses = (py <= y) != (qy <= y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_at = px + (y - py) * (qx - px) / (qy - py)
+    return np.count_nonzero(crosses & (x < x_at), axis=1) % 2 == 1
+
+
+def _orientation(ax, ay, bx, by, cx, cy):
+    """Sign of the turn a -> b -> c: positive counter-clockwise, negative clockwise."""
+    return np.sign((bx - ax) * (cy - ay) - (by - ay) * (cx - ax))
+
+
+def segments_touch_polygon(x0, y0, x1, y1, polygon):
+    """Whether each segment ``(x0, y0)-(x1, y1)`` has an end inside ``polygon`` or crosses one of its sides."""
+    hit = points_in_polygon(x0, y0, polygon) | points_in_polygon(x1, y1, polygon)
+    px, py = polygon[:, 0], polygon[:, 1]
+    qx, qy = np.roll(px, -1), np.roll(py, -1)
+    for start in range(0, len(x0), SEGMENT_BLOCK):
+        block = slice(start, start + SEGMENT_BLOCK)
+        ax, ay, bx, by = (v[block, None] for v in (x0, y0, x1, y1))
+        # Proper crossings: each segment's ends lie strictly on opposite sides of the other
+        crosses = ((_orientation(px, py, qx, qy, ax, ay) * _orientation(px, py, qx, qy, bx, by) < 0)
+                   & (_orientation(ax, ay, bx, by, px, py) * _orientation(ax, ay, bx, by, qx, qy) < 0))
+        hit[block] |= crosses.any(axis=1)
+    return hit
+
+
+def circle_polygon(lat, lon, radius_m, sides=24):
+    """Approximate a circle on the ground as a ``(lat, lon)`` ring."""
+    angles = np.linspace(0, 2 * np.pi, sides, endpoint=False)
+    dlat = radius_m / 111320.0
+    dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    return list(zip(lat + dlat * np.sin(angles), lon + dlon * np.cos(angles)))
+
+
+def polygons_from_geojson(collection):
+    """Yield ``(lat, lon)`` outer rings from a GeoJSON Polygon/MultiPolygon collection."""
+    features = collection.get("features", [collection])
+    for feature in features:
+        geometry = feature.get("geometry", feature)
+        if geometry.get("type") == "Polygon":
+            rings = [geometry["coordinates"][0]]
+        elif geometry.get("type") == "MultiPolygon":
+            rings = [polygon[0] for polygon in geometry["coordinates"]]
+        else:
+            continue
+        for ring in rings:
+            yield [(lat, lon) for lon, lat, *_ in ring]
+
+
+def polygons_from_mask(mask, bounds, cells=64, threshold=0.5):
+    """
+    Turn a georeferenced boolean flood mask into rectangle polygons.
+
+    ``bounds`` is ``(south, west, north, east)`` of the mask. The mask is pooled
+    into at most ``cells`` x ``cells`` blocks and every block that is more than
+    ``threshold`` flooded becomes one hazard rectangle.
+    """
+    south, west, north, east = bounds
+    height, width = mask.shape
+    rows, cols = min(cells, height), min(cells, width)
+    row_edges = np.linspace(0, height, rows + 1).astype(int)
+    col_edges = np.linspace(0, width, cols + 1).astype(int)
+    flooded = np.add.reduceat(np.add.reduceat(mask.astype(np.float32), row_edges[:-1], axis=0),
+                              col_edges[:-1], axis=1)
+    area = np.outer(np.diff(row_edges), np.diff(col_edges))
+    polygons = []
+    for r, c in zip(*np.nonzero(flooded / area > threshold)):
+        top = north - (north - south) * row_edges[r] / height
+        bottom = north - (north - south) * row_edges[r + 1] / height
+        left = west + (east - west) * col_edges[c] / width
+        right = west + (east - west) * col_edges[c + 1] / width
+        polygons.append([(top, left), (top, right), (bottom, right), (bottom, left)])
+    return polygons
+
+
+class HazardLayer:
+    """Incrementally maintained hazard weights on top of a ``RoadGraph``."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        lat, lon, src, dst = graph.lat, graph.lon, graph.src, graph.dst
+        self._x = np.stack([lon[src], lon[dst]], axis=1)
+        self._y = np.stack([lat[src], lat[dst]], axis=1)
+        boxes = np.stack([self._x.min(1), self._y.min(1), self._x.max(1), self._y.max(1)], axis=1)
+        self.index = EdgeIndex(boxes)
+        self.factor = np.ones(graph.num_edges, dtype=np.float32)
+        # A private, writable copy so the memory-mapped base weights stay untouched
+        self.weight = np.array(graph.weight, dtype=np.float32)
+        graph.active_weight = self.weight
+        graph.weight_version += 1
+        self.hazards = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _affected_edges(self, polygon):
+        ring = np.asarray([(lon, lat) for lat, lon in polygon], dtype=np.float64)
+        bbox = (ring[:, 0].min(), ring[:, 1].min(), ring[:, 0].max(), ring[:, 1].max())
+        candidates = self.index.query(bbox)
+        if not len(candidates):
+            return candidates
+        x, y = self._x[candidates], self._y[candidates]
+        return candidates[segments_touch_polygon(x[:, 0], y[:, 0], x[:, 1], y[:, 1], ring)]
+
+    def _apply(self, edges):
+        factor = np.ones(len(edges), dtype=np.float32)
+        for hazard in self.hazards.values():
+            hit = np.isin(edges, hazard["edges"], assume_unique=False)
+            if hit.any():
+                factor[hit] = np.maximum(factor[hit], hazard["factor"])
+        self.factor[edges] = factor
+        self.weight[edges] = np.asarray(self.graph.weight[edges]) * factor
+        self.graph.weight_version += 1
+
+    def add_polygon(self, polygon, kind="closure", factor=math.inf, label=None):
+        """
+        Add a hazard given as a ``(lat, lon)`` ring. ``factor=inf`` closes the
+        roads inside; a finite factor multiplies their cost. Returns the hazard id.
+        """
+        with self._lock:
+            edges = self._affected_edges(polygon)
+            hazard_id = next(self._ids)
+            self.hazards[hazard_id] = {
+                "id": hazard_id, "kind": kind, "label": label or kind, "factor": float(factor),
+                "polygon": [list(p) for p in polygon], "edges": edges,
+            }
+            # Only edges this hazard touches need new weights; overlaps keep the worst factor
+            self.factor[edges] = np.maximum(self.factor[edges], factor)
+            self.weight[edges] = np.asarray(self.graph.weight[edges]) * self.factor[edges]
+            self.graph.weight_version += 1
+            return hazard_id
+
+    def add_circle(self, lat, lon, radius_m, **kwargs):
+        return self.add_polygon(circle_polygon(lat, lon, radius_m), **kwargs)
+
+    def remove(self, hazard_id):
+        with self._lock:
+            hazard = self.hazards.pop(hazard_id, None)
+            if hazard is not None and len(hazard["edges"]):
+                self._apply(hazard["edges"])
+
+    def clear(self):
+        with self._lock:
+            self.hazards.clear()
+            self.factor[:] = 1.0
+            self.weight[:] = self.graph.weight
+            self.graph.weight_version += 1
+
+    def affected_edge_count(self):
+        return int(np.count_nonzero(self.factor != 1.0))
@@ -0,0 +1,192 @@
+"""
+Wildfire hotspot grid with precomputed multi-level aggregates.
+
+Scored tiles are binned into a quadtree grid addressed by Z-order (Morton)
+codes: latitude and longitude are quantised to ``level`` bits each and their
+bits interleaved, the same scheme geohash uses, but kept as integers. A cell's
+parent one level up is simply ``code >> 2``, so every coarser level is derived
+from the finest one with a shift.
+
+For every level the store keeps sorted columns -- cell code, tile count,
+probability sum and maximum, fire count -- as ``.npy`` files that load with
+``mmap_mode="r"``. The map draws a few thousand pre-aggregated cells instead of
+100k+ raw points. New scores are aggregated on their own and merged into the
+existing columns with ``searchsorted``: touched cells are updated in place and
+new cells inserted, nothing else is recomputed. Merged columns are written
+to a temporary file and renamed over the old one, so a reader's memory map
+always points at a complete file.
+"""
+import os
+import threading
+
+import numpy as np
+
+DEFAULT_HOTSPOT_DIR = os.path.join(".cache", "hotspots")
+LEVELS = tuple(range(4, 17))
+COLUMNS = ("cells", "count", "prob_sum", "prob_max", "fires")
+FIRE_THRESHOLD = 0.5
+
+
+def _spread(v):
+    """Insert a zero bit between each of the low 32 bits of ``v``."""
+    v = v.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def _compact(z):
+    """Inverse of ``_spread``: gather every other bit."""
+    z = z.astype(np.uint64) & np.uint64(0x5555555555555555)
+    for shift, mask in ((1, 0x3333333333333333), (2, 0x0F0F0F0F0F0F0F0F), (4, 0x00FF00FF00FF00FF),
+                        (8, 0x0000FFFF0000FFFF), (16, 0x00000000FFFFFFFF)):
+        z = (z | (z >> np.uint64(shift))) & np.uint64(mask)
+    return z
+
+
+def cell_codes(lat, lon, level=LEVELS[-1]):
+    """Morton codes of the ``level`` cells containing each point."""
+    n = 1 << level
+    row = np.clip(((np.asarray(lat, dtype=np.float64) + 90) / 180 * n).astype(np.int64), 0, n - 1)
+    col = np.clip(((np.asarray(lon, dtype=np.float64) + 180) / 360 * n).astype(np.int64), 0, n - 1)
+    return _spread(col) | (_spread(row) << np.uint64(1))
+
+
+def cell_bounds(codes, level):
+    """``(south, west, north, east)`` arrays for Morton codes at ``level``."""
+    n = 1 << level
+    col = _compact(codes).astype(np.float64)
+    row = _compact(codes >> np.uint64(1)).astype(np.float64)
+    return (row / n * 180 - 90, col / n * 360 - 180, (row + 1) / n * 180 - 90, (col + 1) / n * 360 - 180)
+
+
+def aggregate(codes, probabilities):
+    """Per-cell columns for one batch of points, sorted by cell code."""
+    cells, inverse = np.unique(codes, return_inverse=True)
+    probabilities = np.asarray(probabilities, dtype=np.float32)
+    prob_max = np.zeros(len(cells), dtype=np.float32)
+    np.maximum.at(prob_max, inverse, probabilities)
+    return {
+        "cells": cells,
+        "count": np.bincount(inverse, minlength=len(cells)).astype(np.uint32),
+        "prob_sum": np.bincount(inverse, probabilities, minlength=len(cells)).astype(np.float32),
+        "prob_max": prob_max,
+        "fires": np.bincount(inverse, probabilities >= FIRE_THRESHOLD, minlength=len(cells)).astype(np.uint32),
+    }
+
+
+def merge(existing, update):
+    """Fold ``update`` into ``existing`` (both sorted column dicts); only touched cells change."""
+    if existing is None or not len(existing["cells"]):
+        return update
+    position = np.searchsorted(existing["cells"], update["cells"])
+    found = position < len(existing["cells"])
+    found[found] = existing["cells"][position[found]] == update["cells"][found]
+
+    merged = {name: np.array(existing[name]) for name in COLUMNS}
+    hit, src = position[found], found
+    merged["count"][hit] += update["count"][src]
+    merged["prob_sum"][hit] += update["prob_sum"][src]
+    merged["fires"][hit] += update["fires"][src]
+    merged["prob_max"][hit] = np.maximum(merged["prob_max"][hit], update["prob_max"][src])
+
+    new = ~found
+    if new.any():
+        # np.insert keeps the columns sorted because positions come from searchsorted
+        merged = {name: np.insert(merged[name], position[new], update[name][new]) for name in COLUMNS}
+    return merged
+
+
+class HotspotGrid:
+    """Multi-level hotspot aggregates persisted as one ``.npy`` file per column and level."""
+
+    def __init__(self, path=DEFAULT_HOTSPOT_DIR, levels=LEVELS):
+        self.path = path
+        self.levels = tuple(sorted(levels))
+        self._lock = threading.Lock()
+        self._levels = {level: self._load(level) for level in self.levels}
+
+    def _file(self, level, column):
+        return os.path.join(self.path, f"L{level:02d}_{column}.npy")
+
+    def _load(self, level):
+        if not os.path.exists(self._file(level, "cells")):
+            return None
+        return {name: np.load(self._file(level, name), mmap_mode="r") for name in COLUMNS}
+
+    def _save(self, level, columns):
+        """Replace a level's files without touching the ones still mapped by readers."""
+        for name in COLUMNS:
+            partial = f"{self._file(level, name)}.{os.getpid()}.tmp"
+            with open(partial, "wb") as f:
+                np.save(f, columns[name])
+            os.replace(partial, self._file(level, name))
+
+    def _columns(self, level):
+        with self._lock:
+            return self._levels.get(level)
+
+    def add(self, lat, lon, probabilities):
+        """Merge new tile scores into every level and persist them; returns the points added."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        keep = np.isfinite(lat) & np.isfinite(lon)
+        if not keep.any():
+            return 0
+        finest = self.levels[-1]
+        codes = cell_codes(lat[keep], lon[keep], finest)
+        probabilities = np.asarray(probabilities, dtype=np.float32)[keep]
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            for level in self.levels:
+                update = aggregate(codes >> np.uint64(2 * (finest - level)), probabilities)
+                self._save(level, merge(self._levels[level], update))
+                self._levels[level] = self._load(level)
+        return int(keep.sum())
+
+    def cells(self, level, min_count=1):
+        """Rows ready for a map layer: polygon, counts and mean / max probability per cell."""
+        columns = self._columns(level)
+        if columns is None:
+            return []
+        keep = np.asarray(columns["count"]) >= min_count
+        codes = np.asarray(columns["cells"])[keep]
+        count = np.asarray(columns["count"])[keep]
+        mean = np.asarray(columns["prob_sum"])[keep] / count
+        bounds = [edge.tolist() for edge in cell_bounds(codes, level)]
+        fires = np.asarray(columns["fires"])[keep].tolist()
+        peak = np.asarray(columns["prob_max"])[keep].astype(np.float64).round(3).tolist()
+        return [
+            {"polygon": [[w, s], [e, s], [e, n], [w, n]], "count": c, "fires": f, "mean": round(m, 3), "max": x}
+            for s, w, n, e, c, f, m, x in zip(*bounds, count.tolist(), fires, mean.tolist(), peak)
+        ]
+
+    def extent(self):
+        """``(south, west, north, east)`` of every aggregated tile, from the finest level."""
+        columns = self._columns(self.levels[-1])
+        if columns is None:
+            return None
+        south, west, north, east = cell_bounds(np.asarray(columns["cells"]), self.levels[-1])
+        return float(south.min()), float(west.min()), float(north.max()), float(east.max())
+
+    def total(self):
+        """Number of tiles aggregated so far."""
+        columns = self._columns(self.levels[0])
+        return int(np.asarray(columns["count"]).sum()) if columns is not None else 0
+
+    def clear(self):
+        with self._lock:
+            for level in self.levels:
+                for name in COLUMNS:
+                    if os.path.exists(self._file(level, name)):
+                        os.remove(self._file(level, name))
+                self._levels[level] = None
+
+
+def level_for_span(span_degrees, target_cells=64):
+    """Finest stored level that still shows about ``target_cells`` cells across ``span_degrees`` of longitude."""
+    for level in reversed(LEVELS):
+        if span_degrees / (360 / (1 << level)) <= target_cells:
+            return level
+    return LEVELS[0]
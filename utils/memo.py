@@ -0,0 +1,111 @@
+"""
+Per-session memo of finished results, so widget interaction does not redo work.
+
+Streamlit reruns the whole page on every widget change. With a file still
+uploaded that used to mean decoding it, hashing it and calling both models
+again (or at best hitting the detection cache) before redrawing the same
+boxes. Results stored here are keyed by what produced them, e.g. the upload's
+file id and the API key, and live in ``st.session_state``, so they are private
+to one browser session and dropped with it.
+
+Each session's memo is an LRU bounded by an estimate of its size in bytes, so
+many concurrent sessions cannot exhaust the server's memory. The budget can be
+set in ``.streamlit/secrets.toml``::
+
+    [session]
+    memo_mb = 64
+"""
+import hashlib
+import sys
+from collections import OrderedDict
+
+import numpy as np
+import streamlit as st
+
+from utils.settings import secrets_section
+from PIL import Image
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+STATE_KEY = "_result_memo"
+
+
+def estimate_size(value):
+    """Rough size of ``value`` in bytes, counting image pixels and array buffers."""
+    if isinstance(value, Image.Image):
+        return value.width * value.height * len(value.getbands())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def secret_digest(secret):
+    """A short digest of an API key, so keys never end up in memo keys or logs."""
+    return hashlib.sha256((secret or "").encode()).hexdigest()[:16]
+
+
+class SessionMemo:
+    """LRU of results bounded by their estimated size in bytes."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the stored value for ``key`` or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        return entry[1]
+
+    def put(self, key, value):
+        """Store or replace ``value``, evicting the least recently used entries to stay in budget."""
+        self.discard(key)
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            # Storing it would evict everything else and still not fit
+            return
+        self._entries[key] = (size, value)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+            self._stats["evictions"] += 1
+
+    def discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[0]
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {**self._stats, "entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes}
+
+
+def session_memo():
+    """This browser session's memo, created on first use."""
+    memo = st.session_state.get(STATE_KEY)
+    if memo is None:
+        max_mb = secrets_section("session").get("memo_mb")
+        memo = SessionMemo(int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES)
+        st.session_state[STATE_KEY] = memo
+    return memo
@@ -0,0 +1,215 @@
+"""
+In-process latency metrics for the hot paths.
+
+Wrap a stage in ``with span("victims.infer"):`` (or decorate it with
+``@timed(...)``) and its duration lands in a per-stage histogram. Histograms
+keep Prometheus-style cumulative buckets for export plus a ring buffer of
+recent samples for p50/p95/p99. Everything is off by default: a disabled
+``span`` returns one shared no-op context manager, so instrumented code costs
+a function call and an attribute check.
+
+Enable it in ``.streamlit/secrets.toml``; with ``port`` set, a small HTTP
+exporter serves ``/metrics`` in Prometheus text format::
+
+    [metrics]
+    enabled = true
+    port = 9464
+"""
+import bisect
+import functools
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import streamlit as st
+
+from utils.settings import secrets_section
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RESERVOIR_SIZE = 2048
+METRIC_NAME = "sahayta_stage_seconds"
+
+_NOOP = nullcontext()
+_enabled = False
+
+
+class Histogram:
+    """Cumulative buckets, sum and count, plus the most recent samples for percentiles."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = np.zeros(RESERVOIR_SIZE, dtype=np.float64)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+            self.sum += seconds
+            self.recent[self.count % RESERVOIR_SIZE] = seconds
+            self.count += 1
+
+    def snapshot(self):
+        """Consistent copies of ``(counts, sum, count, recent samples)``."""
+        with self._lock:
+            return list(self.counts), self.sum, self.count, self.recent[:min(self.count, RESERVOIR_SIZE)].copy()
+
+    def percentiles(self, qs=(50, 95, 99)):
+        samples = self.snapshot()[3]
+        return np.percentile(samples, qs) if len(samples) else [float("nan")] * len(qs)
+
+
+_histograms = {}
+_registry_lock = threading.Lock()
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = bool(flag)
+
+
+def enabled():
+    return _enabled
+
+
+def observe(stage, seconds):
+    """Record one duration for ``stage``."""
+    histogram = _histograms.get(stage)
+    if histogram is None:
+        with _registry_lock:
+            histogram = _histograms.setdefault(stage, Histogram())
+    histogram.observe(seconds)
+
+
+class _Span:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+def span(stage):
+    """Context manager timing ``stage``; a shared no-op while metrics are disabled."""
+    return _Span(stage) if _enabled else _NOOP
+
+
+def timed(stage):
+    """Decorator form of ``span``."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _stages():
+    """``(stage, histogram)`` pairs, copied under the lock so exporting never races a new stage."""
+    with _registry_lock:
+        return sorted(_histograms.items())
+
+
+def summary():
+    """One row per stage with its count, mean and p50/p95/p99 in milliseconds."""
+    rows = []
+    for stage, histogram in _stages():
+        _, total, count, samples = histogram.snapshot()
+        p50, p95, p99 = np.percentile(samples, (50, 95, 99)) if len(samples) else [float("nan")] * 3
+        rows.append({
+            "stage": stage,
+            "count": count,
+            "mean_ms": round(1000 * total / count, 1) if count else None,
+            "p50_ms": round(1000 * float(p50), 1),
+            "p95_ms": round(1000 * float(p95), 1),
+            "p99_ms": round(1000 * float(p99), 1),
+        })
+    return rows
+
+
+def prometheus_text():
+    """All histograms in the Prometheus text exposition format."""
+    lines = [f"# HELP {METRIC_NAME} Duration of instrumented stages.", f"# TYPE {METRIC_NAME} histogram"]
+    for stage, histogram in _stages():
+        label = stage.replace("\\", "\\\\").replace('"', '\\"')
+        counts, total, count, _ = histogram.snapshot()
+        cumulative = 0
+        for bound, n in zip(BUCKETS + (float("inf"),), counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{METRIC_NAME}_bucket{{stage="{label}",le="{le}"}} {cumulative}')
+        lines.append(f'{METRIC_NAME}_sum{{stage="{label}"}} {total}')
+        lines.append(f'{METRIC_NAME}_count{{stage="{label}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _registry_lock:
+        _histograms.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port, host="0.0.0.0"):
+    """Serve ``/metrics`` from a daemon thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+    return server
+
+
+@st.cache_resource(show_spinner=False)
+def _start(enabled_, port):
+    enable(enabled_)
+    if enabled_ and port:
+        try:
+            serve(int(port))
+        except OSError:
+            # Another process (e.g. a second Streamlit server) already owns the port
+            pass
+    return enabled_
+
+
+def configure():
+    """
+    Apply the ``[metrics]`` secrets once per process: enable collection and
+    start the exporter when a port is given. Returns whether metrics are on.
+    """
+    settings = secrets_section("metrics")
+    return _start(bool(settings.get("enabled", False)), settings.get("port"))
+
+
+def sidebar_panel():
+    """Sidebar table of per-stage percentiles, shown only while metrics are enabled."""
+    if not _enabled or not _histograms:
+        return
+    with st.sidebar.expander("⏱️ Stage latency"):
+        st.dataframe(summary(), hide_index=True)
+        if st.button("Reset timings"):
+            reset()
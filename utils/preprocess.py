@@ -0,0 +1,107 @@
+"""
+Single-decode, single-encode image preprocessing.
+
+An upload is decoded exactly once, straight to roughly model resolution:
+JPEGs use libjpeg's draft mode to decode at 1/2, 1/4 or 1/8 scale instead of
+materialising a 20-40 MP bitmap. EXIF orientation is applied before the
+640x640 crop. The resulting ``PreparedImage`` carries the normalized pixels
+plus a JPEG payload, content digest and perceptual hash that are computed at
+most once and shared by every model call and cache lookup.
+"""
+import base64
+import io
+from functools import cached_property
+
+from PIL import Image, ImageOps
+
+from utils.cache import image_digest
+from utils.dedupe import phash
+from utils.metrics import span
+
+INPUT_SIZE = (640, 640)
+
+
+def encode_jpeg(image, quality=90):
+    """Encode a PIL image as JPEG bytes."""
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def encode_image(image, quality=90):
+    """Encode a PIL image as the base64 JPEG body expected by Roboflow."""
+    return base64.b64encode(encode_jpeg(image, quality))
+
+
+class PreparedImage:
+    """A normalized model input with its lazily computed payload and digest."""
+
+    def __init__(self, image):
+        self.image = image
+
+    @property
+    def size(self):
+        return self.image.size
+
+    @cached_property
+    def payload(self):
+        with span("image.encode"):
+            return encode_image(self.image)
+
+    @cached_property
+    def digest(self):
+        return image_digest(self.image)
+
+    @cached_property
+    def phash(self):
+        return phash(self.image)
+
+
+def load_image(source, size=INPUT_SIZE):
+    """Decode a path or file object once and return it as a ``PreparedImage``."""
+    with span("image.decode"):
+        image = Image.open(source)
+        if image.format == "JPEG":
+            # The drafted image is still at least ``size`` on both sides
+            image.draft("RGB", size)
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    with span("image.fit"):
+        return PreparedImage(ImageOps.fit(image, size))
+
+
+def open_full_resolution(source):
+    """Decode a path or file object at full resolution with EXIF orientation applied."""
+    return ImageOps.exif_transpose(Image.open(source)).convert("RGB")
+
+
+def prepare(image, size=INPUT_SIZE):
+    """
+    Wrap an already decoded PIL image, cropping it to ``size`` if it differs.
+    Pass ``size=None`` to keep the image's own dimensions.
+    """
+    if isinstance(image, PreparedImage):
+        return image
+    if size is not None and image.size != size:
+        image = ImageOps.fit(image, size)
+    return PreparedImage(image.convert("RGB"))
+
+
+def as_pil(image):
+    return image.image if isinstance(image, PreparedImage) else image
+
+
+def _degrees(dms):
+    degrees, minutes, seconds = (float(v) for v in dms)
+    return degrees + minutes / 60 + seconds / 3600
+
+
+def exif_location(source):
+    """``(lat, lon)`` from an image's EXIF GPS tags, or None when it has none."""
+    try:
+        with Image.open(source) as image:
+            gps = image.getexif().get_ifd(0x8825)
+        lat = _degrees(gps[2]) * (-1 if gps.get(1) == "S" else 1)
+        lon = _degrees(gps[4]) * (-1 if gps.get(3) == "W" else 1)
+    except (OSError, KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+    return (lat, lon) if -90 <= lat <= 90 and -180 <= lon <= 180 else None
@@ -0,0 +1,193 @@
+"""
+Call policies for every outbound request: timeouts, retries, circuit breaking
+and hedging.
+
+Each upstream (Roboflow, OpenWeatherMap, Nominatim) has one process-wide
+``CallPolicy``:
+
+- a per-endpoint ``(connect, read)`` timeout, passed to every request;
+- retries with full-jitter exponential backoff on connection errors,
+  timeouts, 429 and 5xx -- never on other 4xx, which retrying cannot fix;
+- a circuit breaker: after ``failure_threshold`` consecutive failures calls
+  fail immediately with ``CircuitOpenError`` for ``reset_seconds``, then one
+  trial call decides whether to close it again. Callers catch it to fall
+  back to a cached or local result;
+- optional hedging: if an attempt has not answered after ``hedge_after_ms``,
+  a second identical request is sent and the first answer wins. Only for
+  idempotent calls; it trades a little extra upstream load for a shorter tail.
+
+Defaults can be overridden per endpoint in ``.streamlit/secrets.toml``::
+
+    [resilience.roboflow]
+    read_timeout = 20
+    retries = 2
+    hedge_after_ms = 1500
+    failure_threshold = 5
+    reset_seconds = 30
+"""
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import streamlit as st
+
+from utils.settings import secrets_section
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+DEFAULT_POLICIES = {
+    "roboflow": {"connect_timeout": 3.05, "read_timeout": 20, "retries": 2, "hedge_after_ms": None},
+    "openweather": {"connect_timeout": 3.05, "read_timeout": 5, "retries": 2},
+    "nominatim": {"connect_timeout": 3.05, "read_timeout": 10, "retries": 1},
+}
+
+# Hedged attempts run here; a losing request is left to finish on its own
+_hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised without calling the upstream while its circuit breaker is open."""
+
+
+def is_retryable(error):
+    """Whether ``error`` is worth another attempt: network trouble, timeouts, 429 or 5xx."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        return response.status_code in RETRYABLE_STATUS
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    try:
+        import requests
+    except ImportError:
+        return False
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open trial call."""
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def allow(self):
+        """Whether a call may go out now; in half-open state only one trial call is let through."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_seconds or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class CallPolicy:
+    """Timeout, retry, breaker and hedging settings for one upstream endpoint."""
+
+    def __init__(self, name, connect_timeout=3.05, read_timeout=30.0, retries=2, backoff=0.25,
+                 max_backoff=4.0, failure_threshold=5, reset_seconds=30.0, hedge_after_ms=None):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.hedge_after = hedge_after_ms / 1000 if hedge_after_ms else None
+        self.stats = {"calls": 0, "retries": 0, "failures": 0, "short_circuited": 0, "hedges": 0, "hedge_wins": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def delay(self, attempt):
+        """Full-jitter backoff before retry number ``attempt`` (0-based)."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def call(self, fn, idempotent=True, hedge=False):
+        """
+        Run ``fn()`` under this policy and return its result. Non-idempotent
+        calls are never retried or hedged. Raises ``CircuitOpenError`` while
+        the breaker is open, otherwise the last error once attempts run out.
+        """
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpenError(f"{self.name} is unavailable, retrying in {self.breaker.reset_seconds:.0f} s")
+        attempts = 1 + (self.retries if idempotent else 0)
+        for attempt in range(attempts):
+            try:
+                if hedge and idempotent and self.hedge_after:
+                    result = self._hedged(fn)
+                else:
+                    result = fn()
+            except Exception as e:
+                if not is_retryable(e):
+                    # The upstream answered; a bad key or request says nothing about its health
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt == attempts - 1 or not self.breaker.allow():
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                time.sleep(self.delay(attempt))
+            else:
+                self.breaker.record_success()
+                return result
+
+    def _hedged(self, fn):
+        first = _hedge_pool.submit(fn)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result()
+        self._count("hedges")
+        pending = {first, _hedge_pool.submit(fn)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not first:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+
+def policy_settings(name):
+    """Defaults for ``name`` updated with its ``[resilience.<name>]`` secrets."""
+    settings = dict(DEFAULT_POLICIES.get(name, {}))
+    settings.update(secrets_section("resilience").get(name, {}))
+    return settings
+
+
+@st.cache_resource(show_spinner=False)
+def get_policy(name):
+    """Return the process-wide call policy for an upstream, so every session shares its breaker."""
+    return CallPolicy(name, **policy_settings(name))
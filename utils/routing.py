@@ -0,0 +1,503 @@
+"""
+Offline road-network routing.
+
+An OSM road extract (``.geojson`` of LineStrings, or ``.osm.pbf`` when
+pyosmium is installed) is turned into a compact CSR graph: per-node lat/lon,
+and for each direction an ``indptr``/``indices``/``edge`` triple pointing into
+one per-edge weight array. The arrays are saved as ``.npy`` files and opened
+with ``mmap_mode="r"``, so later starts map the graph instead of parsing it.
+
+Shortest paths use bidirectional A* with the average potential
+``p(v) = (h(v, t) - h(v, s)) / 2``. Both searches then run Dijkstra on the
+same non-negative reduced costs, so the usual ``top_f + top_b >= best``
+stopping rule stays exact. ``h`` is the great-circle distance, raised by ALT
+landmark bounds when the graph has them: exact distances from and to a few
+far-apart landmarks give ``d(v, t) >= d(L, t) - d(L, v)`` and
+``d(v, t) >= d(v, L) - d(t, L)``, which follow the road network around
+rivers and coasts where the straight line cannot. Landmarks are computed on
+the base weights; hazards only ever raise weights, so the bounds stay valid
+without recomputing them when closures change (contraction hierarchies would
+need re-contracting for that).
+
+The Python search is quick for short routes, but a long one settles hundreds
+of thousands of nodes at a few microseconds each. When SciPy is installed,
+routes longer than ``COMPILED_MIN_M`` go to ``scipy.sparse.csgraph.dijkstra``
+instead, bounded by ``limit`` to a detour of the straight-line distance and
+rerun unbounded only when the road route is longer than that. This is C, not
+a hierarchy: a state-scale cross-region query still costs one bounded
+Dijkstra (about 0.1-0.3 s at 1M nodes), not milliseconds.
+
+The app only memory-maps a saved graph. Build it and its landmarks offline
+(with SciPy this takes well under a minute per million nodes; its pure-Python
+fallback takes several seconds per landmark pass) with::
+
+    python -m utils.routing maharashtra.geojson .cache/road_graph [landmarks]
+"""
+import heapq
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+GRAPH_ARRAYS = ("lat", "lon", "src", "dst", "weight", "indptr", "indices", "edge",
+                "rindptr", "rindices", "redge")
+# Optional ALT preprocessing: landmark node ids, and node x landmark distances from/to them
+LANDMARK_ARRAYS = ("landmarks", "landmark_from", "landmark_to")
+DEFAULT_LANDMARKS = 16
+# Landmark distances are stored as float32; shave the bounds so rounding never overestimates
+LANDMARK_SLACK = 1 - 1e-6
+# Straight-line length above which routes use SciPy's compiled Dijkstra, when it is installed
+COMPILED_MIN_M = 15_000
+# The compiled search looks this far, as multiples of the straight-line distance, before searching everything
+DETOUR_LIMITS = (1.6, 4.0)
+ROAD_TYPES = {
+    "motorway", "trunk", "primary", "secondary", "tertiary", "unclassified", "residential",
+    "motorway_link", "trunk_link", "primary_link", "secondary_link", "tertiary_link",
+    "living_street", "service", "road", "track",
+}
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres; works on scalars and NumPy arrays alike."""
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _haversine_scalar(lat1, lon1, lat2, lon2):
+    # math is several times faster than NumPy for the single values A* needs
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def _is_oneway(properties):
+    return str(properties.get("oneway", "no")).lower() in ("yes", "true", "1")
+
+
+def iter_geojson_ways(path):
+    """Yield ``(coords, oneway)`` for every road LineString in a GeoJSON file."""
+    with open(path, encoding="utf-8") as f:
+        collection = json.load(f)
+    for feature in collection.get("features", []):
+        geometry = feature.get("geometry") or {}
+        properties = feature.get("properties") or {}
+        highway = properties.get("highway")
+        if highway is not None and highway not in ROAD_TYPES:
+            continue
+        if geometry.get("type") == "LineString":
+            lines = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiLineString":
+            lines = geometry["coordinates"]
+        else:
+            continue
+        for line in lines:
+            if len(line) >= 2:
+                yield [(lat, lon) for lon, lat, *_ in line], _is_oneway(properties)
+
+
+def iter_pbf_ways(path):
+    """Yield ``(coords, oneway)`` for every road way in an OSM PBF extract."""
+    try:
+        import osmium
+    except ImportError as e:
+        raise ImportError("Reading .pbf extracts needs pyosmium: pip install osmium") from e
+
+    ways = []
+
+    class Handler(osmium.SimpleHandler):
+        def way(self, w):
+            if w.tags.get("highway") in ROAD_TYPES:
+                coords = [(n.lat, n.lon) for n in w.nodes if n.location.valid()]
+                if len(coords) >= 2:
+                    ways.append((coords, _is_oneway(w.tags)))
+
+    Handler().apply_file(path, locations=True)
+    return iter(ways)
+
+
+def _dijkstra(indptr, indices, edges, weight, source):
+    """Distances (metres) from ``source`` to every node, inf where unreachable."""
+    dist = [math.inf] * (len(indptr) - 1)
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        start, end = indptr[u], indptr[u + 1]
+        for v, w in zip(indices[start:end].tolist(), weight[edges[start:end]].tolist()):
+            nd = d + w
+            if nd < dist[v]:
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return np.asarray(dist)
+
+
+def _distances(graph, sources, reverse=False):
+    """
+    ``len(sources) x num_nodes`` base-weight distances from (or, with
+    ``reverse``, to) each source. Uses SciPy's Dijkstra when it is installed.
+    """
+    try:
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import dijkstra
+    except ImportError:
+        if reverse:
+            adjacency = graph.rindptr, graph.rindices, graph.redge
+        else:
+            adjacency = graph.indptr, graph.indices, graph.edge
+        weight = np.asarray(graph.weight, dtype=np.float64)
+        return np.stack([_dijkstra(*adjacency, weight, s) for s in sources])
+
+    src, dst = (graph.dst, graph.src) if reverse else (graph.src, graph.dst)
+    src, dst = np.asarray(src), np.asarray(dst)
+    weight = np.asarray(graph.weight, dtype=np.float64)
+    # csr_matrix sums duplicate entries, but parallel roads must keep the shorter one
+    order = np.lexsort((weight, dst, src))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (src[order][1:] != src[order][:-1]) | (dst[order][1:] != dst[order][:-1])
+    keep = order[first]
+    n = graph.num_nodes
+    matrix = csr_matrix((weight[keep], (src[keep], dst[keep])), shape=(n, n))
+    return dijkstra(matrix, directed=True, indices=list(sources))
+
+
+def _has_scipy():
+    try:
+        import scipy.sparse.csgraph  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _csr(keys, neighbours, num_nodes):
+    order = np.argsort(keys, kind="stable")
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=num_nodes), out=indptr[1:])
+    return indptr, neighbours[order].astype(np.int32), order.astype(np.int64)
+
+
+class RoadGraph:
+    """Array-backed directed road graph with forward and reverse CSR adjacency."""
+
+    def __init__(self, arrays, key=None):
+        for name in GRAPH_ARRAYS:
+            setattr(self, name, arrays[name])
+        for name in LANDMARK_ARRAYS:
+            setattr(self, name, arrays.get(name))
+        # Routing reads this; hazards (or anything else) may swap in adjusted weights,
+        # bumping weight_version whenever they change them in place
+        self.active_weight = self.weight
+        self.weight_version = 0
+        self._matrix = None
+        # Identifies this graph for caches of things derived from it, such as hazard layers
+        self.key = key or f"memory:{id(self)}"
+
+    @property
+    def num_nodes(self):
+        return len(self.lat)
+
+    @property
+    def num_edges(self):
+        return len(self.src)
+
+    @classmethod
+    def from_ways(cls, ways):
+        """Build a graph from ``(coords, oneway)`` ways, merging shared vertices."""
+        coords, way_ids, oneway = [], [], []
+        for way_id, (line, is_oneway) in enumerate(ways):
+            coords.extend(line)
+            way_ids.extend([way_id] * len(line))
+            oneway.append(is_oneway)
+        if not coords:
+            raise ValueError("The road extract contains no usable ways.")
+        coords = np.asarray(coords, dtype=np.float64)
+        way_ids = np.asarray(way_ids)
+        oneway = np.asarray(oneway, dtype=bool)
+
+        # ~1 cm rounding so the same junction coming from two ways becomes one node
+        nodes, node_of = np.unique(np.round(coords, 7), axis=0, return_inverse=True)
+        node_of = node_of.ravel()
+        same_way = way_ids[1:] == way_ids[:-1]
+        src, dst = node_of[:-1][same_way], node_of[1:][same_way]
+        both = ~oneway[way_ids[1:][same_way]]
+        src, dst = np.concatenate([src, dst[both]]), np.concatenate([dst, src[both]])
+        keep = src != dst
+        return cls.from_edges(nodes[:, 0], nodes[:, 1], src[keep], dst[keep])
+
+    @classmethod
+    def from_edges(cls, lat, lon, src, dst):
+        """Build a graph from node coordinates and directed ``src -> dst`` node pairs."""
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        src, dst = np.asarray(src).astype(np.int32), np.asarray(dst).astype(np.int32)
+        weight = haversine(lat[src], lon[src], lat[dst], lon[dst]).astype(np.float32)
+        indptr, indices, edge = _csr(src, dst, len(lat))
+        rindptr, rindices, redge = _csr(dst, src, len(lat))
+        return cls({
+            "lat": lat, "lon": lon, "src": src, "dst": dst, "weight": weight,
+            "indptr": indptr, "indices": indices, "edge": edge,
+            "rindptr": rindptr, "rindices": rindices, "redge": redge,
+        })
+
+    @classmethod
+    def from_file(cls, path):
+        ways = iter_pbf_ways(path) if path.endswith(".pbf") else iter_geojson_ways(path)
+        return cls.from_ways(ways)
+
+    def build_landmarks(self, count=DEFAULT_LANDMARKS):
+        """
+        ALT preprocessing: pick ``count`` far-apart landmarks and store exact
+        base-weight distances from and to each of them for every node.
+        """
+        # Start from a node that reaches most of the graph; any one node may sit on an isolated stub
+        rng = np.random.default_rng(0)
+        nearest, reached = None, -1
+        for start in [0, *rng.integers(0, self.num_nodes, 8).tolist()]:
+            row = _distances(self, [start])[0]
+            if np.isfinite(row).sum() > reached:
+                nearest, reached = row, np.isfinite(row).sum()
+            if 2 * reached > self.num_nodes:
+                break
+        # Farthest-point selection: each new landmark is the node farthest from all chosen so far
+        chosen, rows = [], []
+        for _ in range(min(count, self.num_nodes)):
+            spread = np.where(np.isfinite(nearest), nearest, -1.0)
+            node = int(np.argmax(spread))
+            if chosen and spread[node] <= 0:
+                break
+            row = _distances(self, [node])[0]
+            chosen.append(node)
+            rows.append(row)
+            nearest = row if len(rows) == 1 else np.minimum(nearest, row)
+        self.landmarks = np.asarray(chosen, dtype=np.int32)
+        # Node-major, so the bounds for one node are a single contiguous read
+        self.landmark_from = np.ascontiguousarray(np.stack(rows).T, dtype=np.float32)
+        self.landmark_to = np.ascontiguousarray(_distances(self, chosen, reverse=True).T, dtype=np.float32)
+        return self
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in GRAPH_ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), np.asarray(getattr(self, name)))
+        for name in LANDMARK_ARRAYS:
+            path = os.path.join(directory, f"{name}.npy")
+            if self.landmarks is not None:
+                np.save(path, np.asarray(getattr(self, name)))
+            elif os.path.exists(path):
+                # Landmarks of an older graph would give wrong bounds on this one
+                os.remove(path)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        mode = "r" if mmap else None
+        key = f"{os.path.abspath(directory)}@{os.stat(os.path.join(directory, 'weight.npy')).st_mtime_ns}"
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode)
+                  for name in GRAPH_ARRAYS}
+        for name in LANDMARK_ARRAYS:
+            path = os.path.join(directory, f"{name}.npy")
+            if os.path.exists(path):
+                arrays[name] = np.load(path, mmap_mode=mode)
+        return cls(arrays, key)
+
+    def nearest_node(self, lat, lon):
+        """Index of the graph node closest to ``(lat, lon)``."""
+        dx = (self.lon - lon) * math.cos(math.radians(lat))
+        dy = self.lat - lat
+        return int(np.argmin(dx * dx + dy * dy))
+
+    def _potential(self, source, target, landmarks):
+        """
+        Cached average potential for a list of nodes. Each side's lower bound is
+        the larger of the great-circle and the landmark bounds; a bound of inf
+        proves the node cannot reach ``target`` (or be reached from ``source``).
+        """
+        lat, lon = np.asarray(self.lat), np.asarray(self.lon)
+        slat, slon, tlat, tlon = float(lat[source]), float(lon[source]), float(lat[target]), float(lon[target])
+        cache = {}
+
+        if landmarks and self.landmarks is not None and len(self.landmarks):
+            # Plain ndarray views of the memory maps index much faster than np.memmap itself
+            lf, lt = np.asarray(self.landmark_from), np.asarray(self.landmark_to)
+            from_s, to_s, from_t, to_t = (np.asarray(a[n], np.float64) for a, n in
+                                          ((lf, source), (lt, source), (lf, target), (lt, target)))
+            # Each bound subtracts the source's or target's landmark distance; landmarks that
+            # cannot see them would only give inf - inf, so leave those bounds out
+            ahead_from = np.flatnonzero(np.isfinite(from_t)).tolist()
+            ahead_to = np.flatnonzero(np.isfinite(to_t)).tolist()
+            behind_from = np.flatnonzero(np.isfinite(from_s)).tolist()
+            behind_to = np.flatnonzero(np.isfinite(to_s)).tolist()
+            from_s, to_s, from_t, to_t = from_s.tolist(), to_s.tolist(), from_t.tolist(), to_t.tolist()
+
+            def compute(nodes):
+                # Plain floats: a handful of landmarks per node is far cheaper than NumPy calls
+                rows_from, rows_to = lf[nodes].tolist(), lt[nodes].tolist()
+                out = []
+                for v, fv, tv in zip(nodes, rows_from, rows_to):
+                    vlat, vlon = float(lat[v]), float(lon[v])
+                    ahead = max([from_t[k] - fv[k] for k in ahead_from]
+                                + [tv[k] - to_t[k] for k in ahead_to], default=0.0) * LANDMARK_SLACK
+                    behind = max([fv[k] - from_s[k] for k in behind_from]
+                                 + [to_s[k] - tv[k] for k in behind_to], default=0.0) * LANDMARK_SLACK
+                    ahead = max(ahead, _haversine_scalar(vlat, vlon, tlat, tlon))
+                    behind = max(behind, _haversine_scalar(vlat, vlon, slat, slon))
+                    out.append(0.5 * (ahead - behind))
+                return out
+        else:
+            def compute(nodes):
+                return [0.5 * (_haversine_scalar(float(lat[v]), float(lon[v]), tlat, tlon)
+                               - _haversine_scalar(float(lat[v]), float(lon[v]), slat, slon)) for v in nodes]
+
+        def potential(nodes):
+            missing = [v for v in nodes if v not in cache]
+            if missing:
+                cache.update(zip(missing, compute(missing)))
+            return [cache[v] for v in nodes]
+
+        return potential
+
+    def shortest_path(self, source, target, method="auto"):
+        """
+        Shortest path between two node indices. Returns ``(nodes, metres)``, or
+        ``(None, inf)`` when the target is unreachable. ``method`` is
+        ``"astar"`` (great-circle bound only), ``"alt"`` (landmark bounds when
+        the graph has them), ``"compiled"`` (SciPy) or ``"auto"``: compiled
+        for routes longer than ``COMPILED_MIN_M`` when SciPy is installed,
+        ALT otherwise.
+        """
+        if source == target:
+            return [source], 0.0
+        if method == "auto":
+            straight = _haversine_scalar(float(self.lat[source]), float(self.lon[source]),
+                                         float(self.lat[target]), float(self.lon[target]))
+            method = "compiled" if straight > COMPILED_MIN_M and _has_scipy() else "alt"
+        if method == "compiled":
+            return self._compiled_path(source, target)
+        if method not in ("alt", "astar"):
+            raise ValueError(f"Unknown routing method: {method}")
+        return self._astar(source, target, landmarks=method == "alt")
+
+    def _csgraph(self):
+        """The active weights as a SciPy CSR matrix, rebuilt only when they change."""
+        from scipy.sparse import csr_matrix
+
+        # Read the version first, so weights changed mid-copy are picked up on the next call
+        weight, version = self.active_weight, self.weight_version
+        cached = self._matrix
+        if cached is None or cached[0] is not weight or cached[1] != version:
+            n = self.num_nodes
+            # Parallel roads stay separate entries; csgraph relaxes each, so the shorter one wins
+            data = np.asarray(weight, dtype=np.float64)[np.asarray(self.edge)]
+            matrix = csr_matrix((data, np.asarray(self.indices), np.asarray(self.indptr)), shape=(n, n))
+            self._matrix = cached = (weight, version, matrix)
+        return cached[2]
+
+    def _compiled_path(self, source, target):
+        from scipy.sparse.csgraph import dijkstra
+
+        matrix = self._csgraph()
+        straight = _haversine_scalar(float(self.lat[source]), float(self.lon[source]),
+                                     float(self.lat[target]), float(self.lon[target]))
+        # Settle only the disc a plausible detour can reach; search everything only if that misses
+        for limit in [factor * straight + 1000.0 for factor in DETOUR_LIMITS] + [np.inf]:
+            dist, parent = dijkstra(matrix, indices=source, limit=limit, return_predecessors=True)
+            if math.isfinite(dist[target]):
+                break
+        else:
+            return None, math.inf
+        path = [target]
+        while path[-1] != source:
+            path.append(int(parent[path[-1]]))
+        path.reverse()
+        return path, self.path_length(path)
+
+    def _astar(self, source, target, landmarks=True):
+        """Bidirectional A*, or ALT when the graph has landmarks and ``landmarks`` is true."""
+        potential = self._potential(source, target, landmarks)
+        if potential([source])[0] == math.inf:
+            # A landmark already proves the target cannot be reached
+            return None, math.inf
+
+        weight = np.asarray(self.active_weight)
+        sides = (
+            (np.asarray(self.indptr), np.asarray(self.indices), np.asarray(self.edge), 1.0),
+            (np.asarray(self.rindptr), np.asarray(self.rindices), np.asarray(self.redge), -1.0),
+        )
+        dist = ({source: 0.0}, {target: 0.0})
+        parent = ({source: -1}, {target: -1})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        settled = (set(), set())
+        best, meet = math.inf, -1
+
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+            d, u = heapq.heappop(heaps[side])
+            if u in settled[side]:
+                continue
+            settled[side].add(u)
+            indptr, indices, edges, sign = sides[side]
+            own, other = dist[side], dist[1 - side]
+            pu = sign * potential([u])[0]
+            start, end = indptr[u], indptr[u + 1]
+            neighbours = indices[start:end].tolist()
+            for v, e, pv in zip(neighbours, edges[start:end].tolist(), potential(neighbours)):
+                w = float(weight[e])
+                if not math.isfinite(w):
+                    continue
+                nd = d + max(0.0, w - pu + sign * pv)
+                if nd < own.get(v, math.inf):
+                    own[v] = nd
+                    parent[side][v] = u
+                    heapq.heappush(heaps[side], (nd, v))
+                    if v in other and nd + other[v] < best:
+                        best, meet = nd + other[v], v
+
+        if meet < 0:
+            return None, math.inf
+        path = []
+        node = meet
+        while node != -1:
+            path.append(node)
+            node = parent[0][node]
+        path.reverse()
+        node = parent[1][meet]
+        while node != -1:
+            path.append(node)
+            node = parent[1][node]
+        # Sum real edge lengths rather than undoing the potentials, to avoid float drift
+        return path, self.path_length(path)
+
+    def path_length(self, path):
+        nodes = np.asarray(path)
+        return float(haversine(self.lat[nodes[:-1]], self.lon[nodes[:-1]],
+                               self.lat[nodes[1:]], self.lon[nodes[1:]]).sum())
+
+    def route(self, start, end):
+        """
+        Route between two ``(lat, lon)`` points. Returns a dict with the
+        ``[lon, lat]`` polyline for a pydeck PathLayer and the length in metres,
+        or None when no road connects them.
+        """
+        source, target = self.nearest_node(*start), self.nearest_node(*end)
+        path, metres = self.shortest_path(source, target)
+        if path is None:
+            return None
+        nodes = np.asarray(path)
+        polyline = np.stack([self.lon[nodes], self.lat[nodes]], axis=1)
+        return {"path": polyline.tolist(), "distance_m": metres, "nodes": path}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        sys.exit("usage: python -m utils.routing <extract.geojson|extract.osm.pbf> <output-dir> [landmarks]")
+    graph = RoadGraph.from_file(sys.argv[1])
+    count = int(sys.argv[3]) if len(sys.argv) == 4 else DEFAULT_LANDMARKS
+    if count > 0:
+        graph.build_landmarks(count)
+    graph.save(sys.argv[2])
+    print(f"{graph.num_nodes} nodes, {graph.num_edges} edges, {count} landmarks -> {sys.argv[2]}")
@@ -0,0 +1,287 @@
+"""
+Flood segmentation of large satellite scenes with the U-Net model.
+
+Scenes of 10k x 10k pixels and more are never loaded whole. Windows are read
+on demand (rasterio windowed reads for GeoTIFFs, ``np.load(mmap_mode="r")``
+for ``.npy`` rasters) and pushed through an ONNX Runtime copy of the U-Net in
+batches. Overlapping tile predictions are blended with a tapered weight
+window into an accumulator one tile row high; rows no later tile can touch
+are thresholded, bit-packed and written straight to a memory-mapped mask on
+disk while the flooded-area statistics are updated. Peak memory is therefore
+one batch of tiles plus one strip of the scene width.
+
+Export the trained Keras model once with::
+
+    python -m tf2onnx.convert --keras unet.keras --output Flood_mapping/unet.onnx
+"""
+import io
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from utils.tiling import tile_origins
+
+DEFAULT_UNET_PATH = "Flood_mapping/unet.onnx"
+DEFAULT_TILE_SIZE = 256
+DEFAULT_OVERLAP = 0.25
+RASTER_EXTENSIONS = ["tif", "tiff", "npy", "png", "jpg", "jpeg"]
+# PIL decodes whole images; anything larger must come as a windowed GeoTIFF or .npy.
+# Kept under PIL's own decompression-bomb warning threshold (about 89 Mpx)
+MAX_DECODED_PIXELS = 80_000_000
+
+
+def _to_rgb(window):
+    """Coerce an (H, W[, C]) window of any dtype to uint8 RGB."""
+    if window.ndim == 2:
+        window = window[:, :, None]
+    if window.shape[2] == 1:
+        window = np.repeat(window, 3, axis=2)
+    window = window[:, :, :3]
+    if window.dtype != np.uint8:
+        window = np.clip(window, 0, 255).astype(np.uint8)
+    return window
+
+
+class NpyRaster:
+    """An (H, W[, C]) ``.npy`` scene read through a memory map."""
+
+    def __init__(self, path):
+        self.array = np.load(path, mmap_mode="r")
+        self.height, self.width = self.array.shape[:2]
+        self.pixel_area_m2 = None
+        self.bounds = None
+
+    def read(self, x0, y0, x1, y1):
+        return _to_rgb(np.asarray(self.array[y0:y1, x0:x1]))
+
+    def close(self):
+        del self.array
+
+
+class RasterioRaster:
+    """A GeoTIFF (or any GDAL format) read window by window with rasterio."""
+
+    def __init__(self, path):
+        import rasterio
+        from rasterio.windows import Window
+
+        self._window = Window
+        self.dataset = rasterio.open(path)
+        self.width, self.height = self.dataset.width, self.dataset.height
+        self.bands = list(range(1, min(3, self.dataset.count) + 1))
+        res_x, res_y = self.dataset.res
+        crs = self.dataset.crs
+        if crs is not None and crs.is_geographic:
+            left, bottom, right, top = self.dataset.bounds
+            # Degrees to metres at the scene centre; accurate enough for area totals
+            lat = math.radians((top + bottom) / 2)
+            self.pixel_area_m2 = res_x * 111320 * math.cos(lat) * res_y * 110540
+            self.bounds = (bottom, left, top, right)
+        else:
+            self.pixel_area_m2 = res_x * res_y if crs is not None else None
+            self.bounds = None
+
+    def read(self, x0, y0, x1, y1):
+        window = self._window(x0, y0, x1 - x0, y1 - y0)
+        return _to_rgb(self.dataset.read(self.bands, window=window).transpose(1, 2, 0))
+
+    def close(self):
+        self.dataset.close()
+
+
+class PilRaster:
+    """Fallback for plain images; PIL decodes the whole file, so these are capped at ``MAX_DECODED_PIXELS``."""
+
+    def __init__(self, path):
+        try:
+            image = Image.open(path)
+        except Image.DecompressionBombError:
+            image = None
+        if image is None or image.width * image.height > MAX_DECODED_PIXELS:
+            if image is not None:
+                image.close()
+            raise ValueError(
+                f"Scene is too large to decode whole (over {MAX_DECODED_PIXELS // 1_000_000} Mpx); "
+                "provide it as a GeoTIFF with rasterio installed, or as .npy, for windowed reads"
+            )
+        with image:
+            self.image = image.convert("RGB")
+        self.width, self.height = self.image.size
+        self.pixel_area_m2 = None
+        self.bounds = None
+
+    def read(self, x0, y0, x1, y1):
+        return np.asarray(self.image.crop((x0, y0, x1, y1)))
+
+    def close(self):
+        self.image.close()
+
+
+def open_raster(path):
+    """Open a scene for windowed reads, preferring rasterio for GeoTIFFs when installed."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        return NpyRaster(path)
+    if extension in (".tif", ".tiff"):
+        try:
+            return RasterioRaster(path)
+        except ImportError:
+            pass
+    return PilRaster(path)
+
+
+class UNetSegmenter:
+    """CPU inference of the exported U-Net with ONNX Runtime."""
+
+    def __init__(self, model_path=DEFAULT_UNET_PATH, providers=None, num_threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("Flood segmentation needs onnxruntime: pip install onnxruntime") from e
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            model_path, options, providers=providers or ["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        shape = model_input.shape
+        # tf2onnx keeps Keras' NHWC layout; PyTorch exports are NCHW
+        self.channels_last = shape[-1] in (1, 3)
+        size = shape[1] if self.channels_last else shape[2]
+        self.tile_size = size if isinstance(size, int) else DEFAULT_TILE_SIZE
+        self.fixed_batch = shape[0] if isinstance(shape[0], int) else None
+
+    def predict_batch(self, tiles):
+        """Flood probability maps (N, H, W) for a uint8 batch of RGB tiles (N, H, W, 3)."""
+        batch = np.ascontiguousarray(tiles, dtype=np.float32) / 255.0
+        if not self.channels_last:
+            batch = batch.transpose(0, 3, 1, 2)
+        step = self.fixed_batch or len(batch)
+        output = np.concatenate([
+            self.session.run(None, {self.input_name: batch[i:i + step]})[0]
+            for i in range(0, len(batch), step)
+        ])
+        if not self.channels_last:
+            output = output.transpose(0, 2, 3, 1)
+        if output.ndim == 4:
+            # Two-class softmax heads keep the flood probability in the last channel
+            output = output[..., -1]
+        if output.min() < 0 or output.max() > 1:
+            output = 1 / (1 + np.exp(-output))
+        return output.astype(np.float32)
+
+
+def blend_window(tile_size, floor=0.05):
+    """Tapered (pyramid) weights so tile centres outweigh their seams."""
+    ramp = 1 - np.abs(np.linspace(-1, 1, tile_size, dtype=np.float32))
+    ramp = np.maximum(ramp, floor)
+    return np.outer(ramp, ramp)
+
+
+def _read_padded(raster, x, y, tile_size):
+    window = raster.read(x, y, min(x + tile_size, raster.width), min(y + tile_size, raster.height))
+    h, w = window.shape[:2]
+    if h < tile_size or w < tile_size:
+        window = np.pad(window, ((0, tile_size - h), (0, tile_size - w), (0, 0)), mode="edge")
+    return window
+
+
+def segment_raster(raster, model, mask_path, overlap=DEFAULT_OVERLAP, batch_size=8, threshold=0.5,
+                   pixel_area_m2=None, preview_size=1024, progress=None):
+    """
+    Segment ``raster`` tile by tile and write a bit-packed mask to ``mask_path``.
+
+    The mask is an ``.npy`` array of shape (height, ceil(width / 8)) holding
+    ``np.packbits`` rows. ``progress(done, total, stats)`` is called after
+    every batch with the running statistics. Returns the final statistics
+    plus a strided boolean preview no larger than ``preview_size``.
+    ``pixel_area_m2`` is only used when the raster carries no georeference.
+    """
+    started = time.perf_counter()
+    tile = model.tile_size
+    width, height = raster.width, raster.height
+    area = raster.pixel_area_m2 or pixel_area_m2
+    xs, ys = tile_origins(width, tile, overlap), tile_origins(height, tile, overlap)
+    weight = blend_window(tile)
+
+    mask = np.lib.format.open_memmap(mask_path, mode="w+", dtype=np.uint8, shape=(height, (width + 7) // 8))
+    stride = max(1, math.ceil(max(width, height) / preview_size))
+    preview = np.zeros((math.ceil(height / stride), math.ceil(width / stride)), dtype=bool)
+
+    # Accumulators one tile row high, padded so edge tiles never need clipping
+    acc = np.zeros((tile, width + tile), dtype=np.float32)
+    wsum = np.zeros_like(acc)
+    stats = {"flooded_pixels": 0, "total_pixels": 0}
+    base = 0
+
+    def flush(rows):
+        nonlocal base
+        if rows <= 0:
+            return
+        flooded = acc[:rows, :width] >= threshold * np.maximum(wsum[:rows, :width], 1e-6)
+        mask[base:base + rows] = np.packbits(flooded, axis=1)
+        first = -base % stride
+        preview[(base + first) // stride:(base + rows + stride - 1) // stride] = flooded[first::stride, ::stride]
+        stats["flooded_pixels"] += int(np.count_nonzero(flooded))
+        stats["total_pixels"] += flooded.size
+        acc[:tile - rows] = acc[rows:]
+        wsum[:tile - rows] = wsum[rows:]
+        acc[tile - rows:] = 0
+        wsum[tile - rows:] = 0
+        base += rows
+
+    def read_batch(y, batch_xs):
+        return np.stack([_read_padded(raster, x, y, tile) for x in batch_xs])
+
+    jobs = [(y, xs[i:i + batch_size]) for y in ys for i in range(0, len(xs), batch_size)]
+    total_tiles, done = len(xs) * len(ys), 0
+    # Read the next batch from disk while the current one is on the CPU
+    with ThreadPoolExecutor(max_workers=1) as reader:
+        pending = reader.submit(read_batch, *jobs[0])
+        for index, (y, batch_xs) in enumerate(jobs):
+            tiles = pending.result()
+            if index + 1 < len(jobs):
+                pending = reader.submit(read_batch, *jobs[index + 1])
+            flush(min(y, height) - base)
+            probabilities = model.predict_batch(tiles)
+            for x, probability in zip(batch_xs, probabilities):
+                acc[:, x:x + tile] += probability * weight
+                wsum[:, x:x + tile] += weight
+            done += len(batch_xs)
+            if progress is not None:
+                progress(done, total_tiles, _summary(stats, area))
+    flush(height - base)
+    mask.flush()
+    del mask
+
+    result = _summary(stats, area)
+    result.update(width=width, height=height, tiles=total_tiles, mask_path=mask_path, preview=preview,
+                  bounds=raster.bounds, seconds=time.perf_counter() - started)
+    return result
+
+
+def _summary(stats, pixel_area_m2):
+    total = stats["total_pixels"]
+    flooded = stats["flooded_pixels"]
+    return {
+        "flooded_pixels": flooded,
+        "coverage": flooded / total if total else 0.0,
+        "flooded_km2": flooded * pixel_area_m2 / 1e6 if pixel_area_m2 else None,
+    }
+
+
+def mask_png(mask_path, width):
+    """Encode a packed mask as a 1-bit PNG; bit-packed rows map straight onto PIL's mode "1"."""
+    packed = np.load(mask_path, mmap_mode="r")
+    image = Image.frombytes("1", (width, packed.shape[0]), np.ascontiguousarray(packed).tobytes())
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
@@ -0,0 +1,364 @@
+"""
+Headless detection API with request queueing and dynamic micro-batching.
+
+Field apps and drone ground stations can call the detection models over
+HTTP without going through Streamlit. Requests for the same model (and API
+key) that arrive within ``max_wait_ms`` of each other are grouped into one
+backend batch: one forward pass for the local ONNX model, or concurrent calls
+over the pooled session for Roboflow. Each model has a bounded queue; when it
+is full the service answers 429 with ``Retry-After`` instead of letting
+latency grow without limit.
+
+Endpoints:
+
+- ``POST /{project}/{version}?api_key=...`` -- Roboflow-compatible: the body
+  is a base64 JPEG and the response is ``{"predictions": [...]}``, so
+  ``utils.clients.InferenceClient`` can simply point at this service. Only
+  the victim and water-level models are served; other ids get 404.
+- ``POST /detect`` -- raw image bytes (or base64); runs both models and
+  returns their predictions with person / animal counts and flood level.
+- ``GET /health`` -- queue depth, batch sizes and rejections per model.
+- ``GET /metrics`` -- per-stage latency histograms in Prometheus text format.
+
+Run with (needs ``pip install aiohttp``)::
+
+    python -m utils.service --port 8600 --api-key $ROBOFLOW_API_KEY [--onnx best.onnx]
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import io
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+
+from utils.backends import OnnxBackend, RemoteBackend
+from utils.cache import DetectionCache
+from utils.clients import ROBOFLOW_API_URL, InferenceClient, PooledSession, upstream_status
+from utils import metrics
+from utils.detector import VICTIM_MODEL_ID, WATER_LEVEL_MODEL_ID, summarize
+from utils.preprocess import PreparedImage, open_full_resolution
+
+DEFAULT_PORT = 8600
+DEFAULT_MAX_BATCH = 16
+DEFAULT_MAX_WAIT_MS = 5
+DEFAULT_MAX_QUEUE = 128
+DEFAULT_CONCURRENCY = 4
+# Distinct (model, API key) batchers kept alive; idle ones beyond this are stopped
+DEFAULT_MAX_BATCHERS = 16
+
+
+class MicroBatcher:
+    """
+    Groups concurrently submitted items into batches for ``predict_batch``.
+
+    ``concurrency`` batches may be in flight at once. ``predict_batch`` runs on
+    a thread and returns one result per item; an item's result may be an
+    exception instance, which is raised to that caller only.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=DEFAULT_MAX_BATCH, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 max_queue=DEFAULT_MAX_QUEUE, concurrency=DEFAULT_CONCURRENCY, executor=None, name="batch"):
+        self.predict_batch = predict_batch
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.concurrency = concurrency
+        self.executor = executor
+        self._workers = []
+        self.requests = self.batches = self.rejected = 0
+        self.pending = 0
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.ensure_future(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, item):
+        """Queue ``item`` and wait for its result; raises ``asyncio.QueueFull`` when saturated."""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((item, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise
+        self.requests += 1
+        self.pending += 1
+        self.start()
+        try:
+            return await future
+        finally:
+            self.pending -= 1
+
+    def idle(self):
+        return not self.pending and self.queue.empty()
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            self.batches += 1
+            items = [item for item, _, _ in batch]
+            if metrics.enabled():
+                now = time.perf_counter()
+                for _, _, queued in batch:
+                    metrics.observe(f"{self.name}.queue_wait", now - queued)
+            try:
+                with metrics.span(f"{self.name}.batch"):
+                    results = await loop.run_in_executor(self.executor, self.predict_batch, items)
+            except Exception as e:
+                results = [e] * len(batch)
+            for (_, future, _), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "rejected": self.rejected,
+        }
+
+
+def fan_out(backend, executor):
+    """``predict_batch`` for a backend without a batch endpoint: one concurrent call per item."""
+    def predict_batch(images):
+        futures = [executor.submit(backend.predict, image) for image in images]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+    return predict_batch
+
+
+IMAGE_SIGNATURES = (b"\xff\xd8\xff", b"\x89PNG", b"RIFF", b"GIF8", b"BM")
+
+
+class RelayedImage(PreparedImage):
+    """
+    A client's base64 image, relayed upstream as-is. Pixels are only decoded
+    if a local model or the detection cache asks for them, which keeps a
+    pure relay from spending its CPU on JPEG decoding.
+    """
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    @cached_property
+    def image(self):
+        return open_full_resolution(io.BytesIO(base64.b64decode(self.payload)))
+
+
+def decode_body(body):
+    """Wrap a raw or base64-encoded image body, checking only its file signature."""
+    if not body.startswith(IMAGE_SIGNATURES):
+        try:
+            head = base64.b64decode(body[:16], validate=True)
+        except (binascii.Error, ValueError):
+            head = b""
+        if not head.startswith(IMAGE_SIGNATURES):
+            raise ValueError("Body is neither an image nor base64 image data")
+        return RelayedImage(body)
+    return RelayedImage(base64.b64encode(body))
+
+
+class DetectionService:
+    """Owns the batchers, backends and thread pools behind the HTTP routes."""
+
+    def __init__(self, api_key=None, api_url=ROBOFLOW_API_URL, onnx_path=None, cache=None,
+                 max_batch_size=DEFAULT_MAX_BATCH, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 max_queue=DEFAULT_MAX_QUEUE, concurrency=DEFAULT_CONCURRENCY, pool_size=32,
+                 models=(VICTIM_MODEL_ID, WATER_LEVEL_MODEL_ID), max_batchers=DEFAULT_MAX_BATCHERS):
+        self.api_key = api_key
+        self.models = frozenset(models)
+        self.max_batchers = max_batchers
+        self.api_url = api_url
+        self.session = PooledSession(pool_size=pool_size)
+        self.cache = cache
+        self.local = OnnxBackend(onnx_path) if onnx_path else None
+        self.batch_options = dict(max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+                                  max_queue=max_queue, concurrency=concurrency)
+        self.calls = ThreadPoolExecutor(max_workers=pool_size)
+        self.batchers = OrderedDict()
+        self.started = time.time()
+
+    def batcher(self, model_id, api_key):
+        """
+        One batcher per model and key, so every batch goes out under a single
+        key. Only the configured models are served, and at most
+        ``max_batchers`` batchers are kept: the least recently used idle ones
+        are stopped to make room, and if none is idle the request is refused.
+        """
+        if model_id not in self.models:
+            raise LookupError(f"Model {model_id} is not served here")
+        local = self.local is not None and model_id == VICTIM_MODEL_ID
+        key = (model_id, None if local else api_key or self.api_key)
+        if key in self.batchers:
+            self.batchers.move_to_end(key)
+        else:
+            if key[1] is None and not local:
+                raise PermissionError("No Roboflow API key given and none configured on the service")
+            self._evict(self.max_batchers - 1)
+            if local:
+                predict_batch = self.local.predict_batch
+            else:
+                client = InferenceClient(key[1], self.api_url, session=self.session)
+                predict_batch = fan_out(RemoteBackend(client, model_id, self.cache), self.calls)
+            self.batchers[key] = MicroBatcher(predict_batch, name=f"service.{model_id}", **self.batch_options)
+        return self.batchers[key]
+
+    def _evict(self, keep):
+        """Stop least recently used idle batchers until at most ``keep`` remain."""
+        for key in [key for key, batcher in self.batchers.items() if batcher.idle()]:
+            if len(self.batchers) <= keep:
+                return
+            asyncio.ensure_future(self.batchers.pop(key).stop())
+        if len(self.batchers) > keep:
+            # Every batcher is busy; a new key would only add more load
+            raise asyncio.QueueFull()
+
+    async def infer(self, model_id, image, api_key=None):
+        return await self.batcher(model_id, api_key).submit(image)
+
+    async def detect(self, image, api_key=None):
+        victims, levels = await asyncio.gather(
+            self.infer(VICTIM_MODEL_ID, image, api_key),
+            self.infer(WATER_LEVEL_MODEL_ID, image, api_key),
+        )
+        return {"victims": victims, "water_level": levels, **summarize(victims, levels)}
+
+    def health(self):
+        return {
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "models": {f"{model_id}{'' if key else ' (local)'}": batcher.stats()
+                       for (model_id, key), batcher in self.batchers.items()},
+        }
+
+    async def close(self):
+        for batcher in self.batchers.values():
+            await batcher.stop()
+        self.calls.shutdown(wait=False)
+        self.session.close()
+
+
+def create_app(service):
+    """Build the aiohttp application serving ``service``."""
+    try:
+        from aiohttp import web
+    except ImportError as e:
+        raise ImportError("The detection service needs aiohttp: pip install aiohttp") from e
+
+    def api_key(request):
+        return request.query.get("api_key") or request.headers.get("X-Api-Key")
+
+    async def run(request, call):
+        try:
+            image = decode_body(await request.read())
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        try:
+            return web.json_response(await call(image))
+        except asyncio.QueueFull:
+            return web.json_response({"error": "Detection queue is full, retry shortly"}, status=429,
+                                     headers={"Retry-After": "1"})
+        except PermissionError as e:
+            return web.json_response({"error": str(e)}, status=401)
+        except LookupError as e:
+            return web.json_response({"error": str(e)}, status=404)
+        except Exception as e:
+            # Upstream error text carries the request URL and the server's API key
+            status = upstream_status(e)
+            return web.json_response({"error": "Detection failed upstream", "upstream_status": status}, status=502)
+
+    async def infer(request):
+        model_id = f"{request.match_info['project']}/{request.match_info['version']}"
+        key = api_key(request)
+
+        async def call(image):
+            return {"predictions": await service.infer(model_id, image, key)}
+        return await run(request, call)
+
+    async def detect(request):
+        key = api_key(request)
+        return await run(request, lambda image: service.detect(image, key))
+
+    async def health(request):
+        return web.json_response(service.health())
+
+    async def metrics_text(request):
+        return web.Response(text=metrics.prometheus_text(), content_type="text/plain")
+
+    async def on_cleanup(app):
+        await service.close()
+
+    app = web.Application(client_max_size=32 * 1024 * 1024)
+    app.add_routes([
+        web.get("/health", health),
+        web.get("/metrics", metrics_text),
+        web.post("/detect", detect),
+        web.post("/{project}/{version}", infer),
+    ])
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless victim / water-level detection API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--api-key", default=os.environ.get("ROBOFLOW_API_KEY"),
+                        help="Roboflow key used when a request carries none")
+    parser.add_argument("--api-url", default=ROBOFLOW_API_URL, help="Upstream inference server")
+    parser.add_argument("--onnx", help="Serve the victim model locally from this ONNX file")
+    parser.add_argument("--cache", help="SQLite detection cache path (off by default)")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Batches in flight per model")
+    parser.add_argument("--max-batchers", type=int, default=DEFAULT_MAX_BATCHERS,
+                        help="Distinct model / API key batchers kept alive")
+    parser.add_argument("--no-metrics", action="store_true", help="Do not record stage latencies")
+    args = parser.parse_args(argv)
+    metrics.enable(not args.no_metrics)
+
+    from aiohttp import web
+
+    service = DetectionService(
+        api_key=args.api_key, api_url=args.api_url, onnx_path=args.onnx,
+        cache=DetectionCache(args.cache) if args.cache else None,
+        max_batch_size=args.max_batch, max_wait_ms=args.max_wait_ms,
+        max_queue=args.max_queue, concurrency=args.concurrency, max_batchers=args.max_batchers,
+    )
+    web.run_app(create_app(service), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""
+Sections of ``.streamlit/secrets.toml``.
+
+Each module reads its own table (``[cache]``, ``[http]``, ``[routing]`` ...).
+A missing file -- as when running outside ``streamlit run`` -- or a missing
+section comes back as an empty dict, so callers only ever deal with defaults.
+"""
+import streamlit as st
+
+
+def secrets_section(name):
+    """Return the ``[name]`` section of the Streamlit secrets as a dict, or an empty dict."""
+    try:
+        return dict(st.secrets.get(name, {}))
+    except Exception:
+        # No secrets.toml at all, e.g. when running outside `streamlit run`
+        return {}
@@ -0,0 +1,120 @@
+"""
+Sliced inference for large aerial and satellite images.
+
+Squashing a 6000 px drone photo into 640x640 shrinks people to a few pixels.
+Instead the full-resolution image is cut into overlapping model-sized tiles,
+tiles are pushed through the backend in parallel batches, boxes are shifted
+back into global coordinates and duplicates from the overlaps are merged with
+the vectorized NMS in utils.backends. Tiles that are visibly featureless
+(open water, sky) can be skipped by a cheap histogram test to save calls.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils.backends import batched_nms
+from utils.preprocess import as_pil
+
+DEFAULT_TILE_SIZE = 640
+DEFAULT_OVERLAP = 0.2
+
+
+def tile_origins(length, tile_size, overlap):
+    """Start offsets covering ``length`` with the last tile flush against the end."""
+    if length <= tile_size:
+        return [0]
+    step = max(1, int(tile_size * (1 - overlap)))
+    origins = list(range(0, length - tile_size, step))
+    origins.append(length - tile_size)
+    return origins
+
+
+def tile_windows(width, height, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_OVERLAP):
+    """Return ``(x0, y0, x1, y1)`` windows tiling a ``width`` x ``height`` image."""
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in tile_origins(height, tile_size, overlap)
+        for x in tile_origins(width, tile_size, overlap)
+    ]
+
+
+def is_empty_tile(tile, std_threshold=6.0, dominant_fraction=0.97):
+    """
+    Cheap test for featureless tiles: on a 64 px thumbnail, either the
+    luminance barely varies or nearly all pixels fall in one histogram bin.
+    """
+    thumb = tile.convert("L")
+    thumb.thumbnail((64, 64))
+    pixels = np.asarray(thumb, dtype=np.float32)
+    if pixels.std() < std_threshold:
+        return True
+    histogram = np.bincount((pixels // 16).astype(np.int64).ravel(), minlength=16)
+    return histogram.max() >= dominant_fraction * pixels.size
+
+
+def _predict_tiles(backend, image, windows):
+    tiles = [image.crop(window) for window in windows]
+    return windows, backend.predict_batch(tiles)
+
+
+def sliced_predict(image, backend, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_OVERLAP, workers=4,
+                   batch_size=4, skip_empty=True, iou_threshold=0.5):
+    """
+    Run ``backend`` over overlapping tiles of a full-resolution PIL ``image``.
+
+    Returns ``(predictions, stats)`` where predictions use the Roboflow schema in
+    full-image pixels and stats counts total, skipped and inferred tiles.
+    """
+    windows = tile_windows(image.width, image.height, tile_size, overlap)
+    if skip_empty:
+        kept = [w for w in windows if not is_empty_tile(image.crop(w))]
+    else:
+        kept = windows
+    stats = {"tiles": len(windows), "skipped": len(windows) - len(kept), "inferred": len(kept)}
+
+    boxes, scores, names = [], [], []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [
+            pool.submit(_predict_tiles, backend, image, kept[i:i + batch_size])
+            for i in range(0, len(kept), batch_size)
+        ]
+        for future in futures:
+            for (x0, y0, _, _), predictions in zip(*future.result()):
+                for p in predictions:
+                    boxes.append([p["x"] - p["width"] / 2 + x0, p["y"] - p["height"] / 2 + y0,
+                                  p["x"] + p["width"] / 2 + x0, p["y"] + p["height"] / 2 + y0])
+                    scores.append(p.get("confidence", 1.0))
+                    names.append(p["class"])
+
+    if not boxes:
+        return [], stats
+    boxes = np.asarray(boxes, dtype=np.float32)
+    scores = np.asarray(scores, dtype=np.float32)
+    labels, class_ids = np.unique(np.asarray(names), return_inverse=True)
+    keep = batched_nms(boxes, scores, class_ids, iou_threshold, metric="ios")
+
+    merged = []
+    for (x1, y1, x2, y2), score, class_id in zip(boxes[keep].tolist(), scores[keep].tolist(),
+                                                 class_ids[keep].tolist()):
+        merged.append({
+            "x": (x1 + x2) / 2, "y": (y1 + y2) / 2, "width": x2 - x1, "height": y2 - y1,
+            "confidence": score, "class": str(labels[class_id]),
+        })
+    stats["detections"] = len(merged)
+    return merged, stats
+
+
+class SlicedBackend:
+    """Backend adapter that runs an inner backend tile by tile over full-resolution images."""
+
+    def __init__(self, backend, **options):
+        self.backend = backend
+        self.options = options
+        self.last_stats = None
+
+    def predict(self, image):
+        predictions, self.last_stats = sliced_predict(as_pil(image), self.backend, **self.options)
+        return predictions
+
+    def predict_batch(self, images):
+        return [self.predict(image) for image in images]
@@ -0,0 +1,139 @@
+"""
+Shared weather cache with single-flight coalescing and stale-while-revalidate.
+
+Readings are cached per normalized city for ``ttl`` seconds (30 minutes by
+default, matching the refresh interval promised on the page). When dozens of
+operators ask for the same city at once only one OpenWeatherMap call is made.
+After the TTL, a reading is still served for up to ``stale_ttl`` while a
+background refresh fetches a new one, so nobody waits on the upstream for a
+city that was recently looked up. If the upstream fails outright, the last
+reading is served whatever its age.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from utils.clients import OPENWEATHER_API_URL, get_session
+from utils.geocode import normalize
+from utils.resilience import RETRYABLE_STATUS, get_policy
+from utils.singleflight import SingleFlight
+
+DEFAULT_TTL = 30 * 60
+DEFAULT_MAX_ENTRIES = 1024
+
+
+def fetch_weather(city_name, api_key, api_url=OPENWEATHER_API_URL, policy=None):
+    """Fetch current weather for a city from OpenWeatherMap, or None if unknown."""
+    session = get_session(api_url)
+    policy = policy if policy is not None else get_policy("openweather")
+    params = {"q": city_name, "appid": api_key, "units": "metric"}
+
+    def get():
+        response = session.get(f"{api_url}/data/2.5/weather", params=params, timeout=policy.timeout)
+        if response.status_code in RETRYABLE_STATUS:
+            response.raise_for_status()
+        return response
+
+    response = policy.call(get)
+    if response.status_code != 200:
+        return None
+    data = response.json()
+    try:
+        # The fields the page shows; a body without them must not be cached as a reading
+        data["main"]["temp"], data["main"]["humidity"], data["weather"][0]["description"]
+    except (KeyError, IndexError, TypeError):
+        raise ValueError("OpenWeatherMap response lacks temperature, humidity or conditions") from None
+    return data
+
+
+class WeatherCache:
+    """TTL cache in front of a ``fetch(city)`` callable, shared by every session."""
+
+    def __init__(self, fetch, ttl=DEFAULT_TTL, stale_ttl=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl if stale_ttl is not None else 3 * ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="weather-refresh")
+        self._refreshing = set()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "upstream": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _load(self, key):
+        self._count("upstream")
+        data = self.fetch(key)
+        # Unknown cities are not cached so a typo can be corrected straight away
+        if data is not None:
+            with self._lock:
+                self._entries[key] = (time.time(), data)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return data
+
+    def _refresh(self, key):
+        try:
+            self._flight.do(key, lambda: self._load(key))
+        except Exception:
+            # Keep serving the stale reading; the next request will retry
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, city_name):
+        """Return the weather for ``city_name``, from cache whenever possible."""
+        key = normalize(city_name)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            age = time.time() - entry[0]
+            if age < self.ttl:
+                self._count("hits")
+                return entry[1]
+            if age < self.stale_ttl:
+                self._count("stale_hits")
+                with self._lock:
+                    start = key not in self._refreshing
+                    self._refreshing.add(key)
+                if start:
+                    self._refresher.submit(self._refresh, key)
+                return entry[1]
+        self._count("misses")
+        try:
+            return self._flight.do(key, lambda: self._load(key))
+        except Exception:
+            if entry is None:
+                raise
+            # The upstream is down: an old reading beats none at all
+            self._count("stale_hits")
+            return entry[1]
+
+    def age(self, city_name):
+        """Seconds since the cached reading for ``city_name`` was fetched, or None."""
+        with self._lock:
+            entry = self._entries.get(normalize(city_name))
+        return None if entry is None else time.time() - entry[0]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        served = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["stale_hits"]) / served if served else 0.0
+        return stats
+
+
+@st.cache_resource(show_spinner=False)
+def get_weather_cache(api_key, ttl=DEFAULT_TTL):
+    """Return the process-wide weather cache for an OpenWeatherMap API key."""
+    return WeatherCache(lambda city: fetch_weather(city, api_key), ttl=ttl)
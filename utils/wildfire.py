@@ -0,0 +1,240 @@
+"""
+Batch wildfire scoring of satellite tiles with the ResNet101 classifier.
+
+The notebook in ``detectWildFire/`` scores one tile per cell. Here the model is
+loaded once per process, tiles are decoded on a thread pool and scored in
+batches. Two interchangeable scorers exist: the FP32 Keras model and a
+dynamic-range quantized TFLite copy (int8 weights, float activations) that is
+several times smaller and faster on CPU. ``load_scorer`` prefers the
+quantized copy and falls back to FP32 when it is missing or fails to load.
+
+Create the quantized copy once with::
+
+    python -m utils.wildfire quantize detectWildFire/imported_model.keras detectWildFire/wildfire_dynamic.tflite
+"""
+import io
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from utils.pipeline import iter_images
+
+DEFAULT_KERAS_PATH = "detectWildFire/imported_model.keras"
+DEFAULT_TFLITE_PATH = "detectWildFire/wildfire_dynamic.tflite"
+# flow_from_directory orders classes alphabetically
+CLASS_NAMES = ["nowildfire", "wildfire"]
+INPUT_SIZE = 224
+_COORDINATES = re.compile(r"^(-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?)\.")
+
+
+def tile_coordinates(name):
+    """Return ``(lon, lat)`` from a dataset file name such as ``-73.61,45.58.jpg``, or None."""
+    match = _COORDINATES.match(os.path.basename(name))
+    return (float(match.group(1)), float(match.group(2))) if match else None
+
+
+def tile_label(name):
+    """Class index taken from a ``wildfire/`` or ``nowildfire/`` parent folder, or None."""
+    parts = re.split(r"[\\/]", name)[:-1]
+    for part in reversed(parts):
+        if part in CLASS_NAMES:
+            return CLASS_NAMES.index(part)
+    return None
+
+
+def labelled_tiles(root):
+    """Paths of every tile under ``root/<class name>/`` for held-out evaluation."""
+    return [
+        os.path.join(root, label, name)
+        for label in CLASS_NAMES if os.path.isdir(os.path.join(root, label))
+        for name in sorted(os.listdir(os.path.join(root, label)))
+    ]
+
+
+def _iter_tiles(items):
+    """Like iter_images, but paths keep their folders so labels can be read from them."""
+    for item in items:
+        if isinstance(item, (str, os.PathLike)) and not os.fspath(item).lower().endswith(".zip"):
+            for _, data in iter_images([item]):
+                yield os.fspath(item), data
+        else:
+            yield from iter_images([item])
+
+
+def decode_tile(data):
+    """Decode raw bytes to the model's uint8 input, resized as Keras' load_img does (nearest)."""
+    image = Image.open(io.BytesIO(data))
+    image.draft("RGB", (INPUT_SIZE, INPUT_SIZE))
+    return np.asarray(image.convert("RGB").resize((INPUT_SIZE, INPUT_SIZE), Image.NEAREST))
+
+
+class KerasScorer:
+    """The FP32 Keras model exactly as trained."""
+
+    name = "FP32 (Keras)"
+
+    def __init__(self, model_path=DEFAULT_KERAS_PATH):
+        try:
+            from tensorflow import keras
+        except ImportError as e:
+            raise ImportError("Wildfire scoring needs TensorFlow: pip install tensorflow-cpu") from e
+        self.model = keras.models.load_model(model_path, compile=False)
+
+    def predict_batch(self, tiles):
+        """Class probabilities (N, 2) for a uint8 batch (N, 224, 224, 3)."""
+        return np.asarray(self.model(tiles.astype(np.float32) / 255.0, training=False))
+
+
+class TFLiteScorer:
+    """A converted TFLite model, resized on the fly to each batch."""
+
+    name = "Dynamic int8 (TFLite)"
+
+    def __init__(self, model_path=DEFAULT_TFLITE_PATH, num_threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tensorflow.lite import Interpreter
+            except ImportError as e:
+                raise ImportError("The quantized model needs tflite-runtime or TensorFlow") from e
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads or os.cpu_count())
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch = None
+        # One scorer serves every session, and TFLite interpreters are not thread-safe
+        self._lock = threading.Lock()
+
+    def predict_batch(self, tiles):
+        batch = tiles.astype(np.float32) / 255.0
+        scale, zero_point = self.input["quantization"]
+        if self.input["dtype"] != np.float32:
+            # Fully integer models take quantized input as well
+            batch = np.round(batch / scale + zero_point).astype(self.input["dtype"])
+        with self._lock:
+            if self.batch != len(tiles):
+                self.interpreter.resize_tensor_input(self.input["index"], [len(tiles), INPUT_SIZE, INPUT_SIZE, 3])
+                self.interpreter.allocate_tensors()
+                self.batch = len(tiles)
+            self.interpreter.set_tensor(self.input["index"], batch)
+            self.interpreter.invoke()
+            # get_tensor copies, so the result survives the next caller's invoke
+            output = self.interpreter.get_tensor(self.output["index"])
+        scale, zero_point = self.output["quantization"]
+        if self.output["dtype"] != np.float32:
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+def load_scorer(keras_path=DEFAULT_KERAS_PATH, tflite_path=DEFAULT_TFLITE_PATH, quantized=True):
+    """
+    Return a warmed-up scorer, preferring the quantized model when asked and
+    falling back to FP32 if it cannot be loaded.
+    """
+    scorer = None
+    if quantized and os.path.exists(tflite_path):
+        try:
+            scorer = TFLiteScorer(tflite_path)
+        except (ImportError, ValueError, RuntimeError):
+            scorer = None
+    if scorer is None:
+        scorer = KerasScorer(keras_path)
+    # One dummy batch so the first real request does not pay graph building
+    scorer.predict_batch(np.zeros((1, INPUT_SIZE, INPUT_SIZE, 3), dtype=np.uint8))
+    return scorer
+
+
+def score_tiles(items, scorer, batch_size=32, workers=4, progress=None):
+    """
+    Score every tile in uploads, paths and zip archives.
+
+    Returns ``(rows, stats)``: one row per tile with its wildfire probability,
+    predicted class, coordinates parsed from the file name and the true class
+    when a parent folder names it; ``stats`` holds the throughput and the
+    accuracy over labelled tiles.
+    """
+    started = time.perf_counter()
+    rows = []
+    correct = labelled = 0
+
+    def flush(names, futures):
+        nonlocal correct, labelled
+        probabilities = scorer.predict_batch(np.stack([f.result() for f in futures]))
+        for name, probs in zip(names, probabilities):
+            predicted = int(np.argmax(probs))
+            truth = tile_label(name)
+            coords = tile_coordinates(name)
+            if truth is not None:
+                labelled += 1
+                correct += predicted == truth
+            rows.append({
+                "tile": name,
+                "wildfire_probability": round(float(probs[1]), 4),
+                "prediction": CLASS_NAMES[predicted],
+                "label": CLASS_NAMES[truth] if truth is not None else "",
+                "lon": coords[0] if coords else None,
+                "lat": coords[1] if coords else None,
+            })
+        if progress is not None:
+            progress(len(rows))
+
+    # One batch is scored while the pool decodes the next
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        names, futures, pending = [], [], None
+        for name, data in _iter_tiles(items):
+            names.append(name)
+            futures.append(pool.submit(decode_tile, data))
+            if len(futures) == batch_size:
+                if pending:
+                    flush(*pending)
+                pending, names, futures = (names, futures), [], []
+        if pending:
+            flush(*pending)
+        if futures:
+            flush(names, futures)
+
+    seconds = time.perf_counter() - started
+    stats = {
+        "tiles": len(rows),
+        "seconds": seconds,
+        "tiles_per_second": len(rows) / seconds if seconds else 0.0,
+        "accuracy": correct / labelled if labelled else None,
+        "labelled": labelled,
+    }
+    return rows, stats
+
+
+def compare_scorers(items, baseline, candidate, batch_size=32):
+    """Accuracy, agreement and throughput of ``candidate`` against ``baseline`` on labelled tiles."""
+    base_rows, base_stats = score_tiles(items, baseline, batch_size)
+    cand_rows, cand_stats = score_tiles(items, candidate, batch_size)
+    agreement = np.mean([a["prediction"] == b["prediction"] for a, b in zip(base_rows, cand_rows)])
+    delta = None
+    if base_stats["accuracy"] is not None:
+        delta = cand_stats["accuracy"] - base_stats["accuracy"]
+    return {"baseline": base_stats, "candidate": cand_stats, "accuracy_delta": delta,
+            "agreement": float(agreement) if base_rows else None}
+
+
+def quantize(keras_path=DEFAULT_KERAS_PATH, tflite_path=DEFAULT_TFLITE_PATH):
+    """Write a dynamic-range quantized TFLite copy of the Keras model."""
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(keras_path, compile=False)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    with open(tflite_path, "wb") as f:
+        f.write(converter.convert())
+    return tflite_path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "quantize":
+        sys.exit("usage: python -m utils.wildfire quantize [keras_path] [tflite_path]")
+    print(quantize(*sys.argv[2:4]))